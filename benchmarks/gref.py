@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Compares pykfs.search with the 'grep -n -H -r' pipeline gref used to run, on a generated tree
+of text files with a few binary files mixed in.  The tree defaults to 1 GB.
+"""
+
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+from pykfs import search
+
+
+WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india"]
+PATTERN = "frobnicate_[0-9]+"
+
+
+def make_tree(root, size, file_size, seed=0):
+    rand = random.Random(seed)
+    total = 0
+    index = 0
+    while total < size:
+        directory = os.path.join(root, "dir{0:03d}".format(index // 100))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        lines = []
+        length = 0
+        while length < file_size:
+            line = " ".join(rand.choice(WORDS) for _ in range(10))
+            if rand.random() < 0.001:
+                line += " frobnicate_{0}".format(index)
+            lines.append(line)
+            length += len(line) + 1
+        content = ("\n".join(lines) + "\n").encode("ascii")
+        if index % 50 == 0:
+            content = b"\0" + content
+        with open(os.path.join(directory, "file{0:05d}.txt".format(index)), "wb") as f:
+            f.write(content)
+        total += len(content)
+        index += 1
+    return index
+
+
+def time_grep(root):
+    start = time.time()
+    with open(os.devnull, "wb") as devnull:
+        subprocess.call("grep -n -H -r -E '{0}' *".format(PATTERN), shell=True, cwd=root,
+                        stdout=devnull)
+    return time.time() - start
+
+
+def time_search(root, processes):
+    start = time.time()
+    count = 0
+    with open(os.devnull, "wb") as devnull:
+        for match in search.search(PATTERN, root=root, processes=processes):
+            devnull.write(search.format_match(*match))
+            count += 1
+    return time.time() - start, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--file-kb", type=int, default=256)
+    parser.add_argument("--processes", type=int, nargs="*", default=[1, None])
+    options = parser.parse_args()
+    root = tempfile.mkdtemp(prefix="gref-benchmark-")
+    try:
+        files = make_tree(root, options.size_mb << 20, options.file_kb << 10)
+        print("{0} files, {1} MB".format(files, options.size_mb))
+        print("{0:>24} {1:>10} {2:>8}".format("engine", "time (s)", "matches"))
+        print("{0:>24} {1:>10.3f} {2:>8}".format("grep -r", time_grep(root), "-"))
+        for processes in options.processes:
+            elapsed, count = time_search(root, processes)
+            name = "pykfs.search -j {0}".format(processes or "cpus")
+            print("{0:>24} {1:>10.3f} {2:>8}".format(name, elapsed, count))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+Compares the records per second of JSONFormatter and the KFS formatters.
+"""
+
+
+import sys
+import time
+import timeit
+import logging
+import argparse
+from pykfs.kfslog import KFSFormatter, CachingKFSFormatter, JSONFormatter, FILE_FORMATTER
+
+
+NAMES = ["pykfs.git.lib", "pykfs.git.note", "newpydist"]
+
+
+def make_records(count):
+    start = time.time()
+    records = []
+    for i in range(count):
+        record = logging.LogRecord(
+            NAMES[i % len(NAMES)], logging.INFO, __file__, i, ">>> output line %d", (i,), None,
+        )
+        record.created = start + i * 0.00001
+        record.repo = "pykfs"
+        records.append(record)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    options = parser.parse_args()
+    records = make_records(options.records)
+    fmt = "> {timeplus} > {nameplus} > {levelplus} {message}"
+    formatters = [
+        KFSFormatter(fmt, color=FILE_FORMATTER["color"]),
+        CachingKFSFormatter(fmt, color=FILE_FORMATTER["color"]),
+        JSONFormatter(),
+    ]
+    print("{0:>22} {1:>16}".format("formatter", "records/s"))
+    for formatter in formatters:
+        elapsed = min(timeit.repeat(
+            lambda: [formatter.format(record) for record in records],
+            number=1, repeat=options.repeat,
+        ))
+        print("{0:>22} {1:>16.0f}".format(type(formatter).__name__, len(records) / elapsed))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
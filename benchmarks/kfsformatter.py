@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""
+Compares the throughput of KFSFormatter and CachingKFSFormatter on a burst of records, and
+checks that both produce identical output.
+"""
+
+
+import sys
+import time
+import timeit
+import logging
+import argparse
+from pykfs.kfslog import KFSFormatter, CachingKFSFormatter, CONSOLE_FORMATTER
+
+
+LEVELS = [logging.DEBUG, logging.INFO, logging.INFO, logging.WARNING]
+NAMES = ["pykfs.git.lib", "pykfs.git.note", "newpydist"]
+
+
+def make_records(count):
+    start = time.time()
+    records = []
+    for i in range(count):
+        record = logging.LogRecord(
+            NAMES[i % len(NAMES)], LEVELS[i % len(LEVELS)], __file__, i,
+            ">>> output line {0}".format(i), None, None,
+        )
+        record.created = start + i * 0.00001
+        records.append(record)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    options = parser.parse_args()
+    records = make_records(options.records)
+    print("{0:>22} {1:>6} {2:>16}".format("formatter", "color", "records/s"))
+    for color in False, True:
+        plain = KFSFormatter(CONSOLE_FORMATTER["fmt"], color=color)
+        caching = CachingKFSFormatter(CONSOLE_FORMATTER["fmt"], color=color)
+        for record in records:
+            assert plain.format(record) == caching.format(record)
+        for formatter in plain, caching:
+            elapsed = min(timeit.repeat(
+                lambda: [formatter.format(record) for record in records],
+                number=1, repeat=options.repeat,
+            ))
+            print("{0:>22} {1:>6} {2:>16.0f}".format(
+                type(formatter).__name__, str(color), len(records) / elapsed))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
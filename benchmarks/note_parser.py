@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Compares pykfs.git.note.get_notes_from_message with the previous regex slicing parser on
+generated commit messages from 1 KB up to 10 MB.
+"""
+
+
+import re
+import sys
+import timeit
+import argparse
+import pykfs.git.note as gitnote
+
+
+SIZES = [1 << 10, 10 << 10, 100 << 10, 1 << 20, 10 << 20]
+LINE = "Fixed the frobnicator for the next release <ticket>PYKFS-{0}</ticket>\n"
+
+
+def legacy_get_notes_from_message(message):
+    match = re.match(gitnote.START_NOTE_RE, message)
+    notes = {}
+    while match:
+        label = match.group('label')
+        rest = match.group('rest')
+        endmatch = re.match(gitnote.END_NOTE_RE, rest)
+        if not endmatch:
+            raise gitnote.GitNoteException("Note with label '{0}' unclosed".format(label))
+        note = " ".join(endmatch.group('note').split())
+        rest = endmatch.group('rest')
+        gitnote._addnote(notes, label, note)
+        match = re.match(gitnote.START_NOTE_RE, rest)
+    return notes
+
+
+def make_message(size):
+    lines = []
+    total = 0
+    while total < size:
+        line = LINE.format(len(lines))
+        lines.append(line)
+        total += len(line)
+    return "".join(lines)[:size].rsplit("\n", 1)[0]
+
+
+def best_of(func, message, repeat):
+    return min(timeit.repeat(lambda: func(message), number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--legacy-max", type=int, default=1 << 20,
+                        help="Largest message size to run the legacy parser on")
+    options = parser.parse_args()
+    print("{0:>10} {1:>8} {2:>12} {3:>12} {4:>8}".format(
+        "size", "notes", "legacy (s)", "stream (s)", "speedup"))
+    for size in SIZES:
+        message = make_message(size)
+        notes = gitnote.get_notes_from_message(message)
+        stream = best_of(gitnote.get_notes_from_message, message, options.repeat)
+        if size <= options.legacy_max:
+            assert legacy_get_notes_from_message(message) == notes
+            legacy = best_of(legacy_get_notes_from_message, message, options.repeat)
+            speedup = "{0:.1f}x".format(legacy / stream)
+            legacy = "{0:.4f}".format(legacy)
+        else:
+            legacy, speedup = "skipped", "-"
+        print("{0:>10} {1:>8} {2:>12} {3:>12.4f} {4:>8}".format(
+            size, len(notes["ticket"]), legacy, stream, speedup))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
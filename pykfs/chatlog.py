@@ -0,0 +1,91 @@
+import os
+import time
+import logging
+import datetime as dt
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+
+class ChatLogWriter(object):
+    """
+    Appends chat lines to one log file per day, keeping the current file open.  Lines are
+    buffered and written out once flush_bytes have built up or flush_interval seconds have
+    passed, and the file is optionally fsynced every fsync_interval seconds.  A day starts at
+    midnight plus day_change_offset, and the file is switched exactly at that boundary.
+
+    The filename is formatted with the logical date of the day, eg. 'chat-{date}.log'.
+    Call tick regularly so that quiet channels are still flushed within the flush window.
+    """
+
+    def __init__(self, logdir, filename, date_format="%Y-%m-%d",
+                 day_change_offset=dt.timedelta(0), flush_bytes=4096, flush_interval=1.0,
+                 fsync_interval=None, now=dt.datetime.now):
+        self.logdir = logdir
+        self.filename = filename
+        self.date_format = date_format
+        self.day_change_offset = day_change_offset
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.now = now
+        self.path = None
+        self.file = None
+        self.rollover = None
+        self.buffer = []
+        self.buffered = 0
+        self.last_flush = time.time()
+        self.last_fsync = self.last_flush
+
+    def write(self, line):
+        now = self.now()
+        if self.rollover is None or now >= self.rollover:
+            self._rotate(now)
+        self.buffer.append(line)
+        self.buffered += len(line)
+        if self.buffered >= self.flush_bytes:
+            self.flush()
+        else:
+            self.tick()
+
+    def tick(self):
+        current = time.time()
+        if self.buffer and current - self.last_flush >= self.flush_interval:
+            self.flush()
+        if (self.fsync_interval is not None and self.file and
+                current - self.last_fsync >= self.fsync_interval):
+            self.fsync()
+
+    def flush(self):
+        if self.buffer and self.file:
+            self.file.write("".join(self.buffer))
+            self.file.flush()
+        self.buffer = []
+        self.buffered = 0
+        self.last_flush = time.time()
+
+    def fsync(self):
+        self.flush()
+        if self.file:
+            os.fsync(self.file.fileno())
+        self.last_fsync = time.time()
+
+    def close(self):
+        if self.file:
+            if self.fsync_interval is not None:
+                self.fsync()
+            else:
+                self.flush()
+            self.file.close()
+            self.file = None
+
+    def _rotate(self, now):
+        self.close()
+        logical = now - self.day_change_offset
+        day = dt.datetime(logical.year, logical.month, logical.day)
+        self.rollover = day + dt.timedelta(days=1) + self.day_change_offset
+        datestr = logical.strftime(self.date_format)
+        self.path = os.path.join(self.logdir, self.filename.format(date=datestr))
+        LOG.debug("Logging chat to '{0}' until {1}".format(self.path, self.rollover))
+        self.file = open(self.path, 'a')
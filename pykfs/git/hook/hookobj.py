@@ -1,10 +1,13 @@
 import logging
 import os
 import sys
+import time
 import getpass
-import irc.client
+import socket
+import threading
 import pykfs.git.lib as gitlib
 import pykfs.git.note as gitnote
+import pykfs.ircrelay as ircrelay
 
 
 _LOGGING_DEFAULT = {
@@ -13,6 +16,38 @@ _LOGGING_DEFAULT = {
     "datefmt": '%Y-%m-%d %H:%M:%S',
     "filemode": 'w'
 }
+NULL_SHA = "0" * 40
+NOTE_POOL_THRESHOLD = 64
+ACTION_CONTROL_DEFAULTS = {
+    "independent": False,
+    "timeout": None,
+    "fatal": True,
+}
+
+
+class GitHookActionError(Exception):
+    pass
+
+
+class ActionRunner(threading.Thread):
+
+    def __init__(self, name, func, options, control):
+        super(ActionRunner, self).__init__(name="action-{0}".format(name))
+        self.daemon = True
+        self.action = name
+        self.func = func
+        self.options = options
+        self.control = control
+        self.status = "running"
+        self.error = None
+
+    def run(self):
+        try:
+            self.func(**self.options)
+            self.status = "ok"
+        except Exception as e:
+            self.error = e
+            self.status = "failed"
 
 
 class GitHook(object):
@@ -58,6 +93,7 @@ class GitHook(object):
         self.actions = {}
         self.stdin = self._unread_settings.pop('stdin', None)
         self.print_stderr = self._unread_settings.pop('print_stderr', True)
+        self.deadline = self._unread_settings.pop('deadline', None)
         if self.stdin is None:
             self.stdin = sys.stdin.read()
         for action in self.actions_available:
@@ -68,7 +104,8 @@ class GitHook(object):
                             invalid=invalid))
 
     def _get_repo_info(self):
-        self.dotgitdir = os.getcwd()
+        self.repository = gitlib.Repository(os.getcwd())
+        self.dotgitdir = self.repository.gitdir
         self.logger.debug("Dotgitdir: {}".format(self.dotgitdir))
         self.reporoot, dotgit = os.path.split(self.dotgitdir)
         if dotgit != '.git':
@@ -82,28 +119,105 @@ class GitHook(object):
         raise NotImplementedError()
 
     def _do_actions(self):
+        """
+        Runs the configured actions.  Actions with 'independent' set are started together in
+        the background while the rest run one at a time.  Each action may set a 'timeout', the
+        hook may set an overall 'deadline', and an action with 'fatal' unset only warns when it
+        fails instead of failing the hook.
+        """
+        started = time.time()
+        runners = []
         for action, options in self.actions.items():
             if options:
-                self.logger.info("Performing '{}' action ...".format(action))
-                getattr(self, action)(**options)
+                options = dict(options)
+                control = dict((key, options.pop(key, default))
+                               for key, default in ACTION_CONTROL_DEFAULTS.items())
+                runners.append(ActionRunner(action, getattr(self, action), options, control))
+        independent = [runner for runner in runners if runner.control["independent"]]
+        for runner in independent:
+            self.logger.info("Starting '{}' action ...".format(runner.action))
+            runner.start()
+        for runner in runners:
+            if runner not in independent:
+                self.logger.info("Performing '{}' action ...".format(runner.action))
+                if runner.control["timeout"] is None and self.deadline is None:
+                    runner.run()
+                    continue
+                runner.start()
+            self._wait_for_action(runner, started)
+        self.action_results = dict((runner.action, runner) for runner in runners)
+        self._report_actions(runners)
 
+    def _wait_for_action(self, runner, started):
+        timeouts = [t for t in [runner.control["timeout"]] if t is not None]
+        if self.deadline is not None:
+            timeouts.append(max(0, self.deadline - (time.time() - started)))
+        runner.join(min(timeouts) if timeouts else None)
+        if runner.is_alive():
+            runner.status = "timeout"
+            runner.error = GitHookActionError("Action '{0}' timed out".format(runner.action))
 
-class PostReceive(GitHook):
-    logger_name = 'postreceive'
-    hookname = 'post-receive'
-    actions_available = ['irc']
+    def _report_actions(self, runners):
+        fatal = None
+        for runner in runners:
+            if runner.status == "ok":
+                continue
+            message = "Action '{0}' {1}: {2}".format(runner.action, runner.status, runner.error)
+            if runner.control["fatal"]:
+                self.logger.error(message)
+                fatal = fatal or runner.error
+            else:
+                self.logger.warning(message)
+                if self.print_stderr:
+                    sys.stderr.write("WARNING: {0}\n".format(message))
+        if fatal:
+            raise fatal
+
+
+class ReceiveHook(GitHook):
+    """
+    The hooks that read 'old new ref' lines for every pushed ref.  The single ref attributes
+    describe the first update and commit messages are only read when first used.
+    """
 
     def _parse_input(self):
-        self.oldhead, self.newhead, self.ref = self.stdin.split()
+        self.updates = parse_ref_updates(self.stdin)
+        self.oldhead, self.newhead, self.ref = self.updates[0]
         self.branch_changed = self.ref.split('/')[-1]
+        self.newheads = dict((ref, new) for old, new, ref in self.updates if new != NULL_SHA)
+        self._head_messages = None
 
-    def _get_repo_info(self):
-        GitHook._get_repo_info(self)
-        self.commit_message = gitlib.commit_message(self.newhead,
-                                                    gitdir=self.dotgitdir)
-        self.short_commit_message = self.commit_message.split('\n')[0]
+    @property
+    def head_messages(self):
+        """
+        A dict of the commit message of every pushed ref's new sha.
+        """
+        if self._head_messages is None:
+            heads = sorted(set(self.newheads.values()))
+            messages = gitlib.commit_messages(heads, gitdir=self.repository)
+            self._head_messages = dict(zip(heads, messages))
+        return self._head_messages
+
+    @property
+    def commit_message(self):
+        if self.newhead == NULL_SHA:
+            return None
+        return self.head_messages[self.newhead]
+
+    @property
+    def short_commit_message(self):
+        if self.newhead == NULL_SHA:
+            return None
+        return self.commit_message.split('\n')[0]
+
+
+class PostReceive(ReceiveHook):
+    logger_name = 'postreceive'
+    hookname = 'post-receive'
+    actions_available = ['irc', 'irc_relay', 'update_note_index']
 
     def irc(self, **kwargs):
+        import irc.client
         client = irc.client.IRC()
         server = client.server()
         channel = kwargs.pop('channel')
@@ -114,37 +228,93 @@ class PostReceive(GitHook):
         self.logger.debug(kwargs)
         connection = server.connect(**kwargs)
         connection.join(channel)
-        details = {'user': self.user,
-                   'repo': self.reponame,
-                   'sha': self.newhead[:7],
-                   'branch': self.branch_changed,
-                   'message': self.short_commit_message}
-        line1 = ("[{repo}] Push received from '{user}' to branch '{branch}', "
-                 "sha '{sha}'".format(**details))
-        line2 = ("  {message}".format(**details))
-        for line in line1, line2:
-            connection.privmsg(channel, line)
-            self.logger.info('IRC: {}'.format(line))
+        for details in self._push_details():
+            for line in ircrelay.format_push(details):
+                connection.privmsg(channel, line)
+                self.logger.info('IRC: {}'.format(line))
         connection.close()
 
+    def irc_relay(self, channel, socket_path=ircrelay.DEFAULT_SOCKET_PATH):
+        for notification in self._push_details():
+            notification['channel'] = channel
+            try:
+                ircrelay.send_notification(notification, socket_path=socket_path)
+            except (socket.error, OSError) as e:
+                self.logger.warning("Unable to queue IRC notification with relay '{0}': {1}"
+                                    .format(socket_path, e))
+                return
+            self.logger.info("Queued IRC notification for '{0}'".format(channel))
+
+    def _push_details(self):
+        """
+        Returns the notification details of every updated ref, skipping deleted refs.
+        """
+        details = []
+        for old, new, ref in self.updates:
+            if new == NULL_SHA:
+                continue
+            details.append({'user': self.user,
+                            'repo': self.reponame,
+                            'sha': new[:7],
+                            'branch': ref.split('/')[-1],
+                            'message': self.head_messages[new].split('\n')[0]})
+        return details
+
+    def update_note_index(self, path=None):
+        import pykfs.git.noteindex as gitnoteindex
+        index = gitnoteindex.NoteIndex(self.dotgitdir, path=path)
+        try:
+            for old, new, ref in self.updates:
+                if new == NULL_SHA:
+                    continue
+                # The walk stops at the commits the index already holds
+                added = index.update([new])
+                self.logger.info("Indexed notes for {0} commits on '{1}'".format(added, ref))
+        finally:
+            index.close()
 
-class PreReceive(GitHook):
+
+class PreReceive(ReceiveHook):
     logger_name = 'prereceive'
     hookname = 'pre-receive'
     actions_available = ['validate_notes']
 
-    def _parse_input(self):
-        self.oldhead, self.newhead, self.ref = self.stdin.split()
-        self.branch_changed = self.ref.split('/')[-1]
-
     def _get_repo_info(self):
         GitHook._get_repo_info(self)
-        self.commit_message = gitlib.commit_message(self.newhead,
-                                                    gitdir=self.dotgitdir)
-        self.short_commit_message = self.commit_message.split('\n')[0]
+        heads = sorted(set(self.newheads.values()))
+        sources = gitlib.rev_list(*heads, exclude_existing=True, sources=True,
+                                  gitdir=self.repository)
+        # git reports the sha each commit was reached from, which may be the tip of many refs
+        head_refs = {}
+        for ref, new in sorted(self.newheads.items()):
+            head_refs.setdefault(new, []).append(ref)
+        self.new_commits = [sha for sha, source in sources]
+        self.commit_refs = dict((sha, ", ".join(head_refs.get(source, [source])))
+                                for sha, source in sources)
+        self.logger.info("Found {0} new commits across {1} refs"
+                         .format(len(self.new_commits), len(self.updates)))
+        self._commit_messages = None
 
-    def validate_notes(self, valid_labels=None):
-        validate_notes(self.commit_message, valid_labels)
+    @property
+    def commit_messages(self):
+        """
+        The full messages of new_commits, read on first use.
+        """
+        if self._commit_messages is None:
+            self._commit_messages = gitlib.commit_messages(self.new_commits,
+                                                           gitdir=self.repository)
+        return self._commit_messages
+
+    def validate_notes(self, valid_labels=None, processes=None):
+        failures = find_note_failures(zip(self.new_commits, self.commit_messages),
+                                      valid_labels, processes)
+        if failures:
+            lines = ["  {0} ({1}): {2}".format(sha[:7], self.commit_refs[sha], error)
+                     for sha, error in failures]
+            raise gitnote.GitNoteException(
+                "{0} of {1} pushed commits failed note validation:\n{2}"
+                .format(len(failures), len(self.new_commits), "\n".join(lines))
+            )
 
 
 class CommitMsg(GitHook):
@@ -172,3 +342,41 @@ def validate_notes(message, valid_labels=None):
                 raise gitnote.GitNoteException(
                     "Git note label '{0}' not recognized for this repository".format(label)
                 )
+
+
+def parse_ref_updates(stdin):
+    updates = []
+    for line in stdin.splitlines():
+        tokens = line.split()
+        if not tokens:
+            continue
+        if len(tokens) != 3:
+            raise ValueError("Unable to parse ref update '{0}'".format(line))
+        updates.append(tuple(tokens))
+    if not updates:
+        raise ValueError("No ref updates received")
+    return updates
+
+
+def find_note_failures(commits, valid_labels=None, processes=None):
+    tasks = [(sha, message, valid_labels) for sha, message in commits]
+    if processes == 1 or len(tasks) < NOTE_POOL_THRESHOLD:
+        results = [_check_commit_notes(task) for task in tasks]
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_check_commit_notes, tasks, chunksize=NOTE_POOL_THRESHOLD)
+        finally:
+            pool.close()
+            pool.join()
+    return [result for result in results if result]
+
+
+def _check_commit_notes(task):
+    sha, message, valid_labels = task
+    try:
+        validate_notes(message, valid_labels)
+    except gitnote.GitNoteException as e:
+        return sha, str(e)
+    return None
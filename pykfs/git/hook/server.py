@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import socket
+import struct
+import logging
+import tempfile
+import traceback
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+from pykfs.git.hook import pre_receive, post_receive, commit_msg
+from pykfs.git.hookclient import DEFAULT_SOCKET_PATH
+from pykfs.runtime import prepare_socket_path
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+HOOKS = {
+    "pre-receive": pre_receive,
+    "post-receive": post_receive,
+    "commit-msg": commit_msg,
+}
+
+
+class HookRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        request = json.loads(self.rfile.readline().decode("utf-8"))
+        response = run_request(request)
+        self.wfile.write(json.dumps(response).encode("utf-8"))
+
+
+class HookServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """
+    Serves hook requests from pykfs.git.hookclient over a unix socket.  The hooks and their
+    dependencies are imported once when the server starts, and every request is run in a
+    forked child so each hook still gets a fresh process state.
+
+    Requests run with the environment and directory the client sends, so the socket is kept
+    in a private directory and, where the platform reports it, only clients running as one of
+    allowed_uids are served.  allowed_uids defaults to the server's own user.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, socket_mode=0o600, allowed_uids=None):
+        prepare_socket_path(socket_path)
+        socketserver.UnixStreamServer.__init__(self, socket_path, HookRequestHandler)
+        os.chmod(socket_path, socket_mode)
+        self.socket_path = socket_path
+        self.allowed_uids = set(allowed_uids or [os.getuid()])
+
+    def verify_request(self, request, client_address):
+        uid = get_peer_uid(request)
+        if uid is not None and uid not in self.allowed_uids:
+            LOG.warning("Refusing hook request from uid {0}".format(uid))
+            return False
+        return True
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+def get_peer_uid(sock):
+    """
+    Returns the uid of the process connected to the unix socket sock, or None when the
+    platform does not report it.
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    size = struct.calcsize("3i")
+    pid, uid, gid = struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                                        size))
+    return uid
+
+
+def run_request(request):
+    stdout = tempfile.TemporaryFile()
+    stderr = tempfile.TemporaryFile()
+    os.dup2(stdout.fileno(), 1)
+    os.dup2(stderr.fileno(), 2)
+    # Rebinds the python streams too, in case they were not writing to the original fds
+    sys.stdout = os.fdopen(os.dup(1), "w")
+    sys.stderr = os.fdopen(os.dup(2), "w")
+    os.environ.clear()
+    os.environ.update(request["env"])
+    os.chdir(request["cwd"])
+    sys.argv = request["argv"]
+    settings = dict(request.get("settings") or {})
+    settings.setdefault("stdin", request.get("stdin", ""))
+    status = 0
+    try:
+        HOOKS[request["hook"]](settings=settings)
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else int(e.code is not None)
+    except Exception:
+        traceback.print_exc()
+        status = 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    response = {"status": status}
+    for name, f in ("stdout", stdout), ("stderr", stderr):
+        f.seek(0)
+        response[name] = f.read().decode("utf-8", "replace")
+        f.close()
+    return response
+
+
+def serve(socket_path=DEFAULT_SOCKET_PATH):
+    server = HookServer(socket_path)
+    LOG.info("Serving git hooks on '{0}'".format(socket_path))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
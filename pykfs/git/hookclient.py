@@ -0,0 +1,74 @@
+"""
+A small client for the pykfs hook server, meant to be installed as the actual git hook:
+
+    #!/usr/bin/env python
+    from pykfs.git.hookclient import main
+    main("pre-receive", settings={"validate_notes": {"valid_labels": ["ticket"]}})
+
+The hook's stdin, argv, cwd and environment are forwarded to the server and its output and
+exit status are passed back.  When no server is running, or its socket is not in a private
+directory of the current user, the hook is run in this process.
+"""
+
+
+import os
+import sys
+import json
+import socket
+from pykfs.runtime import get_runtime_path, is_private_socket
+
+
+DEFAULT_SOCKET_PATH = get_runtime_path("hooks.sock")
+
+
+def run(hook, settings=None, socket_path=DEFAULT_SOCKET_PATH):
+    stdin = sys.stdin.read()
+    if not is_private_socket(socket_path):
+        return run_in_process(hook, settings, stdin)
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socket_path)
+    except socket.error:
+        return run_in_process(hook, settings, stdin)
+    request = {
+        "hook": hook,
+        "settings": settings,
+        "argv": sys.argv,
+        "cwd": os.getcwd(),
+        "env": dict(os.environ),
+        "stdin": stdin,
+    }
+    chunks = []
+    try:
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    except socket.error:
+        # The server refused or dropped the request
+        chunks = []
+    finally:
+        sock.close()
+    try:
+        response = json.loads(b"".join(chunks).decode("utf-8"))
+    except ValueError:
+        sys.stderr.write("The hook server at '{0}' did not run the '{1}' hook\n".format(
+            socket_path, hook))
+        return 1
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    return response["status"]
+
+
+def run_in_process(hook, settings, stdin):
+    import pykfs.git.hook
+    settings = dict(settings or {})
+    settings.setdefault("stdin", stdin)
+    getattr(pykfs.git.hook, hook.replace("-", "_"))(settings=settings)
+    return 0
+
+
+def main(hook, settings=None, socket_path=DEFAULT_SOCKET_PATH):
+    sys.exit(run(hook, settings=settings, socket_path=socket_path))
@@ -1,34 +1,111 @@
-import sh
 import os
 import re
+import atexit
 import logging
+import tempfile
+import subprocess
+import threading
 
 
 LOG = logging.getLogger(__name__)
 LOG.addHandler(logging.NullHandler())
 
 
+class GitException(Exception):
+    pass
+
+
 def git(*args, **kwargs):
+    return "".join(iter_git(*args, **kwargs))
+
+
+def iter_git(*args, **kwargs):
+    """
+    Runs git through sh and yields its output as it is produced, a line at a time, or in
+    chunks read _chunk_size at a time when that keyword is given.  sh decodes every read, so
+    chunks are text and their sizes are in characters, which may be fewer than the bytes read.
+    With _limit only the first _limit characters of output are yielded, and git is terminated
+    and waited on once it passes them.  Any other keywords are passed to sh.
+    """
+    import sh
+    chunk_size = kwargs.pop('_chunk_size', None)
+    limit = kwargs.pop('_limit', None)
+    if chunk_size:
+        kwargs['_out_bufsize'] = chunk_size
+    if limit is not None:
+        # git is terminated at the limit, which is not an error to report
+        kwargs['_bg_exc'] = False
     command = sh.git.bake(*args, **kwargs)
     LOG.info("Executing '{0}'".format(command))
-    rval = ""
-    for line in command(_iter = True):
-        LOG.info(">>> {0}".format(line[:-1]))
-        rval += line
-    return rval
+    log_output = LOG.isEnabledFor(logging.INFO)
+    running = command(_iter=True)
+    size = 0
+    for chunk in running:
+        if log_output:
+            LOG.info(">>> %s", chunk[:-1] if chunk_size is None else chunk)
+        if limit is not None and size + len(chunk) >= limit:
+            if size < limit:
+                yield chunk[:limit - size]
+            LOG.warning("Output of '{0}' truncated at {1} characters".format(command, limit))
+            try:
+                running.terminate()
+            except OSError:
+                pass
+            try:
+                # Reap git, so long running hooks are not left with a zombie per call
+                running.wait()
+            except sh.ErrorReturnCode:
+                pass
+            return
+        size += len(chunk)
+        yield chunk
 
 
-def resolve_git_dir(start=None):
-    value = None
+def _is_git_dir(path):
+    return os.path.isfile(os.path.join(path, "HEAD")) and (
+        os.path.isdir(os.path.join(path, "objects")) or
+        os.path.isfile(os.path.join(path, "commondir"))
+    )
+
+
+def _read_gitfile(path):
+    with open(path) as f:
+        content = f.read().strip()
+    if not content.startswith("gitdir:"):
+        return None
+    return os.path.normpath(os.path.join(os.path.dirname(path), content[len("gitdir:"):].strip()))
+
+
+def _find_git_dir(start):
     branch, leaf = os.path.split(start)
-    if leaf == ".git"  or os.path.basename(branch) == ".git":
-        value = start
-    else:
-        directory = start or os.getcwd()
-        while not os.path.exists() and directory and directory != '/':
-            gitdir = os.path.join(directory, ".git")
-            if os.isdir(gitdir):
-                value = gitdir
+    if leaf == ".git":
+        return start
+    if os.path.basename(branch) == ".git":
+        return branch
+    directory = start
+    while True:
+        dotgit = os.path.join(directory, ".git")
+        if os.path.isdir(dotgit):
+            return dotgit
+        if os.path.isfile(dotgit):
+            return _read_gitfile(dotgit)
+        if _is_git_dir(directory):
+            return directory
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def resolve_git_dir(start=None):
+    """
+    Returns the git directory of the repository containing start, which defaults to the
+    current directory.  Only a few stats are needed, so nothing is cached here: repositories
+    are created and removed under long running processes, and callers that resolve the same
+    repository repeatedly hold a Repository instead.
+    """
+    start = os.path.abspath(start or os.getcwd())
+    value = _find_git_dir(start)
     if value:
         LOG.debug("Git directory for '{0}' resolved to '{1}'".format(start, value))
     else:
@@ -38,9 +115,24 @@ def resolve_git_dir(start=None):
 
 def setgitdir(func):
     def f(*args, **kwargs):
-        if 'gitdir' not in kwargs or kwargs['gitdir'] == None:
-            kwargs['gitdir'] = os.getcwd()
-        kwargs['gitdir'] = resolve_git_dir(kwargs['gitdir'])
+        gitdir = kwargs.get('gitdir')
+        if isinstance(gitdir, Repository):
+            kwargs['gitdir'] = gitdir.gitdir
+        else:
+            kwargs['gitdir'] = resolve_git_dir(gitdir)
+        return func(*args, **kwargs)
+    return f
+
+
+def setrepository(func):
+    """
+    Like setgitdir, but passes gitdir on as a Repository: the caller's own handle when one was
+    given, so its cached refs are used, or a new one for the resolved git directory.
+    """
+    def f(*args, **kwargs):
+        gitdir = kwargs.get('gitdir')
+        if not isinstance(gitdir, Repository):
+            kwargs['gitdir'] = Repository(gitdir)
         return func(*args, **kwargs)
     return f
 
@@ -60,27 +152,450 @@ def setdir(func):
     return f
 
 
-@setgitdir
-def commit_message(sha, gitdir, short=False):
-    rval = git('--git-dir', gitdir, 'cat-file', 'commit', sha)
-    lines = rval.split('\n')
-    index = 0
-    while index < len(lines):
-        if not lines[index]:
-            break
-        index += 1
+class CatFileBatch(object):
+    """
+    A long running 'git cat-file --batch' process for a single git directory.  Requests are
+    written to the process and the objects read back from the same pipe, so any number of
+    objects can be read for the cost of starting one git process.
+    """
+
+    def __init__(self, gitdir):
+        self.gitdir = gitdir
+        self.process = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        LOG.debug("Starting cat-file batch session for '{0}'".format(self.gitdir))
+        self.process = subprocess.Popen(
+            ["git", "--git-dir", self.gitdir, "cat-file", "--batch"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        )
+
+    def close(self):
+        process, self.process = self.process, None
+        if process is None:
+            return
+        LOG.debug("Closing cat-file batch session for '{0}'".format(self.gitdir))
+        process.stdin.close()
+        process.wait()
+        process.stdout.close()
+
+    def read_object(self, sha):
+        return self.read_objects([sha])[0]
+
+    def read_objects(self, shas):
+        shas = list(shas)
+        with self._lock:
+            if self.process is None or self.process.poll() is not None:
+                self.start()
+            writer = threading.Thread(target=self._write_requests, args=(shas,))
+            writer.daemon = True
+            writer.start()
+            try:
+                objects = [self._read_response(sha) for sha in shas]
+            finally:
+                writer.join()
+        return objects
+
+    def _write_requests(self, shas):
+        try:
+            self.process.stdin.write("".join("{0}\n".format(s) for s in shas).encode("ascii"))
+            self.process.stdin.flush()
+        except (IOError, OSError):
+            LOG.warning("cat-file batch session for '{0}' closed early".format(self.gitdir))
+
+    def _read_response(self, sha):
+        header = self.process.stdout.readline().decode("ascii")
+        if not header:
+            self.close()
+            raise GitException("cat-file batch session for '{0}' ended unexpectedly"
+                               .format(self.gitdir))
+        tokens = header.split()
+        if len(tokens) != 3:
+            return sha, tokens[-1], None
+        objsha, objtype, size = tokens
+        content = self.process.stdout.read(int(size))
+        self.process.stdout.read(1)
+        return objsha, objtype, content
+
+
+_BATCH_SESSIONS = {}
+_BATCH_SESSIONS_LOCK = threading.Lock()
+
+
+def get_batch_session(gitdir):
+    gitdir = os.path.abspath(gitdir)
+    with _BATCH_SESSIONS_LOCK:
+        if gitdir not in _BATCH_SESSIONS:
+            _BATCH_SESSIONS[gitdir] = CatFileBatch(gitdir)
+        return _BATCH_SESSIONS[gitdir]
+
+
+@atexit.register
+def close_batch_sessions():
+    with _BATCH_SESSIONS_LOCK:
+        sessions = list(_BATCH_SESSIONS.values())
+        _BATCH_SESSIONS.clear()
+    for session in sessions:
+        session.close()
+
+
+def parse_commit_message(content, short=False):
+    if isinstance(content, bytes):
+        content = content.decode("utf-8", "replace")
+    message = content.partition("\n\n")[2]
     if short:
-        return lines[index + 1]
-    return "\n".join(lines[index + 1:-1])
+        return message.split("\n")[0]
+    if message.endswith("\n"):
+        message = message[:-1]
+    return message
+
+
+@setrepository
+def commit_message(sha, gitdir, short=False, direct=False):
+    return commit_messages([sha], gitdir=gitdir, short=short, direct=direct)[0]
+
+
+@setrepository
+def commit_messages(shas, gitdir, short=False, direct=False):
+    """
+    Returns the messages of the commits shas.  With direct the commits are read from the
+    object files by pykfs.git.objects instead of a git process, which only resolves other
+    revision names through git.  Commits the reader cannot read are read by git instead.
+    """
+    shas = list(shas)
+    contents = [None] * len(shas)
+    if direct:
+        from pykfs.git.objects import get_object_reader
+        reader = get_object_reader(gitdir.gitdir)
+        for i, sha in enumerate(shas):
+            try:
+                contents[i] = reader.read_commit(rev_parse(sha, gitdir=gitdir))
+            except GitException as e:
+                LOG.debug("Reading '{0}' with git instead: {1}".format(sha, e))
+    missing = [i for i, content in enumerate(contents) if content is None]
+    if missing:
+        requests = ["{0}^{{commit}}".format(shas[i]) for i in missing]
+        objects = get_batch_session(gitdir.gitdir).read_objects(requests)
+        for i, (objsha, objtype, content) in zip(missing, objects):
+            if objtype != "commit":
+                raise GitException("Unable to read commit '{0}': {1}".format(objsha, objtype))
+            contents[i] = content
+    return [parse_commit_message(content, short=short) for content in contents]
+
+
+@setgitdir
+def rev_list(*revs, **kwargs):
+    gitdir = kwargs.pop('gitdir')
+    exclude_existing = kwargs.pop('exclude_existing', False)
+    sources = kwargs.pop('sources', False)
+    parents = kwargs.pop('parents', False)
+    for invalid in kwargs:
+        raise TypeError("rev_list got unexpected keyword argument '{0}'".format(invalid))
+    if not revs:
+        return []
+    if sources:
+        args = ['log', '--no-color', '--source', '--format=%H %S']
+    elif parents:
+        args = ['rev-list', '--parents']
+    else:
+        args = ['rev-list']
+    args += list(revs)
+    if exclude_existing:
+        args += ['--not', '--all']
+    lines = iter_git('--no-pager', '--git-dir', gitdir, *args)
+    if sources:
+        return [tuple(line.rstrip('\n').split(' ', 1)) for line in lines if line.strip()]
+    if parents:
+        return [(line.split()[0], line.split()[1:]) for line in lines if line.strip()]
+    return [sha for line in lines for sha in line.split()]
+
+
+COMMIT_FIELDS = (
+    ("sha", "%H"),
+    ("parents", "%P"),
+    ("author_name", "%an"),
+    ("author_email", "%ae"),
+    ("author_date", "%at"),
+    ("committer_name", "%cn"),
+    ("committer_email", "%ce"),
+    ("committer_date", "%ct"),
+    ("subject", "%s"),
+    ("body", "%b"),
+)
+COMMIT_FORMATS = dict(COMMIT_FIELDS)
+LOG_CHUNK_SIZE = 1 << 16
+FULL_SHA_RE = re.compile("^[0-9a-fA-F]{40}$")
+PSEUDOREF_RE = re.compile("^[A-Z_]+$")
+
+
+class Commit(object):
+    """
+    The metadata of one commit read by commits.  Fields that were not requested are None.
+    """
+
+    __slots__ = tuple(name for name, format in COMMIT_FIELDS)
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def __repr__(self):
+        return "<Commit {0}>".format(self.sha)
+
+
+def _decode(value):
+    return value.decode("utf-8", "replace")
+
+
+FIELD_CONVERTERS = {
+    "parents": lambda value: value.decode("ascii").split(),
+    "author_date": int,
+    "committer_date": int,
+    "body": lambda value: _decode(value).rstrip("\n"),
+}
+
+
+def parse_log_records(chunks, fields):
+    """
+    Yields a Commit for every record in the byte chunks of 'git log -z' output written with
+    the format of fields, each field terminated by a NUL.
+    """
+    count = len(fields)
+    converters = [FIELD_CONVERTERS.get(name, _decode) for name in fields]
+    values = []
+    pending = b""
+    for chunk in chunks:
+        tokens = (pending + chunk).split(b"\0")
+        pending = tokens.pop()
+        for token in tokens:
+            values.append(converters[len(values)](token))
+            if len(values) == count:
+                yield Commit(**dict(zip(fields, values)))
+                values = []
+    if values or pending:
+        raise GitException("Incomplete commit record in git log output")
+
+
+@setgitdir
+def commits(rev_range, gitdir, fields=None):
+    """
+    Yields a Commit for every commit in rev_range, a revision range string or list of
+    revisions, read from one streaming 'git log' process.  fields limits the Commit fields
+    filled in to the given names.
+    """
+    fields = tuple(fields or COMMIT_FORMATS)
+    for name in fields:
+        if name not in COMMIT_FORMATS:
+            raise ValueError("Unknown commit field '{0}'".format(name))
+    revs = list(rev_range) if isinstance(rev_range, (list, tuple)) else [rev_range]
+    log_format = "%x00".join(COMMIT_FORMATS[name] for name in fields)
+    command = ["git", "--no-pager", "--git-dir", gitdir, "log", "-z", "--no-color",
+               "--format=" + log_format] + revs + ["--"]
+    LOG.info("Executing '{0}'".format(" ".join(command)))
+    # stderr goes to a file so that git never blocks on a full pipe nobody is reading
+    errors = tempfile.TemporaryFile()
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors)
+        chunks = iter(lambda: process.stdout.read(LOG_CHUNK_SIZE), b"")
+        try:
+            for commit in parse_log_records(chunks, fields):
+                yield commit
+        finally:
+            if process.poll() is None:
+                process.stdout.close()
+                process.terminate()
+            process.wait()
+            process.stdout.close()
+        errors.seek(0)
+        stderr = errors.read()
+    finally:
+        errors.close()
+    if process.returncode:
+        raise GitException("git log failed: {0}".format(stderr.decode("utf-8", "replace")))
 
 
 @setgitdir
-def gettags(sha, gitdir):
+def gettags(sha, gitdir, cached=False):
+    if cached:
+        from pykfs.git.tagcache import get_tag_cache
+        return get_tag_cache(gitdir).gettags(sha)
     rval = git('--git-dir', gitdir, 'tag', contains=sha)
     tags = rval.split()
     return tags
 
 
+@setgitdir
+def tag_refs(gitdir):
+    """
+    Returns a (name, commit) pair for every tag, annotated tags peeled to their commit.  Tags
+    of trees and blobs, such as git's own v2.6.11-tree, are left out.
+    """
+    lines = iter_git('--git-dir', gitdir, 'for-each-ref',
+                     '--format=%(refname:short) %(objecttype) %(objectname) %(*objecttype) '
+                     '%(*objectname)', 'refs/tags')
+    refs = []
+    for line in lines:
+        tokens = line.split()
+        if len(tokens) >= 3 and tokens[-2] == "commit":
+            refs.append((tokens[0], tokens[-1]))
+    return refs
+
+
+def rev_parse(rev, gitdir=None):
+    """
+    Returns the sha rev names.  Full shas are returned without looking at the repository, and
+    ref names are read by the Repository before falling back on git.
+    """
+    if FULL_SHA_RE.match(rev):
+        return rev.lower()
+    return _rev_parse(rev, gitdir=gitdir)
+
+
+@setrepository
+def _rev_parse(rev, gitdir):
+    sha = gitdir.resolve(rev)
+    if sha:
+        return sha
+    return git('--git-dir', gitdir.gitdir, 'rev-parse', '--verify', rev).strip()
+
+
+class Repository(object):
+    """
+    A handle on one repository that resolves its git directory once and reads HEAD, loose
+    refs and packed-refs straight from disk.  Every ref file read is cached until the file
+    changes.  Pass it as the gitdir of any function in this module.
+    """
+
+    REF_RULES = ("{0}", "refs/{0}", "refs/tags/{0}", "refs/heads/{0}", "refs/remotes/{0}",
+                 "refs/remotes/{0}/HEAD")
+    MAX_SYMREF_DEPTH = 5
+
+    def __init__(self, path=None):
+        self.gitdir = resolve_git_dir(path)
+        if self.gitdir is None:
+            raise GitException("Unable to find a git repository at '{0}'".format(
+                path or os.getcwd()))
+        self.commondir = self.gitdir
+        commondir = os.path.join(self.gitdir, "commondir")
+        if os.path.isfile(commondir):
+            with open(commondir) as f:
+                self.commondir = os.path.normpath(os.path.join(self.gitdir, f.read().strip()))
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<Repository {0}>".format(self.gitdir)
+
+    def _ref_path(self, name):
+        if name == "HEAD" or "/" not in name or name.startswith("refs/bisect/") or \
+                name.startswith("refs/worktree/"):
+            return os.path.join(self.gitdir, name)
+        return os.path.join(self.commondir, name)
+
+    def _read_file(self, path, parse):
+        """
+        Returns parse applied to the content of path, reusing the last result while the file's
+        inode, size and mtime are unchanged, or None if the file does not exist.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            with self._lock:
+                self._files.pop(path, None)
+            return None
+        key = (stat.st_ino, stat.st_size, stat.st_mtime)
+        with self._lock:
+            cached = self._files.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        try:
+            with open(path) as f:
+                value = parse(f.read())
+        except IOError:
+            return None
+        with self._lock:
+            self._files[path] = (key, value)
+        return value
+
+    def packed_refs(self):
+        """
+        Returns a dict of ref name to sha from packed-refs.
+        """
+        refs = self._read_file(os.path.join(self.commondir, "packed-refs"),
+                               self._parse_packed_refs)
+        return refs or {}
+
+    @staticmethod
+    def _parse_packed_refs(content):
+        refs = {}
+        for line in content.splitlines():
+            if not line or line[0] in "#^":
+                continue
+            sha, _, name = line.partition(" ")
+            refs[name] = sha
+        return refs
+
+    def read_ref(self, name):
+        """
+        Returns the sha the full ref name points at, following symbolic refs, or None.
+        """
+        for _ in range(self.MAX_SYMREF_DEPTH):
+            if "/" not in name and not PSEUDOREF_RE.match(name):
+                return None
+            value = self._read_file(self._ref_path(name), lambda content: content.strip())
+            if value is None:
+                return self.packed_refs().get(name)
+            if not value.startswith("ref:"):
+                sha = value.split()[0] if value else ""
+                return sha if FULL_SHA_RE.match(sha) else None
+            name = value[len("ref:"):].strip()
+        raise GitException("Symbolic ref '{0}' nested too deeply".format(name))
+
+    def head(self):
+        """
+        Returns the ref HEAD points at, or None when HEAD is detached.
+        """
+        value = self._read_file(os.path.join(self.gitdir, "HEAD"),
+                                lambda content: content.strip())
+        if value and value.startswith("ref:"):
+            return value[len("ref:"):].strip()
+        return None
+
+    def resolve(self, rev):
+        """
+        Returns the sha of rev if it names a ref by any of the short forms git accepts, or
+        None so the caller can fall back on git for other revision syntax.
+        """
+        if not rev or rev.startswith("/") or rev.endswith("/") or \
+                any(c in rev for c in "~^:@{}[]?* \\") or ".." in rev:
+            return None
+        for rule in self.REF_RULES:
+            sha = self.read_ref(rule.format(rev))
+            if sha:
+                return sha
+        return None
+
+    def refs(self, prefix="refs/"):
+        """
+        Returns a dict of every ref name under prefix to its sha, loose refs overriding
+        packed ones.
+        """
+        refs = dict((name, sha) for name, sha in self.packed_refs().items()
+                    if name.startswith(prefix))
+        top = os.path.join(self.commondir, prefix.rstrip("/"))
+        for dirpath, dirnames, filenames in os.walk(top):
+            for filename in filenames:
+                if filename.endswith(".lock"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.commondir).replace(os.sep, "/")
+                sha = self.read_ref(name)
+                if sha:
+                    refs[name] = sha
+        return refs
+
+
 @setdir
 def init(*args):
     rval = git("init", *args)
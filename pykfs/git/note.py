@@ -6,44 +6,105 @@ import logging
 LOGGER = logging.getLogger("pykfs.git.note")
 START_NOTE_RE = re.compile("^.*?<(?P<label>\S*?)>(?P<rest>.*)$", flags=re.S)
 END_NOTE_RE = re.compile("^(?P<note>.*?)</(?P<label>\S*?)>(?P<rest>.*)$", flags=re.S)
+OPEN_TAG_RE = re.compile("<(?P<label>\S*?)>")
+CLOSE_TAG_RE = re.compile("</(?P<label>\S*?)>")
 
 
 class GitNoteException(Exception):
     pass
 
 
-def getnotes(sha, gitdir=None):
-    message = commit_message(sha, gitdir=gitdir)
+def getnotes(sha, gitdir=None, direct=False):
+    message = commit_message(sha, gitdir=gitdir, direct=direct)
     notes = get_notes_from_message(message)
     LOGGER.debug(
-        "Found {0} messages for sha '{1}'".format(sum([len(x) for x in notes.values()], sha))
+        "Found {0} messages for sha '{1}'".format(sum([len(x) for x in notes.values()]), sha)
     )
     return notes
 
 
 def get_notes_from_message(message):
-    match = re.match(START_NOTE_RE, message)
     notes = {}
-    while match:
-        label = match.group('label')
-        rest = match.group('rest')
+    for label, note in iter_notes([message]):
+        _addnote(notes, label, note)
+    return notes
+
+
+def iter_notes(chunks):
+    """
+    Yields (label, note) pairs from an iterable of message chunks in a single pass.
+    """
+    tokenizer = NoteTokenizer()
+    for chunk in chunks:
+        for note in tokenizer.feed(chunk):
+            yield note
+    tokenizer.close()
+
+
+class NoteTokenizer(object):
+    """
+    Incremental tokenizer for '<label>note</label>' style notes.  Only text that may still
+    belong to an unfinished tag or an open note is kept between calls to feed.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.label = None
+        self.parts = []
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        notes = []
+        pos = 0
+        while True:
+            if self.label is None:
+                match = OPEN_TAG_RE.search(self.buffer, pos)
+                if not match:
+                    pos = _partial_tag_start(self.buffer, pos)
+                    break
+                self._open(match.group('label'))
+            else:
+                match = CLOSE_TAG_RE.search(self.buffer, pos)
+                if not match:
+                    keep = _partial_tag_start(self.buffer, pos)
+                    self.parts.append(self.buffer[pos:keep])
+                    pos = keep
+                    break
+                self.parts.append(self.buffer[pos:match.start()])
+                notes.append(self._close(match.group('label')))
+            pos = match.end()
+        self.buffer = self.buffer[pos:]
+        return notes
+
+    def close(self):
+        if self.label is not None:
+            raise GitNoteException("Note with label '{0}' unclosed".format(self.label))
+
+    def _open(self, label):
         LOGGER.debug("Found note label '{0}'".format(label))
         if not _is_valid_label(label):
             raise GitNoteException("Note label '{0}' is an invalid note label".format(label))
-        endmatch = re.match(END_NOTE_RE, rest)
-        if not endmatch:
-            raise GitNoteException("Note with label '{0}' unclosed".format(label))
-        note = " ".join(endmatch.group('note').split())
-        endlabel = endmatch.group('label')
-        rest = endmatch.group('rest')
+        self.label = label
+
+    def _close(self, endlabel):
+        label, self.label = self.label, None
         if not label == endlabel:
             raise GitNoteException(
                 "Note with label '{0}' closed by mismatched label '{1}'".format(label, endlabel)
             )
-            LOGGER.debug("Saving note '{0}: {1}'".format(label, note))
-        _addnote(notes, label, note)
-        match = re.match(START_NOTE_RE, rest)
-    return notes
+        note = " ".join("".join(self.parts).split())
+        self.parts = []
+        LOGGER.debug("Saving note '{0}: {1}'".format(label, note))
+        return label, note
+
+
+def _partial_tag_start(text, pos):
+    # An unfinished tag can only start within the trailing run of non-whitespace
+    start = len(text)
+    while start > pos and not text[start - 1].isspace():
+        start -= 1
+    tag = text.find("<", start)
+    return tag if tag >= 0 else len(text)
 
 
 def _addnote(notes, label, note):
@@ -0,0 +1,262 @@
+import os
+import heapq
+import sqlite3
+import logging
+import pykfs.git.lib as gitlib
+import pykfs.git.note as gitnote
+
+
+LOGGER = logging.getLogger("pykfs.git.noteindex")
+DEFAULT_INDEX_NAME = "pykfs-notes.sqlite"
+BATCH_SIZE = 1000
+# Seconds to wait on another writer, such as a concurrent post-receive hook
+BUSY_TIMEOUT = 30.0
+# Most values sqlite binds in one statement
+MAX_VARIABLES = 500
+SCHEMA_VERSION = 2
+TABLES = ("commits", "parents", "notes", "tips")
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS commits (sha TEXT PRIMARY KEY, error TEXT, generation INTEGER);
+CREATE TABLE IF NOT EXISTS parents (sha TEXT, parent TEXT, PRIMARY KEY (sha, parent));
+CREATE TABLE IF NOT EXISTS notes (sha TEXT, label TEXT, note TEXT);
+CREATE TABLE IF NOT EXISTS tips (sha TEXT PRIMARY KEY);
+CREATE INDEX IF NOT EXISTS notes_sha ON notes (sha);
+CREATE INDEX IF NOT EXISTS notes_label ON notes (label);
+"""
+# Notes from newest to oldest commit, as git log lists them, and in message order
+NOTES_SQL = "SELECT notes.sha, label, note FROM notes JOIN commits ON commits.sha = notes.sha"
+NOTES_ORDER = " ORDER BY commits.generation DESC, commits.rowid DESC, notes.rowid"
+ANCESTORS_SQL = (
+    "{name}(sha) AS (SELECT ? UNION "
+    "SELECT parents.parent FROM parents JOIN {name} ON parents.sha = {name}.sha)"
+)
+
+
+def get_default_index_path(gitdir):
+    return os.path.join(gitdir, DEFAULT_INDEX_NAME)
+
+
+def _chunks(items, size=MAX_VARIABLES):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class NoteIndex(object):
+    """
+    A SQLite index of the notes on every commit of a repository, along with the commit
+    graph so that commit ranges can be answered without walking the history with git.
+
+    Commits are only ever added after their parents, so an indexed commit always has its
+    whole history indexed.  Each commit stores its generation, one more than that of its
+    highest parent, and the indexed commits without indexed children are kept as tips for
+    the next update to stop at.
+    """
+
+    def __init__(self, gitdir, path=None):
+        self.gitdir = gitdir
+        self.path = path or get_default_index_path(gitdir)
+        self.connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+        self._create_schema()
+
+    def _create_schema(self):
+        with self.connection:
+            version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+            if version != SCHEMA_VERSION:
+                # An index from an older version is rebuilt as commits are asked for
+                LOGGER.info("Recreating note index '{0}' at version {1}".format(
+                    self.path, SCHEMA_VERSION))
+                for table in TABLES:
+                    self.connection.execute("DROP TABLE IF EXISTS {0}".format(table))
+                self.connection.execute("PRAGMA user_version = {0}".format(SCHEMA_VERSION))
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def build(self):
+        return self.update(['--all'])
+
+    def update(self, revs, exclude=()):
+        """
+        Indexes every commit reachable from revs, returning the number of commits added.  The
+        walk stops at the indexed tips and at exclude, which must only name revisions whose
+        history is already indexed.
+        """
+        args = ['--topo-order'] + list(revs) + ['--not'] + list(exclude) + self._tips()
+        walked = gitlib.rev_list(*args, parents=True, gitdir=self.gitdir)
+        # Oldest first, so that every parent is added before its children
+        walked.reverse()
+        indexed = self._indexed([sha for sha, parents in walked])
+        walked = [(sha, parents) for sha, parents in walked if sha not in indexed]
+        LOGGER.info("Indexing notes for {0} commits".format(len(walked)))
+        added = 0
+        for start in range(0, len(walked), BATCH_SIZE):
+            added += self._add_commits(walked[start:start + BATCH_SIZE])
+        return added
+
+    def _tips(self):
+        return [row[0] for row in self.connection.execute("SELECT sha FROM tips")]
+
+    def _indexed(self, shas):
+        """
+        Returns the set of shas that are indexed.
+        """
+        indexed = set()
+        for chunk in _chunks(shas):
+            cursor = self.connection.execute(
+                "SELECT sha FROM commits WHERE sha IN ({0})".format(",".join("?" * len(chunk))),
+                chunk
+            )
+            indexed.update(row[0] for row in cursor)
+        return indexed
+
+    def _generations(self, shas):
+        generations = {}
+        for chunk in _chunks(shas):
+            cursor = self.connection.execute(
+                "SELECT sha, generation FROM commits WHERE sha IN ({0})".format(
+                    ",".join("?" * len(chunk))),
+                chunk
+            )
+            generations.update(cursor)
+        return generations
+
+    def _add_commits(self, commits):
+        """
+        Adds commits, each a (sha, parents) pair given after its parents, returning the number
+        added.
+        """
+        shas = [sha for sha, parents in commits]
+        messages = gitlib.commit_messages(shas, gitdir=self.gitdir)
+        added = 0
+        with self.connection:
+            generations = self._generations(
+                sorted(set(parent for sha, parents in commits for parent in parents)))
+            for (sha, parents), message in zip(commits, messages):
+                generation = 1 + max([generations.get(parent, 0) for parent in parents] or [0])
+                generations[sha] = generation
+                error = None
+                try:
+                    notes = list(gitnote.iter_notes([message]))
+                except gitnote.GitNoteException as e:
+                    LOGGER.warning("Unable to index notes for '{0}': {1}".format(sha, e))
+                    notes, error = [], str(e)
+                cursor = self.connection.execute(
+                    "INSERT OR IGNORE INTO commits VALUES (?, ?, ?)", (sha, error, generation)
+                )
+                if not cursor.rowcount:
+                    # Already indexed by another writer since the walk
+                    continue
+                added += 1
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO parents VALUES (?, ?)",
+                    [(sha, parent) for parent in parents]
+                )
+                self.connection.executemany("DELETE FROM tips WHERE sha = ?",
+                                            [(parent,) for parent in parents])
+                self.connection.execute("INSERT OR IGNORE INTO tips VALUES (?)", (sha,))
+                self.connection.executemany(
+                    "INSERT INTO notes VALUES (?, ?, ?)",
+                    [(sha, label, note) for label, note in notes]
+                )
+        return added
+
+    def resolve(self, prefix):
+        cursor = self.connection.execute(
+            "SELECT sha FROM commits WHERE sha >= ? AND sha < ? LIMIT 2", (prefix, prefix + "g")
+        )
+        matches = [row[0] for row in cursor]
+        if len(matches) != 1:
+            raise KeyError("'{0}' does not name exactly one indexed commit".format(prefix))
+        return matches[0]
+
+    def getnotes(self, sha):
+        notes = {}
+        cursor = self.connection.execute(
+            "SELECT label, note FROM notes WHERE sha = ? ORDER BY rowid", (self.resolve(sha),)
+        )
+        for label, note in cursor:
+            gitnote._addnote(notes, label, note)
+        return notes
+
+    def find_label(self, label):
+        cursor = self.connection.execute(
+            NOTES_SQL + " WHERE label = ?" + NOTES_ORDER, (label,)
+        )
+        return [(sha, note) for sha, label, note in cursor]
+
+    def search(self, text, label=None):
+        pattern = "%{0}%".format(text.replace("\\", "\\\\").replace("%", "\\%")
+                                 .replace("_", "\\_"))
+        query = NOTES_SQL + " WHERE note LIKE ? ESCAPE '\\'"
+        params = [pattern]
+        if label:
+            query += " AND label = ?"
+            params.append(label)
+        return self.connection.execute(query + NOTES_ORDER, params).fetchall()
+
+    def _resolve_rev(self, rev):
+        try:
+            return self.resolve(rev)
+        except KeyError:
+            return gitlib.rev_parse(rev, gitdir=self.gitdir)
+
+    def _walk_range(self, until, since):
+        """
+        Returns the shas reachable from until but not from since.  Both histories are walked
+        together, highest generation first, so every commit is seen after all of its children
+        and the walk ends once only commits reachable from since are left.  Its cost follows
+        the size of the range rather than of the history.
+        """
+        reach, stop = 1, 2
+        generations = self._generations([until, since])
+        flags = {until: reach}
+        flags[since] = flags.get(since, 0) | stop
+        queue = [(-generations[sha], sha) for sha in flags]
+        heapq.heapify(queue)
+        shas = []
+        while any(flags[sha] == reach for _, sha in queue):
+            _, sha = heapq.heappop(queue)
+            flag = flags[sha]
+            if flag == reach:
+                shas.append(sha)
+            cursor = self.connection.execute(
+                "SELECT parents.parent, commits.generation FROM parents JOIN commits "
+                "ON commits.sha = parents.parent WHERE parents.sha = ?", (sha,)
+            )
+            for parent, generation in cursor:
+                if parent not in flags:
+                    flags[parent] = flag
+                    heapq.heappush(queue, (-generation, parent))
+                else:
+                    flags[parent] |= flag
+        return shas
+
+    def in_range(self, until, since=None, label=None):
+        """
+        Returns the notes on commits reachable from until but not from since, like the git
+        range 'since..until'.  Revisions that are not indexed yet are indexed first.
+        """
+        shas = [self._resolve_rev(rev) for rev in (until, since) if rev]
+        missing = [sha for sha in shas if sha not in self._indexed(shas)]
+        if missing:
+            LOGGER.info("Indexing the history of {0}".format(", ".join(missing)))
+            self.update(missing)
+        if since:
+            with self.connection:
+                self.connection.execute(
+                    "CREATE TEMP TABLE IF NOT EXISTS range_commits (sha TEXT PRIMARY KEY)")
+                self.connection.execute("DELETE FROM range_commits")
+                self.connection.executemany("INSERT INTO range_commits VALUES (?)",
+                                            [(sha,) for sha in self._walk_range(*shas)])
+            query = NOTES_SQL + " WHERE notes.sha IN (SELECT sha FROM range_commits)"
+            params = []
+        else:
+            # The whole history of until is the answer, so there is nothing to cut short
+            query = "WITH RECURSIVE {0} {1} WHERE notes.sha IN (SELECT sha FROM reach)".format(
+                ANCESTORS_SQL.format(name="reach"), NOTES_SQL)
+            params = shas[:1]
+        if label:
+            query += " AND label = ?"
+            params.append(label)
+        return self.connection.execute(query + NOTES_ORDER, params).fetchall()
@@ -0,0 +1,412 @@
+"""
+A read-only git object reader that works straight from the files under .git/objects, for
+paths where even a persistent git process costs too much per object.  Loose objects are
+inflated with zlib, packed objects are found by binary search over the memory mapped v1 and
+v2 pack indexes, and OFS and REF deltas are resolved against their bases.  The object
+directories are found the way git finds them, including the environment git sets up for
+hooks, so a pre-receive hook also sees the objects still in quarantine.
+"""
+
+
+import os
+import mmap
+import zlib
+import struct
+import logging
+import binascii
+import threading
+from collections import OrderedDict
+from pykfs.git.lib import GitException, Repository
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+IDX_MAGIC = b"\377tOc"
+PACK_MAGIC = b"PACK"
+TYPE_NAMES = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+OFS_DELTA = 6
+REF_DELTA = 7
+INFLATE_CHUNK_SIZE = 4096
+BASE_CACHE_SIZE = 64
+MAX_ALTERNATE_DEPTH = 5
+
+
+class ObjectNotFound(GitException, KeyError):
+    pass
+
+
+def _read_alternates(objectdir):
+    path = os.path.join(objectdir, "info", "alternates")
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    except (IOError, OSError):
+        return []
+    return [os.path.join(objectdir, line.strip()) for line in lines
+            if line.strip() and not line.startswith("#")]
+
+
+def get_object_dirs(gitdir, environ=None):
+    """
+    Returns the object directories git reads for gitdir: the object directory, which a linked
+    worktree shares through commondir and GIT_OBJECT_DIRECTORY overrides, the directories in
+    GIT_ALTERNATE_OBJECT_DIRECTORIES and GIT_QUARANTINE_PATH, and then the alternates listed by
+    each of those in turn.
+    """
+    environ = os.environ if environ is None else environ
+    objectdir = environ.get("GIT_OBJECT_DIRECTORY") or \
+        os.path.join(Repository(gitdir).commondir, "objects")
+    pending = [(objectdir, 0)]
+    pending.extend((path, 0) for path in
+                   environ.get("GIT_ALTERNATE_OBJECT_DIRECTORIES", "").split(os.pathsep) if path)
+    if environ.get("GIT_QUARANTINE_PATH"):
+        pending.append((environ["GIT_QUARANTINE_PATH"], 0))
+    objectdirs = []
+    seen = set()
+    while pending:
+        path, depth = pending.pop(0)
+        path = os.path.abspath(path)
+        if os.path.realpath(path) in seen:
+            continue
+        seen.add(os.path.realpath(path))
+        objectdirs.append(path)
+        if depth < MAX_ALTERNATE_DEPTH:
+            pending.extend((alternate, depth + 1) for alternate in _read_alternates(path))
+        else:
+            LOG.warning("Ignoring alternates of '{0}', nested too deeply".format(path))
+    return objectdirs
+
+
+def _mmap_file(path):
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _byte(data, pos):
+    return struct.unpack_from("B", data, pos)[0]
+
+
+def inflate(data, pos, size=None):
+    """
+    Inflates the zlib stream starting at pos of data, returning the inflated bytes.  Reading
+    stops once size bytes have been inflated when the size is known.
+    """
+    decompressor = zlib.decompressobj()
+    chunks = []
+    inflated = 0
+    while not decompressor.unused_data and pos < len(data):
+        chunk = data[pos:pos + INFLATE_CHUNK_SIZE]
+        pos += len(chunk)
+        chunks.append(decompressor.decompress(chunk))
+        inflated += len(chunks[-1])
+        if size is not None and inflated >= size:
+            break
+    chunks.append(decompressor.flush())
+    return b"".join(chunks)
+
+
+def apply_delta(base, delta):
+    """
+    Returns the object made by applying the git delta instructions in delta to base.
+    """
+    delta = bytearray(delta)
+    pos = 0
+
+    def varint(pos):
+        value = shift = 0
+        while True:
+            byte = delta[pos]
+            pos += 1
+            value |= (byte & 0x7f) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value, pos
+
+    source_size, pos = varint(pos)
+    target_size, pos = varint(pos)
+    if source_size != len(base):
+        raise GitException("Delta base size {0} does not match {1}".format(
+            source_size, len(base)))
+    result = []
+    while pos < len(delta):
+        opcode = delta[pos]
+        pos += 1
+        if opcode & 0x80:
+            offset = size = 0
+            for i in range(4):
+                if opcode & (1 << i):
+                    offset |= delta[pos] << (8 * i)
+                    pos += 1
+            for i in range(3):
+                if opcode & (0x10 << i):
+                    size |= delta[pos] << (8 * i)
+                    pos += 1
+            result.append(base[offset:offset + (size or 0x10000)])
+        elif opcode:
+            result.append(bytes(delta[pos:pos + opcode]))
+            pos += opcode
+        else:
+            raise GitException("Invalid delta opcode 0")
+    target = b"".join(result)
+    if len(target) != target_size:
+        raise GitException("Delta produced {0} bytes, expected {1}".format(
+            len(target), target_size))
+    return target
+
+
+class PackIndex(object):
+    """
+    A memory mapped version 1 or 2 pack index and its pack.  Version 1 indexes have no header
+    and keep each 4 byte offset in front of its sha; version 2 keeps the shas, checksums and
+    offsets in separate tables.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index = _mmap_file(path)
+        try:
+            self._parse_header()
+            self.pack = _mmap_file(path[:-len(".idx")] + ".pack")
+        except Exception:
+            self.index.close()
+            raise
+        if self.pack[:4] != PACK_MAGIC:
+            self.close()
+            raise GitException("Invalid pack '{0}'".format(path))
+
+    def _parse_header(self):
+        if self.index[:4] == IDX_MAGIC:
+            self.version = struct.unpack_from(">I", self.index, 4)[0]
+            if self.version != 2:
+                raise GitException("Unsupported version {0} of pack index '{1}'".format(
+                    self.version, self.path))
+            fanout_start = 8
+        else:
+            self.version = 1
+            fanout_start = 0
+        self.fanout = struct.unpack_from(">256I", self.index, fanout_start)
+        self.count = self.fanout[-1]
+        entries_start = fanout_start + 256 * 4
+        if self.version == 1:
+            self.shas_start = entries_start + 4
+            self.sha_stride = 24
+            self.offsets_start = entries_start
+            self.offset_stride = 24
+        else:
+            self.shas_start = entries_start
+            self.sha_stride = 20
+            self.offsets_start = self.shas_start + self.count * 24
+            self.offset_stride = 4
+            self.large_offsets_start = self.offsets_start + self.count * 4
+
+    def close(self):
+        self.index.close()
+        self.pack.close()
+
+    def find(self, binsha):
+        """
+        Returns the pack offset of the object with the 20 byte binsha, or None.
+        """
+        first = _byte(binsha, 0)
+        low = self.fanout[first - 1] if first else 0
+        high = self.fanout[first]
+        while low < high:
+            middle = (low + high) // 2
+            start = self.shas_start + middle * self.sha_stride
+            current = self.index[start:start + 20]
+            if current < binsha:
+                low = middle + 1
+            elif current > binsha:
+                high = middle
+            else:
+                return self._offset(middle)
+        return None
+
+    def _offset(self, position):
+        offset = struct.unpack_from(
+            ">I", self.index, self.offsets_start + position * self.offset_stride)[0]
+        if self.version == 2 and offset & 0x80000000:
+            large = self.large_offsets_start + (offset & 0x7fffffff) * 8
+            offset = struct.unpack_from(">Q", self.index, large)[0]
+        return offset
+
+
+class ObjectReader(object):
+    """
+    Reads objects from the object directories of gitdir, by default those get_object_dirs
+    finds.  Pack indexes that cannot be read are skipped with a warning, so their objects are
+    reported as not found and left to git.
+    """
+
+    def __init__(self, gitdir, objectdirs=None):
+        self.gitdir = gitdir
+        self.objectdirs = objectdirs or get_object_dirs(gitdir)
+        self.packs = {}
+        self.skipped = set()
+        self._bases = OrderedDict()
+        self._lock = threading.RLock()
+
+    def close(self):
+        with self._lock:
+            for pack in self.packs.values():
+                pack.close()
+            self.packs.clear()
+            self._bases.clear()
+
+    def _load_packs(self):
+        for objectdir in self.objectdirs:
+            packdir = os.path.join(objectdir, "pack")
+            if not os.path.isdir(packdir):
+                continue
+            for name in sorted(os.listdir(packdir)):
+                path = os.path.join(packdir, name)
+                if name.endswith(".idx") and path not in self.packs and \
+                        path not in self.skipped:
+                    if not os.path.exists(path[:-len(".idx")] + ".pack"):
+                        continue
+                    LOG.debug("Loading pack index '{0}'".format(path))
+                    try:
+                        self.packs[path] = PackIndex(path)
+                    except (GitException, struct.error, ValueError, EnvironmentError) as e:
+                        LOG.warning("Skipping pack index '{0}': {1}".format(path, e))
+                        self.skipped.add(path)
+
+    def read(self, sha):
+        """
+        Returns the (type, content) of the object with the hex sha.
+        """
+        with self._lock:
+            found = self._read_loose(sha)
+            if found is None:
+                found = self._read_packed(sha)
+            if found is None:
+                # Objects may have been packed since the pack directory was last read
+                self._load_packs()
+                found = self._read_loose(sha) or self._read_packed(sha)
+            if found is None:
+                raise ObjectNotFound("Object '{0}' not found in '{1}'".format(sha, self.gitdir))
+            return found
+
+    def read_commit(self, sha):
+        """
+        Returns the content of the commit sha, peeling annotated tags.
+        """
+        objtype, content = self.read(sha)
+        while objtype == "tag":
+            target = content.split(b"\n", 1)[0]
+            if not target.startswith(b"object "):
+                raise GitException("Invalid tag object '{0}'".format(sha))
+            sha = target[len(b"object "):].decode("ascii")
+            objtype, content = self.read(sha)
+        if objtype != "commit":
+            raise GitException("Unable to read commit '{0}': {1}".format(sha, objtype))
+        return content
+
+    def _read_loose(self, sha):
+        for objectdir in self.objectdirs:
+            path = os.path.join(objectdir, sha[:2], sha[2:])
+            try:
+                with open(path, "rb") as f:
+                    data = zlib.decompress(f.read())
+            except (IOError, OSError):
+                continue
+            header, _, content = data.partition(b"\0")
+            objtype, size = header.decode("ascii").split()
+            if int(size) != len(content):
+                raise GitException("Corrupt loose object '{0}'".format(path))
+            return objtype, content
+        return None
+
+    def _read_packed(self, sha):
+        if not self.packs:
+            self._load_packs()
+        binsha = binascii.unhexlify(sha)
+        for pack in self.packs.values():
+            offset = pack.find(binsha)
+            if offset is not None:
+                return self._read_pack_object(pack, offset)
+        return None
+
+    def _read_pack_object(self, pack, offset):
+        """
+        Reads the object at offset of pack, following its delta chain down to the base and
+        applying the deltas back up.
+        """
+        deltas = []
+        while True:
+            cached = self._bases.get((pack.path, offset))
+            if cached is not None:
+                objtype, content = cached
+                break
+            kind, size, pos = self._read_header(pack.pack, offset)
+            if kind == OFS_DELTA:
+                base_offset, pos = self._read_ofs_offset(pack.pack, pos)
+                deltas.append((offset, inflate(pack.pack, pos, size)))
+                offset = offset - base_offset
+            elif kind == REF_DELTA:
+                base_sha = binascii.hexlify(pack.pack[pos:pos + 20]).decode("ascii")
+                deltas.append((offset, inflate(pack.pack, pos + 20, size)))
+                objtype, content = self.read(base_sha)
+                break
+            elif kind in TYPE_NAMES:
+                objtype, content = TYPE_NAMES[kind], inflate(pack.pack, pos, size)
+                self._cache_base(pack, offset, objtype, content)
+                break
+            else:
+                raise GitException("Unknown object type {0} at offset {1} of '{2}'".format(
+                    kind, offset, pack.path))
+        for delta_offset, delta in reversed(deltas):
+            content = apply_delta(content, delta)
+            self._cache_base(pack, delta_offset, objtype, content)
+        return objtype, content
+
+    def _cache_base(self, pack, offset, objtype, content):
+        self._bases[(pack.path, offset)] = (objtype, content)
+        while len(self._bases) > BASE_CACHE_SIZE:
+            self._bases.popitem(last=False)
+
+    @staticmethod
+    def _read_header(data, pos):
+        byte = _byte(data, pos)
+        pos += 1
+        kind = (byte >> 4) & 7
+        size = byte & 0x0f
+        shift = 4
+        while byte & 0x80:
+            byte = _byte(data, pos)
+            pos += 1
+            size |= (byte & 0x7f) << shift
+            shift += 7
+        return kind, size, pos
+
+    @staticmethod
+    def _read_ofs_offset(data, pos):
+        byte = _byte(data, pos)
+        pos += 1
+        offset = byte & 0x7f
+        while byte & 0x80:
+            byte = _byte(data, pos)
+            pos += 1
+            offset = ((offset + 1) << 7) | (byte & 0x7f)
+        return offset, pos
+
+
+_READERS = {}
+_READERS_LOCK = threading.Lock()
+
+
+def get_object_reader(gitdir):
+    """
+    Returns the shared ObjectReader for gitdir.  It is replaced whenever the object
+    directories change, as they do with the quarantine of every push a hook server handles.
+    """
+    gitdir = os.path.abspath(gitdir)
+    objectdirs = get_object_dirs(gitdir)
+    with _READERS_LOCK:
+        reader = _READERS.get(gitdir)
+        if reader is None or reader.objectdirs != objectdirs:
+            if reader is not None:
+                reader.close()
+            reader = _READERS[gitdir] = ObjectReader(gitdir, objectdirs)
+        return reader
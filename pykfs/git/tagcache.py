@@ -0,0 +1,160 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+import pykfs.git.lib as gitlib
+
+
+LOGGER = logging.getLogger("pykfs.git.tagcache")
+DEFAULT_CACHE_NAME = "pykfs-tags.json"
+FULL_SHA_RE = re.compile("^[0-9a-f]{40}$")
+EMPTY = frozenset()
+
+
+def get_default_cache_path(gitdir):
+    return os.path.join(gitdir, DEFAULT_CACHE_NAME)
+
+
+class TagCache(object):
+    """
+    The commit graph below every tag of a repository, with generation numbers, kept on disk
+    and rebuilt whenever the tag refs change.  The refs are read from disk through a
+    Repository, so checking for changes starts no git process.  Tag containment is answered
+    by walking down from a commit to its descendants in generation order, remembering the
+    tags found for every commit visited so that later lookups reuse them.
+    """
+
+    def __init__(self, gitdir, path=None):
+        self.gitdir = gitdir
+        self.path = path or get_default_cache_path(gitdir)
+        self.repository = gitlib.Repository(gitdir)
+        self.fingerprint = None
+
+    def refresh(self):
+        refs = self.repository.refs("refs/tags/")
+        fingerprint = hashlib.sha1(
+            "\n".join(sorted("{0} {1}".format(*ref) for ref in refs.items())).encode("utf-8")
+        ).hexdigest()
+        if fingerprint == self.fingerprint:
+            return
+        data = self._read(fingerprint)
+        if data is None:
+            data = self._build(fingerprint, gitlib.tag_refs(gitdir=self.gitdir))
+            self._write(data)
+        self._load(data)
+
+    def _read(self, fingerprint):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if data.get("fingerprint") != fingerprint:
+            LOGGER.debug("Tag cache '{0}' is out of date".format(self.path))
+            return None
+        return data
+
+    def _write(self, data):
+        # Each process and thread writes its own temporary file, so writers cannot mix them up
+        tmppath = "{0}.{1}.{2}.tmp".format(self.path, os.getpid(),
+                                           threading.current_thread().ident)
+        try:
+            with open(tmppath, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.rename(tmppath, self.path)
+        except (IOError, OSError) as e:
+            LOGGER.warning("Unable to save tag cache '{0}': {1}".format(self.path, e))
+
+    def _build(self, fingerprint, refs):
+        LOGGER.info("Building tag cache for {0} tags".format(len(refs)))
+        heads = sorted(set(commit for name, commit in refs))
+        walked = gitlib.rev_list('--topo-order', *heads, parents=True, gitdir=self.gitdir) \
+            if heads else []
+        return {
+            "fingerprint": fingerprint,
+            "tags": dict(refs),
+            "commits": walked,
+        }
+
+    def _load(self, data):
+        self.fingerprint = data["fingerprint"]
+        self.generation = {}
+        self.children = {}
+        for sha, parents in reversed(data["commits"]):
+            self.generation[sha] = 1 + max([self.generation[p] for p in parents] or [0])
+            for parent in parents:
+                self.children.setdefault(parent, []).append(sha)
+        self.commit_tags = {}
+        for name, commit in data["tags"].items():
+            if commit in self.generation:
+                self.commit_tags.setdefault(commit, set()).add(name)
+        self._tagsets = {}
+
+    def gettags(self, sha):
+        return self.gettags_many([sha])[0]
+
+    def gettags_many(self, shas):
+        self.refresh()
+        return [sorted(self._tagset(self._resolve(sha))) for sha in shas]
+
+    def latest_version_tag(self, sha):
+        versions = [tag for tag in self.gettags(sha) if gitlib.isversion(tag)]
+        if not versions:
+            return None
+        return max(versions, key=version_key)
+
+    def _resolve(self, sha):
+        if FULL_SHA_RE.match(sha):
+            return sha
+        return gitlib.rev_parse("{0}^{{commit}}".format(sha), gitdir=self.gitdir)
+
+    def _tagset(self, sha):
+        if sha not in self.generation:
+            return EMPTY
+        if sha in self._tagsets:
+            return self._tagsets[sha]
+        pending = [sha]
+        seen = set(pending)
+        while pending:
+            for child in self.children.get(pending.pop(), ()):
+                if child not in self._tagsets and child not in seen:
+                    seen.add(child)
+                    pending.append(child)
+        for node in sorted(seen, key=self.generation.get, reverse=True):
+            tagsets = set(self._tagsets[child] for child in self.children.get(node, ()))
+            own = self.commit_tags.get(node)
+            if own:
+                tagsets.add(frozenset(own))
+            if len(tagsets) == 1:
+                self._tagsets[node] = tagsets.pop()
+            else:
+                self._tagsets[node] = frozenset().union(*tagsets)
+        return self._tagsets[sha]
+
+
+def version_key(tag):
+    return [int(number) for number in re.findall("\\d+", tag)]
+
+
+_TAG_CACHES = {}
+_TAG_CACHES_LOCK = threading.Lock()
+
+
+def get_tag_cache(gitdir):
+    gitdir = os.path.abspath(gitdir)
+    with _TAG_CACHES_LOCK:
+        if gitdir not in _TAG_CACHES:
+            _TAG_CACHES[gitdir] = TagCache(gitdir)
+        return _TAG_CACHES[gitdir]
+
+
+@gitlib.setgitdir
+def gettags_many(shas, gitdir):
+    return get_tag_cache(gitdir).gettags_many(shas)
+
+
+@gitlib.setgitdir
+def latest_version_tag(sha, gitdir):
+    return get_tag_cache(gitdir).latest_version_tag(sha)
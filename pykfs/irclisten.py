@@ -0,0 +1,138 @@
+import sys
+import logging
+import datetime as dt
+from pykfs.chatlog import ChatLogWriter
+from pykfs.ircutil import schedule_after, schedule_every, next_backoff, DEFAULT_PORT
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+DEFAULT_NICKNAME = "devweb"
+DEFAULT_CHATLOG_FORMAT = "{server}_{channel}_{date}.log"
+DEFAULT_DATE_FORMAT = "%Y-%m-%d"
+
+
+class ServerState(object):
+
+    def __init__(self, host, channels, port=DEFAULT_PORT, nickname=None, password=None):
+        self.host = host
+        self.port = port
+        self.nickname = nickname
+        self.password = password
+        self.channels = [channel.lower() for channel in channels]
+        self.connection = None
+        self.backoff = None
+
+
+class IRCListener(object):
+    """
+    Logs the public messages of any number of channels on any number of servers from a single
+    event loop.  Every channel writes to its own ChatLogWriter, and dropped connections are
+    retried with exponential backoff.
+
+    The config is a dict like the one read from a listener config file:
+
+        logdir: /var/log/chat
+        nickname: devweb
+        servers:
+          - host: irc.example.com
+            port: 6667
+            channels: ["#dev", "#ops"]
+    """
+
+    def __init__(self, config, echo=False):
+        self.logdir = config["logdir"]
+        self.nickname = config.get("nickname", DEFAULT_NICKNAME)
+        self.max_nick = config.get("max_nick", 16)
+        self.min_backoff = config.get("min_backoff", 1)
+        self.max_backoff = config.get("max_backoff", 300)
+        self.flush_interval = config.get("flush_interval", 1.0)
+        self.echo = echo
+        self.servers = [ServerState(**server) for server in config["servers"]]
+        self.sinks = {}
+        self.dirty = set()
+        for server in self.servers:
+            for channel in server.channels:
+                self.sinks[(server.host, channel)] = self._make_sink(config, server, channel)
+        import irc.client
+        self.reactor = irc.client.Reactor()
+        for event in "welcome", "pubmsg", "disconnect", "nicknameinuse":
+            self.reactor.add_global_handler(event, getattr(self, "on_{0}".format(event)))
+
+    def _make_sink(self, config, server, channel):
+        filename = config.get("chatlog_format", DEFAULT_CHATLOG_FORMAT).format(
+            server=server.host, channel=channel, date="{date}"
+        )
+        offset = dt.timedelta(hours=config.get("day_change_offset_hours", 0))
+        return ChatLogWriter(self.logdir, filename,
+                             date_format=config.get("date_format", DEFAULT_DATE_FORMAT),
+                             day_change_offset=offset,
+                             flush_interval=self.flush_interval,
+                             fsync_interval=config.get("fsync_interval"))
+
+    def start(self):
+        for server in self.servers:
+            self.connect(server)
+        schedule_every(self.reactor, self.flush_interval, self.tick)
+        try:
+            self.reactor.process_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        for sink in self.sinks.values():
+            sink.close()
+
+    def tick(self):
+        dirty, self.dirty = self.dirty, set()
+        for sink in dirty:
+            sink.tick()
+            if sink.buffer:
+                self.dirty.add(sink)
+
+    def connect(self, server):
+        import irc.client
+        LOG.info("Connecting to {0}:{1} ...".format(server.host, server.port))
+        if server.connection is None:
+            # Every retry reconnects the same connection rather than leaving one behind
+            server.connection = self.reactor.server()
+            server.connection.state = server
+        connection = server.connection
+        try:
+            connection.connect(server.host, server.port, server.nickname or self.nickname,
+                               password=server.password)
+        except irc.client.ServerConnectionError as e:
+            LOG.warning("Unable to connect to {0}: {1}".format(server.host, e))
+            self.schedule_reconnect(server)
+
+    def schedule_reconnect(self, server):
+        delay, server.backoff = next_backoff(server.backoff, self.min_backoff, self.max_backoff)
+        LOG.info("Reconnecting to {0} in {1} seconds".format(server.host, delay))
+        schedule_after(self.reactor, delay, lambda: self.connect(server))
+
+    def on_welcome(self, connection, event):
+        server = connection.state
+        server.backoff = None
+        for channel in server.channels:
+            connection.join(channel)
+
+    def on_nicknameinuse(self, connection, event):
+        connection.nick(connection.get_nickname() + "_")
+
+    def on_disconnect(self, connection, event):
+        server = connection.state
+        if server.connection is connection:
+            self.schedule_reconnect(server)
+
+    def on_pubmsg(self, connection, event):
+        sink = self.sinks.get((connection.state.host, event.target.lower()))
+        if sink is None:
+            return
+        sender = event.source.split('!')[0]
+        line = "{:>{fill}}: {}\n".format(sender, event.arguments[0], fill=self.max_nick)
+        if self.echo:
+            sys.stdout.write(line)
+        sink.write(line)
+        if sink.buffer:
+            self.dirty.add(sink)
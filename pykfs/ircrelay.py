@@ -0,0 +1,181 @@
+import os
+import json
+import socket
+import logging
+import threading
+import collections
+from pykfs.ircutil import schedule_after, schedule_every, next_backoff, DEFAULT_PORT
+from pykfs.runtime import get_runtime_path, prepare_socket_path, is_private_socket, \
+    UnsafePathError
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+DEFAULT_SOCKET_PATH = get_runtime_path("ircrelay.sock")
+MAX_DATAGRAM = 65536
+
+
+def send_notification(notification, socket_path=DEFAULT_SOCKET_PATH):
+    """
+    Queues a notification with the relay listening on socket_path without waiting on IRC.
+    The socket must be in a private directory of the current user.
+    """
+    if not is_private_socket(socket_path):
+        raise UnsafePathError("Refusing to send to '{0}', which is not in a private "
+                              "directory".format(socket_path))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sock.sendto(json.dumps(notification).encode("utf-8"), socket_path)
+    finally:
+        sock.close()
+
+
+def format_push(notification):
+    line1 = ("[{repo}] Push received from '{user}' to branch '{branch}', "
+             "sha '{sha}'".format(**notification))
+    line2 = "  {message}".format(**notification)
+    return [line1, line2]
+
+
+def format_summary(notifications):
+    first = notifications[0]
+    users = sorted(set(n["user"] for n in notifications))
+    return ("[{repo}] {count} pushes received from {users} to branch '{branch}', latest sha "
+            "'{sha}'".format(repo=first["repo"], branch=first["branch"], count=len(notifications),
+                             users=", ".join("'{0}'".format(user) for user in users),
+                             sha=notifications[-1]["sha"]))
+
+
+class IRCRelay(object):
+    """
+    Holds a persistent IRC connection and relays the push notifications sent to its unix
+    socket.  At most max_lines lines are sent every period seconds; when more notifications
+    are waiting than fit, pushes to the same repository and branch are coalesced into one
+    summary line each.
+    """
+
+    def __init__(self, host, port=DEFAULT_PORT, nickname="git", username=None, ircname=None,
+                 password=None, socket_path=DEFAULT_SOCKET_PATH, socket_mode=0o600,
+                 max_lines=4, period=2.0, min_backoff=1, max_backoff=300):
+        self.host = host
+        self.port = port
+        self.nickname = nickname
+        self.username = username or nickname
+        self.ircname = ircname or nickname
+        self.password = password
+        self.socket_path = socket_path
+        self.socket_mode = socket_mode
+        self.max_lines = max_lines
+        self.period = period
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.backoff = None
+        self.pending = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.connection = None
+        self.joined = set()
+        import irc.client
+        self.reactor = irc.client.Reactor()
+        for event in "welcome", "disconnect", "nicknameinuse":
+            self.reactor.add_global_handler(event, getattr(self, "on_{0}".format(event)))
+
+    def start(self):
+        self.sock = self._bind()
+        reader = threading.Thread(target=self._read_notifications, name="pykfs-ircrelay")
+        reader.daemon = True
+        reader.start()
+        self.connect()
+        schedule_every(self.reactor, self.period, self.flush)
+        try:
+            self.reactor.process_forever()
+        finally:
+            self.sock.close()
+            os.remove(self.socket_path)
+
+    def _bind(self):
+        prepare_socket_path(self.socket_path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(self.socket_path)
+        os.chmod(self.socket_path, self.socket_mode)
+        LOG.info("Listening for notifications on '{0}'".format(self.socket_path))
+        return sock
+
+    def _read_notifications(self):
+        while True:
+            data = self.sock.recv(MAX_DATAGRAM)
+            try:
+                notification = json.loads(data.decode("utf-8"))
+                key = (notification["channel"], notification["repo"], notification["branch"])
+            except (ValueError, KeyError, TypeError) as e:
+                LOG.warning("Ignoring invalid notification: {0}".format(e))
+                continue
+            with self.lock:
+                self.pending.setdefault(key, []).append(notification)
+
+    def connect(self):
+        import irc.client
+        LOG.info("Connecting to {0}:{1} ...".format(self.host, self.port))
+        self.joined = set()
+        if self.connection is None:
+            # Every retry reconnects the same connection rather than leaving one behind
+            self.connection = self.reactor.server()
+        try:
+            self.connection.connect(self.host, self.port, self.nickname, password=self.password,
+                                    username=self.username, ircname=self.ircname)
+        except irc.client.ServerConnectionError as e:
+            LOG.warning("Unable to connect to {0}: {1}".format(self.host, e))
+            self.schedule_reconnect()
+
+    def schedule_reconnect(self):
+        delay, self.backoff = next_backoff(self.backoff, self.min_backoff, self.max_backoff)
+        LOG.info("Reconnecting to {0} in {1} seconds".format(self.host, delay))
+        schedule_after(self.reactor, delay, self.connect)
+
+    def on_welcome(self, connection, event):
+        self.backoff = None
+
+    def on_nicknameinuse(self, connection, event):
+        connection.nick(connection.get_nickname() + "_")
+
+    def on_disconnect(self, connection, event):
+        if connection is self.connection:
+            self.schedule_reconnect()
+
+    def flush(self):
+        if not self.connection or not self.connection.is_connected() or self.backoff:
+            return
+        with self.lock:
+            lines = self._take_lines()
+        for channel, line in lines:
+            if channel not in self.joined:
+                self.connection.join(channel)
+                self.joined.add(channel)
+            self.connection.privmsg(channel, line)
+            LOG.info("IRC {0}: {1}".format(channel, line))
+
+    def _take_lines(self):
+        """
+        Takes up to max_lines lines to send from the pending notifications.  A push that does
+        not fit is left pending for the next period, unless no line could be sent without it.
+        """
+        count = sum(len(notifications) for notifications in self.pending.values())
+        coalesce = count * 2 > self.max_lines
+        lines = []
+        while self.pending:
+            key, notifications = next(iter(self.pending.items()))
+            channel = key[0]
+            summarize = coalesce and len(notifications) > 1
+            if summarize:
+                taken = [format_summary(notifications)]
+            else:
+                taken = format_push(notifications[0])
+            if len(lines) + len(taken) > self.max_lines:
+                if lines:
+                    break
+                taken = taken[:self.max_lines]
+            lines.extend((channel, line) for line in taken)
+            del notifications[:len(notifications) if summarize else 1]
+            if not notifications:
+                del self.pending[key]
+        return lines
@@ -0,0 +1,30 @@
+"""
+Helpers shared by the IRC daemons for scheduling work on an irc.client Reactor and for
+retrying dropped connections.
+"""
+
+
+DEFAULT_PORT = 6667
+
+
+def schedule_after(reactor, delay, func):
+    scheduler = getattr(reactor, "scheduler", None)
+    if scheduler is not None:
+        return scheduler.execute_after(delay, func)
+    return reactor.execute_delayed(delay, func)
+
+
+def schedule_every(reactor, period, func):
+    scheduler = getattr(reactor, "scheduler", None)
+    if scheduler is not None:
+        return scheduler.execute_every(period, func)
+    return reactor.execute_every(period, func)
+
+
+def next_backoff(backoff, min_backoff, max_backoff):
+    """
+    Returns the delay before the next reconnect and the backoff to store for the one after
+    it, which doubles up to max_backoff.  backoff is None when the last connect succeeded.
+    """
+    delay = backoff or min_backoff
+    return delay, min(delay * 2, max_backoff)
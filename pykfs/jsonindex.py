@@ -0,0 +1,354 @@
+"""
+A sidecar index of the byte offsets of the values in a large JSON file, so a path such as
+$.items[900000].meta can be read without parsing everything before it.  The index is built
+in one streaming pass with pykfs.jsonstream and records every value down to a fixed depth.
+Paths that go deeper than the index are finished by tokenizing only the bytes of the deepest
+indexed value, read through mmap.
+"""
+
+
+import os
+import re
+import json
+import mmap
+import sqlite3
+import logging
+from pykfs import jsonstream
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+INDEX_SUFFIX = ".index.sqlite"
+DEFAULT_DEPTH = 2
+BATCH_SIZE = 10000
+ROOT_ID = 0
+SCHEMA = """
+CREATE TABLE meta (name TEXT PRIMARY KEY, value INTEGER);
+CREATE TABLE nodes (
+    id INTEGER PRIMARY KEY, parent INTEGER, key TEXT, position INTEGER, depth INTEGER,
+    start INTEGER, end INTEGER
+);
+"""
+INDEXES = """
+CREATE INDEX nodes_key ON nodes (parent, key);
+CREATE INDEX nodes_position ON nodes (parent, position);
+"""
+PATH_RE = re.compile(
+    r'\.(?P<name>[^.\[]+)|\[(?P<index>-?[0-9]+)\]|\[(?P<slice>[0-9]*:[0-9]*)\]'
+    r'|\[(?P<key>"(?:[^"\\]|\\.)*")\]'
+)
+
+
+class JSONIndexError(Exception):
+    pass
+
+
+def get_index_path(filepath):
+    return filepath + INDEX_SUFFIX
+
+
+def parse_path(path):
+    """
+    Parses a path like $.items[10].meta["a b"] or $.items[10:20] into a list of object keys,
+    array indexes and, as the last component only, a slice.
+    """
+    if not path.startswith("$"):
+        raise JSONIndexError("Path '{0}' must start with '$'".format(path))
+    components = []
+    pos = 1
+    while pos < len(path):
+        match = PATH_RE.match(path, pos)
+        if not match or (components and isinstance(components[-1], slice)):
+            raise JSONIndexError("Invalid path '{0}' at character {1}".format(path, pos))
+        if match.group("name") is not None:
+            components.append(match.group("name"))
+        elif match.group("key") is not None:
+            components.append(json.loads(match.group("key")))
+        elif match.group("index") is not None:
+            components.append(int(match.group("index")))
+        else:
+            start, stop = match.group("slice").split(":")
+            components.append(slice(int(start or 0), int(stop) if stop else None))
+        pos = match.end()
+    return components
+
+
+def _value_end(tokens, offset, token):
+    """
+    Consumes the rest of the value starting with token, returning the offset just past it.
+    """
+    if token not in jsonstream.OPENERS:
+        return offset + len(token)
+    depth = 1
+    for offset, token in tokens:
+        if token in jsonstream.OPENERS:
+            depth += 1
+        elif token in jsonstream.CLOSERS:
+            depth -= 1
+            if depth == 0:
+                return offset + 1
+    raise jsonstream.JSONStreamError("Unexpected end of JSON")
+
+
+def _next(tokens):
+    for token in tokens:
+        return token
+    raise jsonstream.JSONStreamError("Unexpected end of JSON")
+
+
+def scan(tokens, components):
+    """
+    Follows components through the JSON value starting at the next token, returning the
+    (start, end) byte ranges of the values found.
+    """
+    offset, token = _next(tokens)
+    if not components:
+        return [(offset, _value_end(tokens, offset, token))]
+    component, rest = components[0], components[1:]
+    if token == b"{" and not isinstance(component, (int, slice)):
+        while True:
+            offset, token = _next(tokens)
+            if token == b"}":
+                break
+            key = json.loads(token.decode("utf-8"))
+            _next(tokens)
+            if key == component:
+                return scan(tokens, rest)
+            _value_end(tokens, *_next(tokens))
+            if _next(tokens)[1] == b"}":
+                break
+    elif token == b"[" and isinstance(component, (int, slice)):
+        if isinstance(component, int) and component < 0:
+            raise JSONIndexError("Negative index {0} is only supported inside the indexed "
+                                 "depth".format(component))
+        found = []
+        position = 0
+        while True:
+            if isinstance(component, slice) and component.stop is not None \
+                    and position >= component.stop:
+                break
+            offset, token = _next(tokens)
+            if token == b"]":
+                break
+            if position == component:
+                return scan(_chain([(offset, token)], tokens), rest)
+            if isinstance(component, slice) and position >= component.start:
+                found.append((offset, _value_end(tokens, offset, token)))
+            else:
+                _value_end(tokens, offset, token)
+            position += 1
+            if _next(tokens)[1] == b"]":
+                break
+        if isinstance(component, slice):
+            return found
+    raise KeyError(component)
+
+
+def _chain(first, rest):
+    for item in first:
+        yield item
+    for item in rest:
+        yield item
+
+
+class JSONIndex(object):
+    """
+    The sidecar offset index of a JSON file.
+    """
+
+    def __init__(self, filepath, path=None):
+        self.filepath = filepath
+        self.path = path or get_index_path(filepath)
+        self.connection = None
+        self.depth = None
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def _file_stamp(self):
+        stat = os.stat(self.filepath)
+        return int(stat.st_mtime * 1e9), stat.st_size
+
+    def open(self):
+        """
+        Opens the existing index, returning False if there is none or it is out of date.
+        """
+        if not os.path.exists(self.path):
+            return False
+        self.connection = sqlite3.connect(self.path)
+        try:
+            meta = dict(self.connection.execute("SELECT name, value FROM meta"))
+        except sqlite3.DatabaseError:
+            meta = {}
+        if (meta.get("mtime"), meta.get("size")) != self._file_stamp():
+            self.close()
+            return False
+        self.depth = meta["depth"]
+        return True
+
+    def build(self, depth=DEFAULT_DEPTH):
+        """
+        Indexes the offsets of every value down to depth levels below the top level value in
+        one pass over the file, replacing any existing index.
+        """
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        mtime, size = self._file_stamp()
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(SCHEMA)
+        self.depth = depth
+        with open(self.filepath, "rb") as f:
+            count = self._index_tokens(jsonstream.iter_tokens(f), depth)
+        with self.connection:
+            self.connection.executescript(INDEXES)
+            self.connection.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("depth", depth), ("mtime", mtime), ("size", size)
+            ])
+        LOG.info("Indexed {0} values of '{1}'".format(count, self.filepath))
+        return count
+
+    def _index_tokens(self, tokens, depth):
+        rows = []
+        count = 0
+        # One frame per open container: [id, depth, next position, is object, row]
+        stack = []
+        key = None
+        next_id = ROOT_ID
+        for offset, token in tokens:
+            if token == b"," or token == b":":
+                continue
+            if token in jsonstream.CLOSERS:
+                frame = stack.pop()
+                if frame[4] is not None:
+                    frame[4][6] = offset + 1
+                    rows.append(tuple(frame[4]))
+                continue
+            parent = stack[-1] if stack else None
+            if parent is not None and parent[3] and key is None:
+                key = json.loads(token.decode("utf-8"))
+                continue
+            level = parent[1] + 1 if parent else 0
+            row = None
+            if level <= depth:
+                row = [next_id, parent and parent[0], key, parent and parent[2], level,
+                       offset, None]
+                next_id += 1
+                count += 1
+            if parent is not None:
+                parent[2] += 1
+            key = None
+            if token in jsonstream.OPENERS:
+                stack.append([row and row[0], level, 0, token == b"{", row])
+            elif row is not None:
+                row[6] = offset + len(token)
+                rows.append(tuple(row))
+            if len(rows) >= BATCH_SIZE:
+                self._insert(rows)
+        self._insert(rows)
+        return count
+
+    def _insert(self, rows):
+        with self.connection:
+            self.connection.executemany("INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        del rows[:]
+
+    def lookup(self, components):
+        """
+        Returns the (start, end) byte ranges of the values at the parsed path components,
+        scanning below the deepest indexed value when the path goes deeper than the index.
+        """
+        node, start, end, depth = ROOT_ID, None, None, 0
+        row = self.connection.execute(
+            "SELECT start, end FROM nodes WHERE id = ?", (ROOT_ID,)).fetchone()
+        if row is None:
+            raise JSONIndexError("Index '{0}' is empty".format(self.path))
+        start, end = row
+        for i, component in enumerate(components):
+            if depth >= self.depth:
+                return self._scan(start, components[i:])
+            if isinstance(component, slice):
+                stop = component.stop if component.stop is not None else 1 << 62
+                return self.connection.execute(
+                    "SELECT start, end FROM nodes WHERE parent = ? AND key IS NULL "
+                    "AND position >= ? AND position < ? ORDER BY position",
+                    (node, component.start, stop)
+                ).fetchall()
+            if isinstance(component, int):
+                if component < 0:
+                    component += self.connection.execute(
+                        "SELECT COUNT(*) FROM nodes WHERE parent = ? AND key IS NULL", (node,)
+                    ).fetchone()[0]
+                row = self.connection.execute(
+                    "SELECT id, start, end FROM nodes WHERE parent = ? AND key IS NULL "
+                    "AND position = ?", (node, component)
+                ).fetchone()
+            else:
+                row = self.connection.execute(
+                    "SELECT id, start, end FROM nodes WHERE parent = ? AND key = ?",
+                    (node, component)
+                ).fetchone()
+            if row is None:
+                raise KeyError(component)
+            node, start, end = row
+            depth += 1
+        return [(start, end)]
+
+    def _scan(self, start, components):
+        with open(self.filepath, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                data.seek(start)
+                return scan(jsonstream.iter_tokens(data, offset=start), components)
+            finally:
+                data.close()
+
+
+def iter_range_tokens(filepath, ranges, as_list=False):
+    """
+    Yields the tokens of the values at the given byte ranges of filepath, read through mmap.
+    With as_list the values are yielded as the elements of one array.
+    """
+    with open(filepath, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if as_list:
+                yield None, b"["
+            for i, (start, end) in enumerate(ranges):
+                if i:
+                    yield None, b","
+                data.seek(start)
+                for token in jsonstream.iter_tokens(_BoundedReader(data, end), offset=start):
+                    yield token
+            if as_list:
+                yield None, b"]"
+        finally:
+            data.close()
+
+
+class _BoundedReader(object):
+
+    def __init__(self, data, end):
+        self.data = data
+        self.end = end
+
+    def read(self, size):
+        return self.data.read(max(0, min(size, self.end - self.data.tell())))
+
+
+def query(filepath, path, index=None):
+    """
+    Yields the tokens of the value at path in filepath, using index when given and otherwise
+    scanning the file from the start.  A slice yields its values as one array.
+    """
+    components = parse_path(path)
+    if index is not None:
+        ranges = index.lookup(components)
+    else:
+        with open(filepath, "rb") as f:
+            ranges = scan(jsonstream.iter_tokens(f), components)
+    as_list = bool(components) and isinstance(components[-1], slice)
+    return iter_range_tokens(filepath, ranges, as_list=as_list)
@@ -0,0 +1,112 @@
+"""
+An incremental JSON tokenizer and pretty printer for files too large to load.  Tokens are
+read from the file a chunk at a time and yielded with their byte offsets, so memory use
+depends on the chunk size and the longest single token rather than the size of the file.
+Tokens longer than a maximum size are refused, and so is input that cannot begin a token as
+soon as it is read.
+"""
+
+
+import re
+
+
+CHUNK_SIZE = 1 << 16
+MAX_TOKEN_SIZE = 1 << 26
+WRITE_TOKENS = 1 << 12
+TOKEN_RE = re.compile(
+    br'[ \t\r\n]*([{}\[\]:,]|"(?:[^"\\]|\\.)*"|-?[0-9][0-9.eE+\-]*|true|false|null)'
+)
+WHITESPACE_RE = re.compile(br'[ \t\r\n]*')
+LITERALS = (b"true", b"false", b"null")
+OPENERS = {b"{": b"}", b"[": b"]"}
+CLOSERS = frozenset([b"}", b"]"])
+
+
+class JSONStreamError(ValueError):
+    pass
+
+
+def _is_token_start(rest):
+    """
+    Returns whether the bytes rest, which no token matches, may still become one when more
+    is read: an unterminated string, a lone minus sign or the start of a literal.
+    """
+    return rest[:1] == b'"' or rest == b"-" or \
+        any(literal.startswith(rest) for literal in LITERALS)
+
+
+def iter_tokens(stream, chunk_size=CHUNK_SIZE, offset=0, max_token_size=MAX_TOKEN_SIZE):
+    """
+    Yields (offset, token) for every token read from the binary stream, where token is the
+    raw bytes of a punctuation character, string, number or literal.  offset is the position
+    in the stream the reading started from.
+    """
+    buf = b""
+    pos = 0
+    eof = False
+    while True:
+        end = len(buf)
+        partial = False
+        for match in iter(TOKEN_RE.scanner(buf, pos).match, None):
+            if match.end() == end and not eof:
+                # The token may continue in the next chunk
+                partial = True
+                break
+            yield offset + match.start(1), match.group(1)
+            pos = match.end()
+        start = WHITESPACE_RE.match(buf, pos).end()
+        if eof:
+            if start == len(buf):
+                return
+            raise JSONStreamError("Invalid JSON at byte {0}".format(offset + start))
+        if not partial and start < len(buf) and not _is_token_start(buf[start:]):
+            raise JSONStreamError("Invalid JSON at byte {0}".format(offset + start))
+        if len(buf) - start > max_token_size:
+            raise JSONStreamError("Token at byte {0} is longer than {1} bytes".format(
+                offset + start, max_token_size))
+        offset += pos
+        # Read at least as much as is buffered so a long token is not rescanned for every chunk
+        chunk = stream.read(max(chunk_size, len(buf) - pos))
+        buf = buf[pos:] + chunk
+        pos = 0
+        eof = not chunk
+
+
+def pretty_print(tokens, write, indent=4):
+    """
+    Writes the JSON document in tokens through write in the layout json.dumps uses with the
+    given indent, keeping the original text of every string and number.
+    """
+    pending = []
+    append = pending.append
+    newlines = [b"\n"]
+    stack = []
+    previous = None
+    for offset, token in tokens:
+        if token in CLOSERS:
+            if not stack or stack.pop() != token:
+                raise JSONStreamError("Unexpected '{0}' at byte {1}".format(
+                    token.decode("ascii"), offset))
+            if previous not in OPENERS:
+                append(newlines[len(stack)])
+            append(token)
+        elif token == b",":
+            append(token)
+            if len(pending) >= WRITE_TOKENS:
+                write(b"".join(pending))
+                del pending[:]
+        elif token == b":":
+            append(b": ")
+        else:
+            if previous in OPENERS or previous == b",":
+                append(newlines[len(stack)])
+            append(token)
+            if token in OPENERS:
+                stack.append(OPENERS[token])
+                if len(newlines) <= len(stack):
+                    newlines.append(b"\n" + b" " * (indent * len(stack)))
+        previous = token
+    if stack:
+        raise JSONStreamError("Unexpected end of JSON, {0} containers open".format(len(stack)))
+    append(b"\n")
+    write(b"".join(pending))
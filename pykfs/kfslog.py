@@ -1,5 +1,11 @@
+import re
+import copy
+import json
+import atexit
+import weakref
 import logging
-import logging.config
+import threading
+import collections
 import datetime as dt
 from pykfs.bashcolor import bashcolor
 
@@ -19,24 +25,34 @@ class KFSFormatter(logging.Formatter):
         fmt = fmt or self.default_format
         datefmt = datefmt or self.default_datefmt
         self.color = color
-        super(KFSFormatter, self).__init__(fmt, datefmt)
+        try:
+            super(KFSFormatter, self).__init__(fmt, datefmt, style="{")
+        except TypeError:
+            # Python 2 formatters take no style and do not check the format
+            super(KFSFormatter, self).__init__(fmt, datefmt)
 
     def format(self, record):
-        asctime = self.formatTime(record)
-        line = self._fmt.format(
+        fields = dict(record.__dict__)
+        # Replaces any message and asctime another formatter has already set on the record
+        fields.update(
             timeplus=self.gettimeplus(record),
             nameplus=self.getnameplus(record),
             levelplus=self.getlevelplus(record),
-            asctime=asctime,
-            message=record.msg,
-            **record.__dict__
+            asctime=self.formatTime(record),
+            message=record.getMessage(),
         )
+        line = self._fmt.format(**fields)
         if record.exc_info:
             line += "\n{0}".format(self.formatException(record.exc_info))
+        elif record.exc_text:
+            line += "\n{0}".format(self.formatExceptionText(record.exc_text))
         return line
 
     def formatException(self, exc_info):
         value = super(KFSFormatter, self).formatException(exc_info)
+        return self.formatExceptionText(value)
+
+    def formatExceptionText(self, value):
         value = value.replace("\n", "\n>>> ")
         value = ">>> {}".format(value)
         if self.color:
@@ -71,13 +87,260 @@ class KFSFormatter(logging.Formatter):
         return recorded.strftime(datefmt)
 
 
+class CachingKFSFormatter(KFSFormatter):
+    """
+    A KFSFormatter producing identical output that formats the time only once per second and
+    the name and level prefixes only once per logger and level.  Just the microseconds are
+    computed for every record.  The caches are shared by every handler and thread using the
+    formatter, so records are formatted one at a time.
+    """
+
+    def __init__(self, fmt=None, datefmt=None, color=False):
+        super(CachingKFSFormatter, self).__init__(fmt, datefmt, color)
+        self._lock = threading.Lock()
+        self._created = None
+        self._recorded = None
+        self._second = None
+        self._times = {}
+        self._names = {}
+        self._levels = {}
+
+    def _get_recorded(self, record):
+        if record.created != self._created:
+            self._created = record.created
+            self._recorded = dt.datetime.fromtimestamp(record.created)
+            second = self._recorded.replace(microsecond=0)
+            if second != self._second:
+                self._second = second
+                self._times = {}
+        return self._recorded
+
+    def format(self, record):
+        with self._lock:
+            return super(CachingKFSFormatter, self).format(record)
+
+    def formatTime(self, record, datefmt=None):
+        datefmt = datefmt or self.datefmt
+        recorded = self._get_recorded(record)
+        parts = self._times.get(datefmt)
+        if parts is None:
+            parts = [self._second.strftime(part) for part in _split_microseconds(datefmt)]
+            self._times[datefmt] = parts
+        if len(parts) == 1:
+            return parts[0]
+        return "{0:06d}".format(recorded.microsecond).join(parts)
+
+    def gettimeplus(self, record):
+        recorded = self._get_recorded(record)
+        prefix = self._times.get(None)
+        if prefix is None:
+            time = self.formatTime(record, "%H:%M:%S")
+            time = self.color and bashcolor(time, "GREEN_BOLD") or time
+            prefix = self._times[None] = "{0} :: ".format(time)
+        return "{0}{1:06d}".format(prefix, recorded.microsecond)
+
+    def getnameplus(self, record):
+        nameplus = self._names.get(record.name)
+        if nameplus is None:
+            nameplus = super(CachingKFSFormatter, self).getnameplus(record)
+            self._names[record.name] = nameplus
+        return nameplus
+
+    def getlevelplus(self, record):
+        levelplus = self._levels.get(record.levelname)
+        if levelplus is None:
+            levelplus = super(CachingKFSFormatter, self).getlevelplus(record)
+            self._levels[record.levelname] = levelplus
+        return levelplus
+
+
+def _split_microseconds(datefmt):
+    parts = [""]
+    for token in re.split("(%%|%f)", datefmt):
+        if token == "%f":
+            parts.append("")
+        else:
+            parts[-1] += token
+    return parts
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats each record as a single compact JSON object holding the timestamp, logger, level,
+    message, exception and any extra fields passed to the logging call.
+    """
+
+    reserved = frozenset(logging.makeLogRecord({}).__dict__) | frozenset(["message", "asctime"])
+
+    def __init__(self, fmt=None, datefmt=None, extra=True):
+        super(JSONFormatter, self).__init__(fmt, datefmt)
+        self.extra = extra
+        self.encoder = json.JSONEncoder(separators=(",", ":"), default=repr)
+
+    def format(self, record):
+        entry = {
+            "timestamp": record.created,
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if self.extra:
+            for key, value in record.__dict__.items():
+                if key not in self.reserved:
+                    entry[key] = value
+        return self.encoder.encode(entry)
+
+
+QUEUE_POLICIES = ("block", "drop_oldest", "drop_newest")
+WRITER_POLL_INTERVAL = 1.0
+BATCHED_HANDLER_TYPES = (logging.StreamHandler, logging.FileHandler)
+_EXCEPTION_FORMATTER = logging.Formatter()
+
+
+class QueuedHandler(logging.Handler):
+    """
+    Puts records on a bounded in-memory queue that a background thread writes out to the
+    wrapped handlers in batches, so a slow stream never blocks the code doing the logging.
+    When the queue is full, records are either waited on, or the oldest or newest record is
+    dropped and counted in 'dropped', depending on the policy.  Once the writer thread has
+    stopped, records are written straight to the handlers instead.
+    """
+
+    def __init__(self, handlers, maxsize=10000, policy="block", batch_size=256):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError("Unknown queue policy '{0}', expected one of {1}"
+                             .format(policy, ", ".join(QUEUE_POLICIES)))
+        if maxsize < 1:
+            raise ValueError("Queue size must be at least 1, got {0}".format(maxsize))
+        super(QueuedHandler, self).__init__()
+        self.handlers = list(handlers)
+        self.maxsize = maxsize
+        self.policy = policy
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.records = collections.deque()
+        self.condition = threading.Condition()
+        self.writing = False
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="pykfs-log-writer")
+        self.thread.daemon = True
+        self.thread.start()
+        _QUEUED_HANDLERS.add(self)
+
+    def prepare(self, record):
+        """
+        Returns a copy of record with its message and exception already formatted, since the
+        arguments may change and the traceback may be gone before the writer thread gets it.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _EXCEPTION_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            record = self.prepare(record)
+        except Exception:
+            self.handleError(record)
+            return
+        with self.condition:
+            while not self.closed and self.thread.is_alive():
+                if len(self.records) < self.maxsize:
+                    self.records.append(record)
+                    self.condition.notify_all()
+                    return
+                if self.policy == "drop_newest":
+                    self.dropped += 1
+                    return
+                if self.policy == "drop_oldest":
+                    self.records.popleft()
+                    self.dropped += 1
+                    continue
+                # Wake up now and then, so a writer thread that died cannot block us forever
+                self.condition.wait(WRITER_POLL_INTERVAL)
+        self._write([record])
+
+    def flush(self):
+        with self.condition:
+            while (self.records or self.writing) and self.thread.is_alive():
+                self.condition.wait(WRITER_POLL_INTERVAL)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+        super(QueuedHandler, self).close()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()
+                while not self.records and not self.closed:
+                    self.condition.wait()
+                if not self.records:
+                    return
+                count = min(self.batch_size, len(self.records))
+                batch = [self.records.popleft() for _ in range(count)]
+                self.writing = True
+                self.condition.notify_all()
+            self._write(batch)
+
+    def _write(self, batch):
+        """
+        Writes batch to every handler.  Plain stream and file handlers get the whole batch in
+        one write; any other handler, such as the rotating file handlers, handles each record
+        itself so its emit logic still runs.
+        """
+        for handler in self.handlers:
+            if type(handler) not in BATCHED_HANDLER_TYPES or handler.stream is None:
+                for record in batch:
+                    handler.handle(record)
+                continue
+            records = [record for record in batch
+                       if record.levelno >= handler.level and handler.filter(record)]
+            if not records:
+                continue
+            terminator = getattr(handler, "terminator", "\n")
+            handler.acquire()
+            try:
+                handler.stream.write("".join(
+                    [handler.format(record) + terminator for record in records]
+                ))
+                handler.flush()
+            except Exception:
+                handler.handleError(records[0])
+            finally:
+                handler.release()
+
+
+_QUEUED_HANDLERS = weakref.WeakSet()
+
+
+@atexit.register
+def _close_queued_handlers():
+    for handler in list(_QUEUED_HANDLERS):
+        handler.close()
+
+
 CONSOLE_HANDLER = {
     "class": "logging.StreamHandler",
     "formatter": "console",
 }
 
 CONSOLE_FORMATTER = {
-    "()": "pykfs.kfslog.KFSFormatter",
+    "()": "pykfs.kfslog.CachingKFSFormatter",
     "fmt": "> {timeplus} > {nameplus} > {levelplus} {message}",
     "color": True,
 }
@@ -88,13 +351,17 @@ ROOT_HANDLER = {
 }
 
 ROOT_FORMATTER = {
-    "()": "pykfs.kfslog.KFSFormatter",
+    "()": "pykfs.kfslog.CachingKFSFormatter",
     "fmt": "> {timeplus} > {levelplus} {message}",
     "color": True,
 }
 
+JSON_FORMATTER = {
+    "()": "pykfs.kfslog.JSONFormatter",
+}
+
 FILE_FORMATTER = {
-    "()": "pykfs.kfslog.KFSFormatter",
+    "()": "pykfs.kfslog.CachingKFSFormatter",
     "fmt": "> {asctimeplus} > {nameplus} > {levelplus} {message}",
     "color": False,
 }
@@ -107,6 +374,7 @@ DEFAULT_HANDLERS = {
 DEFAULT_FORMATTERS = {
     "console": CONSOLE_FORMATTER,
     "file": FILE_FORMATTER,
+    "json": JSON_FORMATTER,
     "root": ROOT_FORMATTER,
 }
 
@@ -117,7 +385,11 @@ DEFAULT_LOGGER_CONFIG = {
 
 
 def quick_log_config(loggers=None, handlers=DEFAULT_HANDLERS, formatters=DEFAULT_FORMATTERS,
-                     level="INFO"):
+                     level="INFO", queued=False, queue_size=10000, queue_policy="block",
+                     handler_formatters=None):
+    import logging.config
+    if handler_formatters:
+        handlers = _set_handler_formatters(handlers, handler_formatters)
     configdict = {
         "version": 1,
         "handlers": handlers,
@@ -129,9 +401,28 @@ def quick_log_config(loggers=None, handlers=DEFAULT_HANDLERS, formatters=DEFAULT
     else:
         configdict["root"] = _get_default_root_config(level)
     logging.config.dictConfig(configdict)
+    if queued:
+        for name in configdict.get("loggers") or [None]:
+            _queue_logger_handlers(logging.getLogger(name), queue_size, queue_policy)
     return configdict
 
 
+def _set_handler_formatters(handlers, handler_formatters):
+    handlers = dict((name, config.copy()) for name, config in handlers.items())
+    for name, formatter in handler_formatters.items():
+        if name not in handlers:
+            raise KeyError("Cannot set formatter on unknown handler '{0}'".format(name))
+        handlers[name]["formatter"] = formatter
+    return handlers
+
+
+def _queue_logger_handlers(logger, queue_size, queue_policy):
+    handlers = list(logger.handlers)
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(QueuedHandler(handlers, maxsize=queue_size, policy=queue_policy))
+
+
 def _get_loggers_config(loggers, level):
     if isinstance(loggers, dict):
         return
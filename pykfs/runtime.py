@@ -0,0 +1,87 @@
+"""
+Private runtime directories for the unix sockets of the pykfs daemons.  A socket in a shared
+directory such as /tmp can be bound first by any local user, so sockets are kept in a
+directory that only the service user owns and can enter, and that ownership is checked by
+both the daemons and their clients.
+"""
+
+
+import os
+import stat
+import errno
+import tempfile
+
+
+RUNTIME_DIR_NAME = "pykfs"
+
+
+class UnsafePathError(OSError):
+    pass
+
+
+def get_runtime_dir():
+    """
+    Returns the runtime directory of the current user: pykfs under $XDG_RUNTIME_DIR when that
+    is set, otherwise pykfs-UID in the temporary directory.
+    """
+    base = os.environ.get("XDG_RUNTIME_DIR")
+    if base:
+        return os.path.join(base, RUNTIME_DIR_NAME)
+    return os.path.join(tempfile.gettempdir(), "{0}-{1}".format(RUNTIME_DIR_NAME, os.getuid()))
+
+
+def get_runtime_path(name):
+    return os.path.join(get_runtime_dir(), name)
+
+
+def check_private_dir(path, create=False):
+    """
+    Raises UnsafePathError unless path is a directory, not a symlink, owned by the current
+    user that no other user can write to or enter.  With create a missing directory is made.
+    """
+    if create:
+        try:
+            os.makedirs(path, 0o700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise UnsafePathError("'{0}' is not a directory".format(path))
+    if info.st_uid != os.getuid():
+        raise UnsafePathError("'{0}' is owned by uid {1}, not {2}".format(
+            path, info.st_uid, os.getuid()))
+    if info.st_mode & 0o077:
+        raise UnsafePathError("'{0}' is accessible by other users (mode {1:o})".format(
+            path, stat.S_IMODE(info.st_mode)))
+
+
+def prepare_socket_path(path):
+    """
+    Makes sure path can be bound by a daemon: its directory is created or checked to be
+    private, and a stale socket left there by the current user is removed.  Anything else
+    already at path raises UnsafePathError.
+    """
+    check_private_dir(os.path.dirname(os.path.abspath(path)), create=True)
+    try:
+        info = os.lstat(path)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return
+        raise
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        raise UnsafePathError("Refusing to replace '{0}', which is not a socket owned by "
+                              "uid {1}".format(path, os.getuid()))
+    os.remove(path)
+
+
+def is_private_socket(path):
+    """
+    Returns whether the socket at path is in a private directory of the current user, so a
+    client can trust the daemon listening on it.
+    """
+    try:
+        check_private_dir(os.path.dirname(os.path.abspath(path)))
+    except OSError:
+        return False
+    return True
@@ -1,8 +1,11 @@
 import sys
 import os
+import copy
+import json
+import time
+import shlex
 import argparse
 import pykfs
-from pykfs.settings import get_script_settings
 from pykfs.kfslog import quick_log_config
 import logging
 
@@ -55,6 +58,52 @@ SETTINGS_FILE_ARG = {
 }
 
 
+PROFILE_ARG = {
+    "name": "profile",
+    "option_strings": ["--profile"],
+    "const": True,
+    "action": "store_const",
+    "default": False,
+    "help": "Print the wall and CPU time spent in each phase of the script to stderr.",
+}
+
+
+PROFILE_OUTPUT_ARG = {
+    "name": "profile_output",
+    "option_strings": ["--profile-output"],
+    "type": str,
+    "action": "store",
+    "metavar": "PATH",
+    "default": None,
+    "help": "Run the script under cProfile and write the stats to PATH.  Implies --profile.",
+}
+
+
+_cpu_time = getattr(time, "process_time", None) or time.clock
+
+
+def parse_batch_line(line):
+    if line.lstrip().startswith("["):
+        return [str(token) for token in json.loads(line)]
+    return shlex.split(line)
+
+
+def _run_batch_entry(entry):
+    cls, tokens, settings = entry
+    script = cls()
+    try:
+        # Options override settings by removing them, which must not carry over to other runs
+        script.run(tokens, settings=copy.deepcopy(settings))
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else int(e.code is not None)
+    except Exception as e:
+        sys.stderr.write("ERROR: {0}\n".format(e))
+        return script.get_error_code(e)
+    if script.failure is not None:
+        return script.get_error_code(script.failure)
+    return 0
+
+
 def get_script_data_dir():
     return os.path.join(pykfs.get_data_dir(), "scripts")
 
@@ -66,8 +115,10 @@ class Script(object):
     use_log_level_arg = True
     use_settings_file = True
     use_log_for_exceptions = True
+    use_profile_arg = True
     args = []
     conflicts = []
+    requires = []
     log = logging
 
     @classmethod
@@ -77,9 +128,57 @@ class Script(object):
     @classmethod
     def execute(cls, settings=None):
         tokens = sys.argv[1:]
+        if tokens[:1] == ["--batch"]:
+            sys.exit(cls.execute_batch(tokens[1:], settings=settings))
         script = cls()
         sys.exit(script.run(tokens, settings=settings))
 
+    @classmethod
+    def execute_batch(cls, tokens, settings=None):
+        parser = argparse.ArgumentParser(
+            prog="{0} --batch".format(os.path.basename(sys.argv[0])),
+            description="Runs the script once for every line of FILE, each line holding the "
+                        "arguments for one run either shell quoted or as a JSON list.",
+        )
+        parser.add_argument("file", nargs="?", default="-", metavar="FILE",
+                            help="The file to read argument lines from.  Defaults to stdin")
+        parser.add_argument("-j", "--processes", type=int, default=None, metavar="N",
+                            help="Spread the runs over a pool of N processes")
+        options = parser.parse_args(tokens)
+        if options.file == "-":
+            lines = sys.stdin.readlines()
+        else:
+            with open(options.file) as f:
+                lines = f.readlines()
+        entries = [parse_batch_line(line) for line in lines if line.strip()]
+        statuses = cls.run_batch(entries, settings=settings, processes=options.processes)
+        return int(any(statuses))
+
+    @classmethod
+    def run_batch(cls, entries, settings=None, processes=None):
+        """
+        Runs a fresh instance of the script in this process for every list of tokens in
+        entries, returning the exit status of each run.
+        """
+        tasks = [(cls, tokens, settings) for tokens in entries]
+        pool = None
+        if processes and processes > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(processes)
+            results = pool.imap(_run_batch_entry, tasks)
+        else:
+            results = (_run_batch_entry(task) for task in tasks)
+        statuses = []
+        try:
+            for index, status in enumerate(results):
+                statuses.append(status)
+                sys.stderr.write("batch entry {0}: exit status {1}\n".format(index + 1, status))
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        return statuses
+
     def setup_logging(self):
         quick_log_config(level=self.loglevel)
 
@@ -93,24 +192,59 @@ class Script(object):
         return data_file_dir
 
     def run(self, tokens, settings=None):
+        self.phase_times = []
+        self.failure = None
         try:
             self.log_setup = False
             self.tokens = tokens
-            self._parse_args()
-            self._load_settings(settings)
-            self._determine_arg_values()
-            self.setup_logging()
+            self._run_phase("parse_args", self._parse_args)
+            self._run_phase("load_settings", self._load_settings, settings)
+            self._run_phase("determine_arg_values", self._determine_arg_values)
+            self._run_phase("setup_logging", self.setup_logging)
             self.log_setup = True
             self._log_all_args_parsed()
-            self.do_script()
+            self._run_phase("do_script", self._do_script)
         except:
+            self.failure = sys.exc_info()[1]
             self.on_failure()
             if self.log_setup and self.use_log_for_exceptions:
                 self.log.exception("Script failed, Exception encountered:")
             else:
                 raise
+        finally:
+            if getattr(self, "profile", False) or getattr(self, "profile_output", None):
+                self._print_phase_times()
         return 0
 
+    def _run_phase(self, name, func, *args):
+        wall, cpu = time.time(), _cpu_time()
+        try:
+            return func(*args)
+        finally:
+            self.phase_times.append((name, time.time() - wall, _cpu_time() - cpu))
+
+    def _do_script(self):
+        if not getattr(self, "profile_output", None):
+            return self.do_script()
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(self.do_script)
+        finally:
+            profiler.dump_stats(self.profile_output)
+
+    def _print_phase_times(self):
+        lines = ["{0:<24} {1:>10} {2:>10}".format("Phase", "Wall (s)", "CPU (s)")]
+        for name, wall, cpu in self.phase_times:
+            lines.append("{0:<24} {1:>10.4f} {2:>10.4f}".format(name, wall, cpu))
+        lines.append("{0:<24} {1:>10.4f} {2:>10.4f}".format(
+            "total", sum(t[1] for t in self.phase_times), sum(t[2] for t in self.phase_times)
+        ))
+        if getattr(self, "profile_output", None):
+            lines.append("cProfile stats for do_script written to '{0}'"
+                         .format(self.profile_output))
+        self.stderr("\n".join(lines) + "\n")
+
     def _log_all_args_parsed(self):
         self.log.info("Arguments parsed successfully.")
         self.log.debug("Argument values are:")
@@ -123,6 +257,7 @@ class Script(object):
     def _load_settings(self, settings):
         self.settings = settings or {}
         if not self.settings and self.use_settings_file:
+            from pykfs.settings import get_script_settings
             self.settings = get_script_settings(self.get_script_name())
         for key in self.settings:
             if key not in self.run_args:
@@ -149,6 +284,9 @@ class Script(object):
             self._add_arg(**SETTINGS_FILE_ARG)
         if self.use_log_level_arg:
             self._add_arg(**get_loglevel_arg(self.default_log_level))
+        if self.use_profile_arg:
+            self._add_arg(**PROFILE_ARG)
+            self._add_arg(**PROFILE_OUTPUT_ARG)
         self.options = self.parser.parse_args(self.tokens)
 
     def _add_arg(self, name, option_strings=[], default=None, **kwargs):
@@ -175,6 +313,8 @@ class Script(object):
             if hasattr(self, argname):
                 raise KeyError("Conflicting variable name '{}' on script".format(argname))
             setattr(self, argname, value)
+        for requirement in self.requires:
+            self._check_required(*requirement)
 
     def _check_conflicting(self, option1, option2):
         hasvalue1 = getattr(self.options, option1) != None
@@ -194,6 +334,16 @@ class Script(object):
                 "option".format(option1, option2)
             )
 
+    def _check_required(self, option, required):
+        given = getattr(self.options, option) is not None
+        if not given and self.settings.get(option) not in (None, False):
+            given = True
+        if given and not getattr(self, required):
+            self.error(
+                "The '--{0}' option can only be used with the '--{1}' "
+                "option".format(option, required)
+            )
+
     def _overwrite_setting(self, setting):
             self.settings.pop(setting, None)
 
@@ -0,0 +1,183 @@
+"""
+A parallel file content search used by the gref script.  Files are listed through
+'git ls-files' when searching inside a repository so ignored paths are skipped, binary files
+are skipped by looking for a NUL byte near the start, and the remaining files are spread over
+a process pool that scans each one through mmap.
+"""
+
+
+import os
+import re
+import mmap
+import logging
+import subprocess
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+BINARY_CHECK_SIZE = 8192
+SKIPPED_DIRECTORIES = frozenset([".git", ".hg", ".svn"])
+
+_pattern = None
+
+
+def list_git_files(root):
+    """
+    Returns the files under root tracked by git or untracked but not ignored, or None if root
+    is not inside a git repository.  A path with merge conflicts is listed once per stage by
+    git, but returned only once.
+    """
+    try:
+        process = subprocess.Popen(
+            ["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+            cwd=root, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+    except OSError:
+        return None
+    output, _ = process.communicate()
+    if process.returncode != 0:
+        return None
+    files = []
+    seen = set()
+    for path in output.split(b"\0"):
+        if path and path not in seen:
+            seen.add(path)
+            files.append(path.decode("utf-8", "surrogateescape") if bytes is not str else path)
+    return files
+
+
+def walk_files(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIPPED_DIRECTORIES)
+        prefix = os.path.relpath(dirpath, root)
+        prefix = "" if prefix == os.curdir else prefix + os.sep
+        for filename in sorted(filenames):
+            yield prefix + filename
+
+
+def list_files(root, use_git=True):
+    """
+    Returns the paths, relative to root, that should be searched under root.  The paths are
+    not checked to be files.
+    """
+    files = list_git_files(root) if use_git else None
+    if files is None:
+        files = walk_files(root)
+    return files
+
+
+def iter_files(root, use_git=True):
+    """
+    Yields the paths, relative to root, of every file that should be searched under root.
+    """
+    for path in list_files(root, use_git=use_git):
+        if os.path.isfile(os.path.join(root, path)):
+            yield path
+
+
+def is_binary(chunk):
+    return b"\0" in chunk[:BINARY_CHECK_SIZE]
+
+
+def scan(data, pattern):
+    """
+    Returns a (line number, line) pair for every line in data containing a match of pattern.
+    Like grep, a trailing newline ends the last line rather than starting an empty one, so a
+    pattern matching the empty string does not match past it.
+    """
+    results = []
+    lineno = 1
+    counted = 0
+    pos = 0
+    size = len(data)
+    last = size - 1 if data[size - 1:size] == b"\n" else size
+    while pos <= last:
+        match = pattern.search(data, pos)
+        if not match:
+            break
+        start = data.rfind(b"\n", 0, match.start()) + 1
+        end = data.find(b"\n", match.start())
+        if end < 0:
+            end = size
+        lineno += data[counted:start].count(b"\n")
+        counted = start
+        results.append((lineno, data[start:end]))
+        pos = end + 1
+    return results
+
+
+def search_file(root, path, pattern):
+    """
+    Searches the file at path with the compiled bytes pattern, returning a list of
+    (line number, line) matches.  Binary and unreadable files return no matches.
+    """
+    try:
+        with open(os.path.join(root, path), "rb") as f:
+            if is_binary(f.read(BINARY_CHECK_SIZE)):
+                return []
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return scan(data, pattern)
+            finally:
+                data.close()
+    except (IOError, OSError) as e:
+        LOG.warning("Unable to search '{0}': {1}".format(path, e))
+        return []
+
+
+def compile_pattern(pattern, ignore_case=False):
+    if not isinstance(pattern, bytes):
+        pattern = pattern.encode("utf-8")
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    return re.compile(pattern, flags)
+
+
+def _init_worker(pattern, flags):
+    global _pattern
+    _pattern = re.compile(pattern, flags)
+
+
+def _search_worker(task):
+    root, path = task
+    return path, search_file(root, path, _pattern)
+
+
+def search(pattern, root=".", processes=None, ignore_case=False, use_git=True, files=None,
+           chunksize=16):
+    """
+    Yields (path, line number, line) for every matching line under root, in file order.  The
+    files are searched by a pool of processes, defaulting to one per cpu, and the results are
+    yielded as soon as every earlier file has finished.  processes=1 searches in this process.
+    """
+    compiled = compile_pattern(pattern, ignore_case=ignore_case)
+    if files is None:
+        files = iter_files(root, use_git=use_git)
+    tasks = ((root, path) for path in files)
+    pool = None
+    if processes == 1:
+        _init_worker(compiled.pattern, compiled.flags)
+        results = (_search_worker(task) for task in tasks)
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes, _init_worker, (compiled.pattern, compiled.flags))
+        results = pool.imap(_search_worker, tasks, chunksize)
+    try:
+        for path, matches in results:
+            for lineno, line in matches:
+                yield path, lineno, line
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+
+def format_match(path, lineno, line):
+    """
+    Formats a match the way 'grep -n -H' does, as bytes.
+    """
+    if not isinstance(path, bytes):
+        path = path.encode("utf-8", "surrogateescape") if bytes is not str else path
+    return path + ":{0}:".format(lineno).encode("ascii") + line + b"\n"
@@ -1,29 +1,116 @@
+import os
 import os.path
-import yaml
+import json
 import logging
 
 
 LOG = logging.getLogger(__name__)
+CACHE_SUFFIX = ".cache"
 
 
 def get_default_settings_file_path():
     return os.path.expanduser("~/.pykfsrc")
 
 
+def get_cache_file_path(settings_file):
+    return "{0}{1}".format(settings_file, CACHE_SUFFIX)
+
+
 def get_script_settings(script_name, settings_file=None):
     settings = {}
     if script_name:
-        d = get_settings_dict(settings_file)
-        settings = d and script_name in d["scripts"] and d["scripts"][script_name] or {}
+        settings = get_cached_script_settings(script_name, settings_file)
     return settings
 
 
+def get_cached_script_settings(script_name, settings_file=None):
+    """
+    Returns the settings section of a single script from a compiled cache kept next to the
+    settings file.  The cache is rebuilt whenever the path, mtime or size of the settings
+    file changes, and only the requested section is decoded.  The cache is plain JSON, and a
+    section that JSON cannot hold as it is, such as one with dates or integer keys, is read
+    from the settings file instead.
+    """
+    if not settings_file:
+        settings_file = get_default_settings_file_path()
+    if not os.path.isfile(settings_file):
+        return {}
+    stat = os.stat(settings_file)
+    key = [os.path.abspath(settings_file), getattr(stat, "st_mtime_ns", stat.st_mtime),
+           stat.st_size]
+    cache_file = get_cache_file_path(settings_file)
+    cache = _read_cache(cache_file, key)
+    if cache is None:
+        cache = _build_cache(key, get_settings_dict(settings_file))
+        _write_cache(cache_file, cache)
+    if script_name not in cache["scripts"]:
+        return {}
+    section = cache["scripts"][script_name]
+    if section is None:
+        d = get_settings_dict(settings_file)
+        section = d["scripts"][script_name]
+    else:
+        section = json.loads(section)
+    return section or {}
+
+
+def _read_cache(cache_file, key):
+    """
+    Returns the cache in cache_file if it is up to date for key.  A cache that another user
+    owns or could have written to is ignored.
+    """
+    try:
+        stat = os.stat(cache_file)
+        if stat.st_uid != os.getuid() or stat.st_mode & 0o022:
+            LOG.warning("Ignoring settings cache '{0}', which other users can write to"
+                        .format(cache_file))
+            return None
+        with open(cache_file) as f:
+            cache = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(cache, dict) or cache.get("key") != key or \
+            not isinstance(cache.get("scripts"), dict):
+        LOG.debug("Settings cache '{0}' is out of date".format(cache_file))
+        return None
+    return cache
+
+
+def _encode_section(section):
+    try:
+        encoded = json.dumps(section)
+    except (TypeError, ValueError):
+        return None
+    return encoded if json.loads(encoded) == section else None
+
+
+def _build_cache(key, d):
+    scripts = d and d.get("scripts") or {}
+    return {
+        "key": key,
+        "scripts": dict((name, _encode_section(section)) for name, section in scripts.items()),
+    }
+
+
+def _write_cache(cache_file, cache):
+    tmpfile = "{0}.{1}.tmp".format(cache_file, os.getpid())
+    try:
+        fd = os.open(tmpfile, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(cache, f)
+        os.rename(tmpfile, cache_file)
+    except (IOError, OSError) as e:
+        LOG.debug("Unable to write settings cache '{0}': {1}".format(cache_file, e))
+
+
 def get_settings_dict(settings_file=None):
     if not settings_file:
         settings_file = get_default_settings_file_path()
     if not os.path.isfile(settings_file):
         return None
+    import yaml
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
     d = None
     with open(settings_file) as f:
-        d = yaml.load(f)
+        d = yaml.load(f, Loader=loader)
     return d
@@ -0,0 +1,288 @@
+"""
+An on-disk trigram index of the files searched by gref.  Every indexed file is stored with
+the set of lower cased byte trigrams it contains, so a search only has to scan the files
+containing every trigram of the literal text its pattern requires.  The index is updated
+incrementally, re-reading only the files whose mtime or size changed since the last search.
+"""
+
+
+import os
+import stat
+import sqlite3
+import logging
+import subprocess
+from pykfs import search
+
+try:
+    import re._parser as sre_parse
+except ImportError:
+    import sre_parse
+
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.NullHandler())
+
+DEFAULT_INDEX_NAME = "pykfs-trigrams.sqlite"
+MAX_INDEXED_SIZE = 16 << 20
+BATCH_SIZE = 500
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime INTEGER, size INTEGER, indexed INTEGER
+);
+CREATE TABLE IF NOT EXISTS postings (
+    trigram INTEGER, file INTEGER, PRIMARY KEY (trigram, file)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_file ON postings (file);
+"""
+
+# Files that are not indexed are either binary, and never match, or too large to index, and
+# are always searched
+NOT_INDEXED = 0
+INDEXED = 1
+BINARY = 2
+
+
+def find_repository(root):
+    """
+    Returns the (git directory, top level directory) of the work tree containing root, or
+    None when root is not inside one.
+    """
+    try:
+        process = subprocess.Popen(["git", "rev-parse", "--git-dir", "--show-toplevel"],
+                                   cwd=root, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output, _ = process.communicate()
+    except OSError:
+        return None
+    lines = output.decode("utf-8").splitlines()
+    if process.returncode != 0 or len(lines) != 2:
+        return None
+    return os.path.join(root, lines[0]), lines[1]
+
+
+def get_default_index_path(root):
+    """
+    Returns the index path for root, inside the git directory when root is in a repository
+    and in root itself otherwise.
+    """
+    repository = find_repository(root)
+    if repository is not None:
+        return os.path.join(repository[0], DEFAULT_INDEX_NAME)
+    return os.path.join(root, "." + DEFAULT_INDEX_NAME)
+
+
+def get_trigrams(data):
+    """
+    Returns the set of lower cased trigrams in data as integers.
+    """
+    data = data.lower()
+    grams = set(zip(data, data[1:], data[2:]))
+    if bytes is str:
+        grams = set((ord(a), ord(b), ord(c)) for a, b, c in grams)
+    return set((a << 16) | (b << 8) | c for a, b, c in grams)
+
+
+def _literal_sequence(parsed):
+    """
+    Returns the bytes matched by the parsed pattern when it is only literals, otherwise None.
+    """
+    literals = []
+    for op, value in parsed:
+        if op is sre_parse.LITERAL:
+            literals.append(value)
+        elif op is sre_parse.SUBPATTERN:
+            inner = _literal_sequence(value[-1])
+            if inner is None:
+                return None
+            literals.extend(inner)
+        else:
+            return None
+    return literals
+
+
+def _literal_runs(parsed, runs):
+    """
+    Appends every run of literal bytes a match of the parsed pattern must contain to runs,
+    returning the run still open at the end of the sequence.
+    """
+    current = []
+    for op, value in parsed:
+        literals = _literal_sequence([(op, value)])
+        if literals is not None:
+            current.extend(literals)
+            continue
+        repeated = op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and value[0] >= 1
+        if repeated:
+            literals = _literal_sequence(value[2])
+            if literals:
+                # The first repetition follows the text before and the last precedes the
+                # text after, whatever comes between them
+                current.extend(literals)
+                runs.append(current)
+                current = list(literals)
+                continue
+        if current:
+            runs.append(current)
+            current = []
+        if op is sre_parse.SUBPATTERN or repeated:
+            last = _literal_runs(value[-1] if op is sre_parse.SUBPATTERN else value[2], runs)
+            if last:
+                runs.append(last)
+    return current
+
+
+def required_literals(pattern):
+    """
+    Returns the lower cased literal byte strings that any match of the bytes pattern must
+    contain.  An empty list means the pattern places no requirement on the text.
+    """
+    runs = []
+    last = _literal_runs(sre_parse.parse(pattern), runs)
+    if last:
+        runs.append(last)
+    return [bytes(bytearray(run)).lower() for run in runs]
+
+
+def required_trigrams(pattern):
+    trigrams = set()
+    for literal in required_literals(pattern):
+        trigrams.update(get_trigrams(literal))
+    return trigrams
+
+
+def read_file_trigrams(path):
+    """
+    Returns the index state and trigrams of the file at path.
+    """
+    with open(path, "rb") as f:
+        data = f.read(MAX_INDEXED_SIZE + 1)
+    if search.is_binary(data):
+        return BINARY, set()
+    if len(data) > MAX_INDEXED_SIZE:
+        return NOT_INDEXED, set()
+    return INDEXED, get_trigrams(data)
+
+
+class TrigramIndex(object):
+    """
+    A SQLite trigram index of the files under root.  Inside a repository the one index in the
+    git directory is shared by searches from every directory of the work tree, so paths are
+    stored relative to the top level and each update only touches the files under root.
+    """
+
+    def __init__(self, root, path=None, use_git=True):
+        self.root = root
+        self.use_git = use_git
+        repository = find_repository(root)
+        if repository is not None:
+            self.top = repository[1]
+            self.path = path or os.path.join(repository[0], DEFAULT_INDEX_NAME)
+        else:
+            self.top = root
+            self.path = path or os.path.join(root, "." + DEFAULT_INDEX_NAME)
+        prefix = os.path.relpath(os.path.realpath(root), os.path.realpath(self.top))
+        self.prefix = "" if prefix == os.curdir else prefix.replace(os.sep, "/") + "/"
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(SCHEMA)
+        self.files = []
+
+    def close(self):
+        self.connection.close()
+
+    def update(self):
+        """
+        Brings the index up to date with the files under root, returning the number of files
+        read.  The current file list, relative to root, is kept in self.files.
+        """
+        prefix = self.prefix
+        known = dict(
+            (path, (fileid, mtime, size)) for fileid, path, mtime, size
+            in self.connection.execute("SELECT id, path, mtime, size FROM files")
+            if path.startswith(prefix)
+        )
+        self.files = []
+        changed = []
+        index_path = os.path.relpath(self.path, self.root)
+        for path in search.list_files(self.root, use_git=self.use_git):
+            try:
+                info = os.stat(os.path.join(self.root, path))
+            except OSError:
+                continue
+            if not stat.S_ISREG(info.st_mode) or path == index_path:
+                continue
+            self.files.append(path)
+            mtime = int(info.st_mtime * 1e9)
+            entry = known.pop(prefix + path, None)
+            if entry is None or entry[1:] != (mtime, info.st_size):
+                changed.append((path, entry and entry[0], mtime, info.st_size))
+        LOG.info("Indexing {0} changed files, removing {1}".format(len(changed), len(known)))
+        with self.connection:
+            for fileid, mtime, size in known.values():
+                self._remove(fileid)
+        for start in range(0, len(changed), BATCH_SIZE):
+            with self.connection:
+                for path, fileid, mtime, size in changed[start:start + BATCH_SIZE]:
+                    self._add(path, fileid, mtime, size)
+        return len(changed)
+
+    def _remove(self, fileid):
+        self.connection.execute("DELETE FROM postings WHERE file = ?", (fileid,))
+        self.connection.execute("DELETE FROM files WHERE id = ?", (fileid,))
+
+    def _add(self, path, fileid, mtime, size):
+        if fileid is not None:
+            self._remove(fileid)
+        try:
+            state, trigrams = read_file_trigrams(os.path.join(self.root, path))
+        except (IOError, OSError) as e:
+            LOG.warning("Unable to index '{0}': {1}".format(path, e))
+            state, trigrams, mtime = NOT_INDEXED, set(), None
+        cursor = self.connection.execute(
+            "INSERT INTO files (path, mtime, size, indexed) VALUES (?, ?, ?, ?)",
+            (self.prefix + path, mtime, size, state)
+        )
+        fileid = cursor.lastrowid
+        self.connection.executemany("INSERT INTO postings VALUES (?, ?)",
+                                    ((trigram, fileid) for trigram in trigrams))
+
+    def candidates(self, pattern):
+        """
+        Returns the paths, in file order, that may contain a match of the compiled bytes
+        pattern.  Call update first.
+        """
+        trigrams = required_trigrams(pattern.pattern)
+        if not trigrams:
+            return list(self.files)
+        ids = None
+        for trigram in sorted(trigrams):
+            found = set(row[0] for row in self.connection.execute(
+                "SELECT file FROM postings WHERE trigram = ?", (trigram,)
+            ))
+            ids = found if ids is None else ids & found
+            if not ids:
+                break
+        paths = set(row[0] for row in self.connection.execute(
+            "SELECT path FROM files WHERE indexed = ?", (NOT_INDEXED,)
+        ))
+        ids = list(ids)
+        for start in range(0, len(ids), BATCH_SIZE):
+            batch = ids[start:start + BATCH_SIZE]
+            paths.update(row[0] for row in self.connection.execute(
+                "SELECT path FROM files WHERE id IN ({0})".format(",".join("?" * len(batch))),
+                batch
+            ))
+        return [path for path in self.files if self.prefix + path in paths]
+
+
+def search_indexed(pattern, root=".", index_path=None, ignore_case=False, use_git=True,
+                   **kwargs):
+    """
+    Updates the trigram index of root and searches only the candidate files it returns.
+    Takes the same arguments as pykfs.search.search.
+    """
+    index = TrigramIndex(root, path=index_path, use_git=use_git)
+    try:
+        index.update()
+        files = index.candidates(search.compile_pattern(pattern, ignore_case=ignore_case))
+    finally:
+        index.close()
+    return search.search(pattern, root=root, ignore_case=ignore_case, files=files, **kwargs)
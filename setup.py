@@ -29,7 +29,8 @@ setup(
     packages=['pykfs', 'pykfs.git', 'pykfs.git.hook'],
     scripts=[
         'scripts/grollback', 'scripts/grebase', 'scripts/view_json', 'scripts/gref',
-        'scripts/newpydist',
+        'scripts/newpydist', 'scripts/irc-relay',
+        'scripts/pykfs-hook-server', 'scripts/git-note-index',
     ],
     install_requires=required,
 )
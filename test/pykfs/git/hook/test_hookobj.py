@@ -1,7 +1,14 @@
 from unittest2 import TestCase
-from pykfs.git.hook.hookobj import GitHook
+from pykfs.git.hook.hookobj import GitHook, PreReceive, PostReceive, NULL_SHA, \
+    parse_ref_updates, find_note_failures
+from pykfs.git.note import GitNoteException
 from mock import Mock
+import subprocess
+import tempfile
 import logging
+import shutil
+import time
+import os
 
 
 class GitHookDummy(GitHook):
@@ -45,3 +52,110 @@ class TestGitHook(TestCase):
 
     def test_irc(self):
         pass
+
+    def test_failed_fatal_action(self):
+        settings = {'dummy_action_1': {"foo": "bar"},
+                    'stdin': "",
+                    'print_stderr': False}
+        obj = GitHookDummy(settings=settings)
+        obj.dummy_action_1.side_effect = ValueError("broken")
+        self.assertRaisesRegexp(ValueError, "broken", obj)
+
+    def test_failed_nonfatal_action(self):
+        settings = {'dummy_action_1': {"fatal": False},
+                    'dummy_action_2': {"independent": True, "foo": "bar"},
+                    'stdin': "",
+                    'print_stderr': False}
+        obj = GitHookDummy(settings=settings)
+        obj.dummy_action_1.side_effect = ValueError("broken")
+        obj()
+        obj.dummy_action_1.assert_called_once_with()
+        obj.dummy_action_2.assert_called_once_with(foo="bar")
+        self.assertEqual("failed", obj.action_results["dummy_action_1"].status)
+        self.assertEqual("ok", obj.action_results["dummy_action_2"].status)
+
+    def test_action_timeout(self):
+        settings = {'dummy_action_1': {"timeout": 0.05, "fatal": False},
+                    'stdin': "",
+                    'print_stderr': False}
+        obj = GitHookDummy(settings=settings)
+        obj.dummy_action_1.side_effect = lambda: time.sleep(1)
+        started = time.time()
+        obj()
+        self.assertTrue(time.time() - started < 0.5)
+        self.assertEqual("timeout", obj.action_results["dummy_action_1"].status)
+
+
+class TestPreReceiveInput(TestCase):
+
+    def test_parse_ref_updates(self):
+        stdin = "a1 b1 refs/heads/master\n\na2 b2 refs/heads/feature\n"
+        expected = [("a1", "b1", "refs/heads/master"), ("a2", "b2", "refs/heads/feature")]
+        self.assertEqual(expected, parse_ref_updates(stdin))
+
+    def test_parse_ref_updates_invalid(self):
+        self.assertRaises(ValueError, parse_ref_updates, "a1 b1\n")
+        self.assertRaises(ValueError, parse_ref_updates, "")
+
+    def test_find_note_failures(self):
+        commits = [("sha1", "<foo>ok</foo>"), ("sha2", "<foo>bad"), ("sha3", "<bar>x</bar>")]
+        failures = find_note_failures(commits, valid_labels=["foo"])
+        self.assertEqual(["sha2", "sha3"], [sha for sha, error in failures])
+
+
+class TestReceiveHooks(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        subprocess.check_call(["git", "init", "-q", self.directory])
+        self.run_git("commit", "-q", "--allow-empty", "-m", "Base")
+        tree = self.run_git("rev-parse", "HEAD^{tree}")
+        first = self.run_git("commit-tree", tree, "-p", "HEAD", "-m", "First <foo>ok</foo>")
+        self.head = self.run_git("commit-tree", tree, "-p", first, "-m", "Second <bar>x</bar>")
+        self.stdin = "".join("{0} {1} refs/heads/{2}\n".format(NULL_SHA, self.head, name)
+                             for name in ("feature", "release"))
+        self.cwd = os.getcwd()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def run_git(self, *args):
+        return subprocess.check_output(
+            ["git", "-c", "user.name=Foo", "-c", "user.email=foo@bar"] + list(args),
+            cwd=self.directory
+        ).decode("utf-8").strip()
+
+    def make_hook(self, cls, stdin):
+        hook = cls(settings={'stdin': stdin, 'print_stderr': False})
+        hook._initialize()
+        return hook
+
+    def test_pre_receive_refs_to_same_commit(self):
+        hook = self.make_hook(PreReceive, self.stdin)
+        self.assertEqual({"refs/heads/feature": self.head, "refs/heads/release": self.head},
+                         hook.newheads)
+        self.assertEqual(2, len(hook.new_commits))
+        self.assertEqual(set(["refs/heads/feature, refs/heads/release"]),
+                         set(hook.commit_refs.values()))
+        self.assertEqual(None, hook._commit_messages)
+        self.assertRaisesRegexp(GitNoteException, r"(?s)1 of 2 .*feature, refs/heads/release",
+                                hook.validate_notes, valid_labels=["foo"])
+        self.assertEqual("First <foo>ok</foo>", hook.commit_messages[1])
+
+    def test_pre_receive_compatible_attributes(self):
+        hook = self.make_hook(PreReceive, self.stdin)
+        self.assertEqual((NULL_SHA, self.head, "refs/heads/feature"),
+                         (hook.oldhead, hook.newhead, hook.ref))
+        self.assertEqual("feature", hook.branch_changed)
+        self.assertEqual("Second <bar>x</bar>", hook.commit_message)
+        self.assertEqual("Second <bar>x</bar>", hook.short_commit_message)
+
+    def test_post_receive_every_update(self):
+        stdin = "{0} {1} refs/heads/gone\n".format(self.head, NULL_SHA) + self.stdin
+        hook = self.make_hook(PostReceive, stdin)
+        self.assertEqual(None, hook.commit_message)
+        details = hook._push_details()
+        self.assertEqual(["feature", "release"], [d["branch"] for d in details])
+        self.assertEqual(["Second <bar>x</bar>"] * 2, [d["message"] for d in details])
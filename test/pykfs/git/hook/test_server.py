@@ -0,0 +1,100 @@
+from unittest2 import TestCase
+from mock import patch
+from pykfs.git.hook import server
+from pykfs.git import hookclient
+import threading
+import tempfile
+import shutil
+import sys
+import os
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+def dummy_hook(settings):
+    sys.stdout.write("stdin: {0}".format(settings["stdin"]))
+    sys.stdout.write("label: {0}\n".format(settings["label"]))
+    sys.stderr.write("cwd: {0}\n".format(os.getcwd()))
+    if settings.get("exit") is not None:
+        sys.exit(settings["exit"])
+
+
+def failing_hook(settings):
+    raise ValueError("broken hook")
+
+
+class TestHookServer(TestCase):
+
+    def setUp(self):
+        self.directory = os.path.realpath(tempfile.mkdtemp())
+        self.socket_path = os.path.join(self.directory, "hooks.sock")
+        hooks = {"dummy": dummy_hook, "failing": failing_hook}
+        self.hooks = patch.dict(server.HOOKS, hooks)
+        self.hooks.start()
+        self.server = server.HookServer(self.socket_path)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.hooks.stop()
+        shutil.rmtree(self.directory)
+
+    def run_client(self, hook, settings=None, stdin="old new ref\n"):
+        stdout, stderr = StringIO(), StringIO()
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+        try:
+            with patch("sys.stdin", StringIO(stdin)), patch("sys.stdout", stdout), \
+                    patch("sys.stderr", stderr), \
+                    patch("pykfs.git.hookclient.run_in_process") as in_process:
+                status = hookclient.run(hook, settings=settings, socket_path=self.socket_path)
+        finally:
+            os.chdir(cwd)
+        self.assertFalse(in_process.called)
+        return status, stdout.getvalue(), stderr.getvalue()
+
+    def test_round_trip(self):
+        status, stdout, stderr = self.run_client("dummy", settings={"label": "ticket"})
+        self.assertEqual(0, status)
+        self.assertEqual("stdin: old new ref\nlabel: ticket\n", stdout)
+        self.assertEqual("cwd: {0}\n".format(self.directory), stderr)
+
+    def test_exit_status(self):
+        for code, expected in (3, 3), (0, 0), ("failed", 1):
+            status, stdout, stderr = self.run_client(
+                "dummy", settings={"label": "ticket", "exit": code})
+            self.assertEqual(expected, status)
+            self.assertTrue(stdout.endswith("label: ticket\n"))
+
+    def test_exception(self):
+        status, stdout, stderr = self.run_client("failing")
+        self.assertEqual(1, status)
+        self.assertIn("ValueError: broken hook", stderr)
+
+    def test_other_user_refused(self):
+        self.server.allowed_uids = set([os.getuid() + 1])
+        status, stdout, stderr = self.run_client("dummy", settings={"label": "ticket"})
+        self.assertEqual(1, status)
+        self.assertEqual("", stdout)
+        self.assertIn("did not run the 'dummy' hook", stderr)
+
+    def test_refuses_foreign_path(self):
+        path = os.path.join(self.directory, "other.sock")
+        with open(path, "w"):
+            pass
+        self.assertRaises(OSError, server.HookServer, path)
+        self.assertTrue(os.path.isfile(path))
+
+    def test_public_directory_not_trusted(self):
+        os.chmod(self.directory, 0o755)
+        with patch("sys.stdin", StringIO("")), \
+                patch("pykfs.git.hookclient.run_in_process", return_value=0) as in_process:
+            self.assertEqual(0, hookclient.run("dummy", socket_path=self.socket_path))
+        in_process.assert_called_once_with("dummy", None, "")
@@ -0,0 +1,277 @@
+import unittest2
+from mock import patch
+import subprocess
+import tempfile
+import shutil
+import sys
+import os
+import pykfs.git.lib as gitlib
+
+
+COMMIT = (
+    "tree 4b825dc642cb6eb9a060e54bf8d69288fbee4904\n"
+    "author foo <foo@bar> 1425700000 +0000\n"
+    "committer foo <foo@bar> 1425700000 +0000\n"
+    "\n"
+    "Short message\n"
+    "\n"
+    "Longer <foo>note</foo> message\n"
+)
+
+
+class TestGitLib(unittest2.TestCase):
+
+    def test_parse_commit_message(self):
+        actual = gitlib.parse_commit_message(COMMIT)
+        self.assertEqual("Short message\n\nLonger <foo>note</foo> message", actual)
+
+    def test_parse_commit_message_short(self):
+        actual = gitlib.parse_commit_message(COMMIT.encode("utf-8"), short=True)
+        self.assertEqual("Short message", actual)
+
+    def test_batch_session_per_gitdir(self):
+        session = gitlib.get_batch_session("/foo/.git")
+        self.assertIs(session, gitlib.get_batch_session("/foo/.git"))
+        self.assertIsNot(session, gitlib.get_batch_session("/bar/.git"))
+
+    def test_iter_git_lines(self):
+        lines = list(gitlib.iter_git("--version"))
+        self.assertEqual(1, len(lines))
+        self.assertTrue(lines[0].startswith("git version"))
+        self.assertEqual("".join(lines), gitlib.git("--version"))
+
+    def test_iter_git_chunks(self):
+        chunks = list(gitlib.iter_git("--version", _chunk_size=4))
+        self.assertEqual("git ", chunks[0])
+        self.assertEqual(gitlib.git("--version"), "".join(chunks))
+
+    def test_git_limit(self):
+        self.assertEqual("git v", gitlib.git("--version", _limit=5))
+        self.assertEqual(gitlib.git("--version"), gitlib.git("--version", _limit=1000))
+
+    def test_git_limit_waits_for_git(self):
+        import sh
+        wait = sh.RunningCommand.wait
+        with patch.object(sh.RunningCommand, "wait", autospec=True, side_effect=wait) as waited:
+            output = gitlib.git("--no-pager", "help", "-a", _limit=10, _chunk_size=1)
+        self.assertEqual(10, len(output))
+        self.assertEqual(1, waited.call_count)
+        self.assertIsNotNone(waited.call_args[0][0].process.exit_code)
+
+    def test_parse_log_records(self):
+        output = (b"a" * 40 + b"\0\0Foo\x00" + b"1425700000\0Subject\0Body\n\n\0" +
+                  b"b" * 40 + b"\0" + b"a" * 40 + b"\0Bar\0" + b"1425700001\0Second\0\0")
+        fields = ("sha", "parents", "author_name", "author_date", "subject", "body")
+        for size in (1, 7, len(output)):
+            chunks = [output[i:i + size] for i in range(0, len(output), size)]
+            commits = list(gitlib.parse_log_records(chunks, fields))
+            self.assertEqual(["a" * 40, "b" * 40], [c.sha for c in commits])
+            self.assertEqual([[], ["a" * 40]], [c.parents for c in commits])
+            self.assertEqual([1425700000, 1425700001], [c.author_date for c in commits])
+            self.assertEqual(["Body", ""], [c.body for c in commits])
+            self.assertEqual([None, None], [c.committer_name for c in commits])
+
+    def test_parse_log_records_incomplete(self):
+        records = gitlib.parse_log_records([b"a" * 40 + b"\0Subject"], ("sha", "subject"))
+        self.assertRaises(gitlib.GitException, list, records)
+
+
+class TestCatFileBatch(unittest2.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.gitdir = os.path.join(self.directory, ".git")
+        subprocess.check_call(["git", "init", "-q", self.directory])
+        for message in ("First", "Second\n\nWith a body"):
+            self.run_git("commit", "-q", "--allow-empty", "-m", message)
+        self.run_git("tag", "-a", "-m", "Release", "v1.0", "HEAD~1")
+        self.session = gitlib.CatFileBatch(self.gitdir)
+
+    def tearDown(self):
+        self.session.close()
+        shutil.rmtree(self.directory)
+
+    def run_git(self, *args):
+        return subprocess.check_output(
+            ["git", "-c", "user.name=Foo", "-c", "user.email=foo@bar"] + list(args),
+            cwd=self.directory
+        ).decode("utf-8").strip()
+
+    def test_read_objects(self):
+        head = self.run_git("rev-parse", "HEAD")
+        first = self.run_git("rev-parse", "HEAD~1")
+        tag = self.run_git("rev-parse", "v1.0")
+        missing = "0" * 40
+        objects = self.session.read_objects([head, missing, tag, first, "v1.0^{commit}"])
+        self.assertEqual([head, missing, tag, first, first], [o[0] for o in objects])
+        self.assertEqual(["commit", "missing", "tag", "commit", "commit"],
+                         [o[1] for o in objects])
+        self.assertEqual(None, objects[1][2])
+        self.assertTrue(objects[2][2].startswith("object {0}\n".format(first).encode("ascii")))
+        self.assertEqual(self.run_git("cat-file", "commit", head).encode("utf-8"),
+                         objects[0][2].rstrip(b"\n"))
+        self.assertEqual("Second\n\nWith a body",
+                         gitlib.parse_commit_message(objects[0][2]))
+
+    def test_session_reused(self):
+        head = self.run_git("rev-parse", "HEAD")
+        self.assertEqual("commit", self.session.read_object(head)[1])
+        process = self.session.process
+        self.assertEqual("missing", self.session.read_object("f" * 40)[1])
+        self.assertEqual("commit", self.session.read_object("HEAD~1")[1])
+        self.assertIs(process, self.session.process)
+
+    def test_restart_after_close(self):
+        head = self.run_git("rev-parse", "HEAD")
+        self.session.read_object(head)
+        self.session.close()
+        self.assertEqual(None, self.session.process)
+        self.assertEqual(head, self.session.read_object("HEAD")[0])
+
+    def test_commit_messages(self):
+        messages = gitlib.commit_messages(["HEAD", "v1.0", "HEAD~1"], gitdir=self.gitdir,
+                                          short=True)
+        self.assertEqual(["Second", "First", "First"], messages)
+        self.assertRaises(gitlib.GitException, gitlib.commit_message, "0" * 40,
+                          gitdir=self.gitdir)
+
+
+class TestCommits(unittest2.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.gitdir = os.path.join(self.directory, ".git")
+        subprocess.check_call(["git", "init", "-q", self.directory])
+        for message in ("First", "Second\n\nWith a <ticket>PYKFS-2</ticket> body"):
+            subprocess.check_call(
+                ["git", "-c", "user.name=Foo Bar", "-c", "user.email=foo@bar", "commit", "-q",
+                 "--allow-empty", "-m", message], cwd=self.directory
+            )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_commits(self):
+        commits = list(gitlib.commits("HEAD", gitdir=self.gitdir))
+        self.assertEqual(["Second", "First"], [c.subject for c in commits])
+        self.assertEqual("With a <ticket>PYKFS-2</ticket> body", commits[0].body)
+        self.assertEqual([commits[1].sha], commits[0].parents)
+        self.assertEqual("Foo Bar", commits[0].author_name)
+        self.assertEqual(gitlib.rev_parse("HEAD", gitdir=self.gitdir), commits[0].sha)
+
+    def test_commits_fields(self):
+        commits = list(gitlib.commits(["HEAD~1..HEAD"], gitdir=self.gitdir, fields=["subject"]))
+        self.assertEqual(["Second"], [c.subject for c in commits])
+        self.assertEqual(None, commits[0].sha)
+        self.assertRaises(ValueError, list, gitlib.commits("HEAD", gitdir=self.gitdir,
+                                                             fields=["foo"]))
+
+    def test_commits_bad_revision(self):
+        self.assertRaises(gitlib.GitException, list,
+                          gitlib.commits("missing", gitdir=self.gitdir))
+
+    def test_commits_verbose_stderr(self):
+        # More warnings than a pipe holds, written before the first record
+        script = ("import sys; sys.stderr.write('warning\\n' * 100000); sys.stderr.flush(); "
+                  "sys.stdout.write('Second\\0First\\0')")
+        popen = subprocess.Popen
+
+        def run_script(command, **kwargs):
+            return popen([sys.executable, "-c", script], **kwargs)
+
+        with patch("pykfs.git.lib.subprocess.Popen", run_script):
+            commits = list(gitlib.commits("HEAD", gitdir=self.gitdir, fields=["subject"]))
+        self.assertEqual(["Second", "First"], [c.subject for c in commits])
+
+
+class TestRepository(unittest2.TestCase):
+
+    def setUp(self):
+        self.directory = os.path.realpath(tempfile.mkdtemp())
+        self.gitdir = os.path.join(self.directory, ".git")
+        subprocess.check_call(["git", "init", "-q", self.directory])
+        os.makedirs(os.path.join(self.directory, "sub", "dir"))
+        self.commit("First")
+        self.run_git("tag", "v1.0")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_git(self, *args):
+        return subprocess.check_output(
+            ["git", "-c", "user.name=Foo", "-c", "user.email=foo@bar"] + list(args),
+            cwd=self.directory
+        ).decode("utf-8").strip()
+
+    def commit(self, message):
+        self.run_git("commit", "-q", "--allow-empty", "-m", message)
+
+    def test_resolve_git_dir(self):
+        self.assertEqual(self.gitdir,
+                         gitlib.resolve_git_dir(os.path.join(self.directory, "sub", "dir")))
+        cwd = os.getcwd()
+        os.chdir(os.path.join(self.directory, "sub"))
+        try:
+            self.assertEqual(self.gitdir, gitlib.resolve_git_dir())
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(self.gitdir, gitlib.resolve_git_dir(os.path.join(self.gitdir, "hooks")))
+
+    def test_resolve_git_dir_follows_changes(self):
+        start = os.path.join(self.directory, "sub", "dir")
+        self.assertEqual(self.gitdir, gitlib.resolve_git_dir(start))
+        self.run_git("init", "-q", "sub")
+        self.assertEqual(os.path.join(self.directory, "sub", ".git"),
+                         gitlib.resolve_git_dir(start))
+        shutil.rmtree(os.path.join(self.directory, "sub", ".git"))
+        self.assertEqual(self.gitdir, gitlib.resolve_git_dir(start))
+
+    def test_rev_parse_full_sha(self):
+        sha = self.run_git("rev-parse", "HEAD")
+        with patch("pykfs.git.lib.Repository") as repository, \
+                patch("pykfs.git.lib.git") as git:
+            self.assertEqual(sha, gitlib.rev_parse(sha.upper(), gitdir=self.gitdir))
+        self.assertFalse(repository.called)
+        self.assertFalse(git.called)
+
+    def test_resolve_bare_and_gitfile(self):
+        bare = os.path.join(self.directory, "bare.git")
+        self.run_git("clone", "-q", "--bare", ".", bare)
+        self.assertEqual(bare, gitlib.resolve_git_dir(bare))
+        worktree = os.path.join(self.directory, "worktree")
+        self.run_git("worktree", "add", "-q", worktree)
+        repository = gitlib.Repository(worktree)
+        self.assertEqual(self.directory, os.path.dirname(repository.commondir))
+        self.assertEqual(self.run_git("rev-parse", "v1.0"), repository.resolve("v1.0"))
+
+    def test_refs(self):
+        repository = gitlib.Repository(self.directory)
+        head = self.run_git("rev-parse", "HEAD")
+        branch = self.run_git("symbolic-ref", "HEAD")
+        self.assertEqual(branch, repository.head())
+        self.assertEqual({branch: head, "refs/tags/v1.0": head}, repository.refs())
+        self.run_git("pack-refs", "--all")
+        self.commit("Second")
+        second = self.run_git("rev-parse", "HEAD")
+        self.assertEqual(second, repository.resolve("HEAD"))
+        self.assertEqual(head, repository.resolve("v1.0"))
+        self.assertEqual(second, repository.resolve(branch.split("/")[-1]))
+        self.assertEqual(None, repository.resolve("description"))
+        self.assertEqual(None, repository.resolve("HEAD~1"))
+
+    def test_module_functions_accept_repository(self):
+        repository = gitlib.Repository(self.directory)
+        self.commit("Second")
+        self.assertEqual(self.run_git("rev-parse", "HEAD~1"),
+                         gitlib.rev_parse("HEAD~1", gitdir=repository))
+        self.assertEqual("Second", gitlib.commit_message("HEAD", gitdir=repository))
+        self.assertEqual(2, len(gitlib.rev_list("HEAD", gitdir=repository)))
+
+    def test_callers_repository_used(self):
+        repository = gitlib.Repository(self.directory)
+        head = self.run_git("rev-parse", "HEAD")
+        with patch.object(repository, "resolve", wraps=repository.resolve) as resolve:
+            self.assertEqual(head, gitlib.rev_parse("HEAD", gitdir=repository))
+            self.assertEqual("First", gitlib.commit_message("v1.0", gitdir=repository,
+                                                            direct=True))
+        self.assertEqual(["HEAD", "v1.0"], [c[0][0] for c in resolve.call_args_list])
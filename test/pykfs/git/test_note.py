@@ -57,3 +57,16 @@ class TestGitNote(unittest2.TestCase):
                                 gitnote.get_notes_from_message,
                                 message
                                 )
+
+    def test_iter_notes_split_chunks(self):
+        chunks = ["text <fo", "o>note ", "one </f", "oo> <bar>two</bar", ">"]
+        actual = list(gitnote.iter_notes(chunks))
+        self.assertEquals([('foo', 'note one'), ('bar', 'two')], actual)
+
+    def test_iter_notes_unclosed(self):
+        chunks = ["<foo>note", " never closed"]
+        self.assertRaisesRegexp(gitnote.GitNoteException,
+                                "unclosed",
+                                list,
+                                gitnote.iter_notes(chunks)
+                                )
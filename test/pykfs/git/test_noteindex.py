@@ -0,0 +1,149 @@
+import unittest2
+from mock import patch
+import tempfile
+import sqlite3
+import shutil
+import os
+from pykfs.git.noteindex import NoteIndex
+
+
+HISTORY = [
+    ("c" * 40, ["b" * 40], "Third <ticket>PYKFS-3</ticket>"),
+    ("b" * 40, ["a" * 40], "Second <ticket>PYKFS-2</ticket> <reviewer>kevin</reviewer>"),
+    ("a" * 40, [], "First <ticket>PYKFS-1</ticket>"),
+]
+
+
+class TestNoteIndex(unittest2.TestCase):
+
+    def setUp(self):
+        self.index = NoteIndex("/foo/.git", path=":memory:")
+        walked = [(sha, parents) for sha, parents, message in HISTORY]
+        messages = dict((sha, message) for sha, parents, message in HISTORY)
+        with patch("pykfs.git.lib.rev_list", return_value=walked), \
+                patch("pykfs.git.lib.commit_messages",
+                      side_effect=lambda shas, gitdir: [messages[sha] for sha in shas]):
+            self.added = self.index.build()
+
+    def tearDown(self):
+        self.index.close()
+
+    def test_build(self):
+        self.assertEqual(3, self.added)
+
+    def test_find_label(self):
+        actual = [note for sha, note in self.index.find_label("ticket")]
+        self.assertEqual(["PYKFS-3", "PYKFS-2", "PYKFS-1"], actual)
+
+    def test_search(self):
+        self.assertEqual([("b" * 40, "reviewer", "kevin")], self.index.search("KEV"))
+
+    def test_in_range(self):
+        actual = self.index.in_range("c" * 40, since="a" * 40, label="ticket")
+        self.assertEqual(["PYKFS-3", "PYKFS-2"], [note for sha, label, note in actual])
+
+    def test_getnotes_prefix(self):
+        expected = {"ticket": ["PYKFS-2"], "reviewer": ["kevin"]}
+        self.assertEqual(expected, self.index.getnotes("bbbb"))
+
+    def test_add_commits_already_indexed(self):
+        messages = dict((sha, message) for sha, parents, message in HISTORY)
+        with patch("pykfs.git.lib.commit_messages",
+                   side_effect=lambda shas, gitdir: [messages[sha] for sha in shas]):
+            self.assertEqual(0, self.index._add_commits([("b" * 40, ["a" * 40])]))
+        self.assertEqual(["PYKFS-2"], self.index.getnotes("b" * 40)["ticket"])
+
+
+class TestNoteIndexIncomplete(unittest2.TestCase):
+
+    def setUp(self):
+        self.index = NoteIndex("/foo/.git", path=":memory:")
+        self.messages = dict((sha, message) for sha, parents, message in HISTORY)
+        self.patches = [
+            patch("pykfs.git.lib.commit_messages",
+                  side_effect=lambda shas, gitdir: [self.messages[sha] for sha in shas]),
+            patch("pykfs.git.lib.rev_parse", side_effect=lambda rev, gitdir: rev),
+        ]
+        for p in self.patches:
+            p.start()
+        walked = [(sha, parents) for sha, parents, message in HISTORY[1:]]
+        with patch("pykfs.git.lib.rev_list", return_value=walked):
+            self.index.update(["b" * 40])
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.index.close()
+
+    def test_in_range_indexes_missing_commits(self):
+        with patch("pykfs.git.lib.rev_list", return_value=[("c" * 40, ["b" * 40])]) as rev_list:
+            actual = self.index.in_range("c" * 40, label="ticket")
+            self.assertEqual(1, rev_list.call_count)
+            self.assertEqual(["--not", "b" * 40], list(rev_list.call_args[0][-2:]))
+            self.assertEqual(["PYKFS-3", "PYKFS-2", "PYKFS-1"],
+                             [note for sha, label, note in actual])
+            self.index.in_range("c" * 40, since="a" * 40)
+            self.assertEqual(1, rev_list.call_count)
+        self.assertEqual(["c" * 40], self.index._tips())
+
+    def test_in_range_unindexed_since(self):
+        with patch("pykfs.git.lib.rev_list", return_value=[("c" * 40, ["b" * 40])]):
+            actual = self.index.in_range("c" * 40, since="b" * 40)
+        self.assertEqual(["PYKFS-3"], [note for sha, label, note in actual])
+
+
+class TestNoteIndexGraph(unittest2.TestCase):
+
+    def setUp(self):
+        self.index = NoteIndex("/foo/.git", path=":memory:")
+
+    def tearDown(self):
+        self.index.close()
+
+    def add(self, history):
+        messages = dict((sha, "<ticket>{0}</ticket>".format(sha[-4:])) for sha, _ in history)
+        with patch("pykfs.git.lib.rev_list", return_value=list(history)), \
+                patch("pykfs.git.lib.commit_messages",
+                      side_effect=lambda shas, gitdir: [messages[sha] for sha in shas]):
+            return self.index.update(["HEAD"])
+
+    def tickets(self, until, since=None):
+        return [note for sha, label, note in self.index.in_range(until, since=since)]
+
+    def test_merges(self):
+        # a <- b <- d <- e and a <- c <- d, listed newest first like git rev-list
+        a, b, c, d, e = [letter * 40 for letter in "abcde"]
+        self.assertEqual(5, self.add([(e, [d]), (d, [b, c]), (c, [a]), (b, [a]), (a, [])]))
+        self.assertEqual(["eeee", "dddd", "cccc"], self.tickets(e, since=b))
+        self.assertEqual(["eeee"], self.tickets(e, since=d))
+        self.assertEqual(["bbbb"], self.tickets(b, since=c))
+        self.assertEqual([], self.tickets(a, since=e))
+        self.assertEqual(["eeee", "dddd", "cccc", "bbbb", "aaaa"], self.tickets(e))
+
+    def test_range_walk_follows_range(self):
+        shas = ["{0:040x}".format(i) for i in range(2000)]
+        history = [(sha, [shas[i - 1]] if i else []) for i, sha in enumerate(shas)]
+        self.add(history[::-1])
+        # Walking the whole history from since takes a few hundred of these
+        steps = []
+        self.index.connection.set_progress_handler(lambda: steps.append(1), 100)
+        self.assertEqual(["{0:04x}".format(i) for i in (1999, 1998)],
+                         self.tickets(shas[-1], since=shas[-3]))
+        self.assertLess(len(steps), 10)
+
+    def test_old_schema_recreated(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "index.sqlite")
+            connection = sqlite3.connect(path)
+            connection.execute("CREATE TABLE commits (sha TEXT PRIMARY KEY, error TEXT)")
+            connection.execute("INSERT INTO commits VALUES (?, NULL)", ("a" * 40,))
+            connection.commit()
+            connection.close()
+            index = NoteIndex("/foo/.git", path=path)
+            try:
+                self.assertEqual(set(), index._indexed(["a" * 40]))
+            finally:
+                index.close()
+        finally:
+            shutil.rmtree(directory)
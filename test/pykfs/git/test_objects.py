@@ -0,0 +1,166 @@
+import unittest2
+from mock import patch
+import subprocess
+import tempfile
+import shutil
+import sys
+import os
+import pykfs
+import pykfs.git.lib as gitlib
+from pykfs.git.objects import ObjectReader, ObjectNotFound, apply_delta, get_object_dirs
+
+
+PRE_RECEIVE = """#!{python}
+import sys
+sys.path.insert(0, {path!r})
+import pykfs.git.lib as gitlib
+from pykfs.git.objects import get_object_reader
+
+for line in sys.stdin:
+    old, new, ref = line.split()
+    content = get_object_reader(".").read_commit(new)
+    sys.stdout.write("direct: " + gitlib.parse_commit_message(content, short=True) + "\\n")
+    sys.stdout.write("message: " + gitlib.commit_message(new, gitdir=".", direct=True) + "\\n")
+"""
+
+
+class TestObjectReader(unittest2.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.gitdir = os.path.join(self.directory, ".git")
+        self.run_git("init", "-q")
+        lines = ["line {0}\n".format(i) for i in range(2000)]
+        for i in range(30):
+            lines[i * 50] = "changed in commit {0}\n".format(i)
+            with open(os.path.join(self.directory, "file.txt"), "w") as f:
+                f.writelines(lines)
+            self.run_git("add", "file.txt")
+            self.run_git("commit", "-q", "-m", "Commit {0}\n\n<ticket>PYKFS-{0}</ticket>".format(i))
+        self.run_git("tag", "-a", "-m", "Release", "v1.0")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_git(self, *args, **kwargs):
+        return subprocess.check_output(
+            ["git", "-c", "user.name=Foo", "-c", "user.email=foo@bar"] + list(args),
+            cwd=kwargs.get("cwd", self.directory), stderr=kwargs.get("stderr")
+        ).decode("ascii")
+
+    def assertMatchesCatFile(self, gitdir=None):
+        gitdir = gitdir or self.gitdir
+        shas = self.run_git("cat-file", "--batch-all-objects", "--batch-check=%(objectname)",
+                            cwd=gitdir)
+        shas = shas.split()
+        expected = gitlib.CatFileBatch(gitdir).read_objects(shas)
+        reader = ObjectReader(gitdir)
+        try:
+            for sha, objtype, content in expected:
+                self.assertEqual((objtype, content), reader.read(sha))
+        finally:
+            reader.close()
+        return len(shas)
+
+    def test_loose_objects(self):
+        self.assertEqual(91, self.assertMatchesCatFile())
+
+    def test_ofs_deltas(self):
+        self.run_git("repack", "-a", "-d", "-q", "--depth=50")
+        self.assertMatchesCatFile()
+
+    def test_ref_deltas(self):
+        self.run_git("-c", "repack.useDeltaBaseOffset=false", "repack", "-a", "-d", "-q",
+                     "--depth=50")
+        self.assertMatchesCatFile()
+
+    def test_read_commit_peels_tags(self):
+        self.run_git("gc", "-q")
+        reader = ObjectReader(self.gitdir)
+        tag = self.run_git("rev-parse", "v1.0").strip()
+        head = self.run_git("rev-parse", "HEAD").strip()
+        self.assertEqual(reader.read(head)[1], reader.read_commit(tag))
+        self.assertRaises(ObjectNotFound, reader.read, "0" * 40)
+        reader.close()
+
+    def test_commit_message_direct(self):
+        self.run_git("gc", "-q")
+        for rev in ("HEAD", "HEAD~3", "v1.0"):
+            self.assertEqual(gitlib.commit_message(rev, gitdir=self.gitdir),
+                             gitlib.commit_message(rev, gitdir=self.gitdir, direct=True))
+
+    def test_apply_delta(self):
+        # Source size 5, target size 8, copy 5 bytes from offset 0, insert "!!!"
+        delta = b"\x05\x08\x90\x05\x03!!!"
+        self.assertEqual(b"hello!!!", apply_delta(b"hello", delta))
+
+    def test_v1_index(self):
+        self.run_git("-c", "pack.indexVersion=1", "repack", "-a", "-d", "-q", "--depth=50")
+        self.assertMatchesCatFile()
+
+    def test_unsupported_index_skipped(self):
+        self.run_git("gc", "-q")
+        packdir = os.path.join(self.gitdir, "objects", "pack")
+        with open(os.path.join(packdir, "pack-future.idx"), "wb") as f:
+            f.write(b"\377tOc\0\0\0\3" + b"\0" * 1024)
+        with open(os.path.join(packdir, "pack-future.pack"), "wb") as f:
+            f.write(b"PACK\0\0\0\3\0\0\0\0")
+        self.assertMatchesCatFile()
+        self.assertEqual(gitlib.commit_message("HEAD", gitdir=self.gitdir),
+                         gitlib.commit_message("HEAD", gitdir=self.gitdir, direct=True))
+
+    def test_falls_back_to_git(self):
+        missing = ObjectNotFound("not found")
+        with patch("pykfs.git.objects.ObjectReader.read_commit", side_effect=missing) as read:
+            messages = gitlib.commit_messages(["HEAD", "HEAD~1"], gitdir=self.gitdir,
+                                              direct=True)
+        self.assertEqual(2, read.call_count)
+        self.assertEqual(gitlib.commit_messages(["HEAD", "HEAD~1"], gitdir=self.gitdir),
+                         messages)
+
+    def test_nested_alternates(self):
+        self.run_git("gc", "-q")
+        middle = os.path.join(self.directory, "middle")
+        outer = os.path.join(self.directory, "outer")
+        self.run_git("clone", "-q", "--shared", self.directory, middle)
+        self.run_git("commit", "-q", "--allow-empty", "-m", "Middle", cwd=middle)
+        self.run_git("clone", "-q", "--shared", middle, outer)
+        self.run_git("commit", "-q", "--allow-empty", "-m", "Outer", cwd=outer)
+        gitdir = os.path.join(outer, ".git")
+        self.assertEqual(3, len(get_object_dirs(gitdir)))
+        self.assertMatchesCatFile(gitdir)
+
+    def test_worktree_shares_objects(self):
+        worktree = os.path.join(self.directory, "worktree")
+        self.run_git("worktree", "add", "-q", "-b", "other", worktree)
+        gitdir = os.path.join(self.gitdir, "worktrees", "worktree")
+        self.assertEqual([os.path.join(self.gitdir, "objects")], get_object_dirs(gitdir))
+        self.assertEqual(gitlib.commit_message("HEAD", gitdir=self.gitdir),
+                         gitlib.commit_message("HEAD", gitdir=gitdir, direct=True))
+
+    def test_environment_object_dirs(self):
+        environ = {
+            "GIT_OBJECT_DIRECTORY": os.path.join(self.directory, "incoming"),
+            "GIT_ALTERNATE_OBJECT_DIRECTORIES": os.pathsep.join(
+                [os.path.join(self.gitdir, "objects"), os.path.join(self.directory, "other")]),
+            "GIT_QUARANTINE_PATH": os.path.join(self.directory, "incoming"),
+        }
+        expected = [os.path.join(self.directory, name)
+                    for name in ("incoming", ".git/objects", "other")]
+        self.assertEqual(expected, get_object_dirs(self.gitdir, environ))
+
+    def test_pre_receive_hook(self):
+        path = os.path.dirname(os.path.dirname(os.path.abspath(pykfs.__file__)))
+        for unpack_limit in "100", "1":
+            # 91 objects are unpacked as loose objects, or kept as a pack with a limit of 1
+            remote = os.path.join(self.directory, "remote{0}.git".format(unpack_limit))
+            self.run_git("init", "-q", "--bare", remote)
+            self.run_git("config", "receive.unpackLimit", unpack_limit, cwd=remote)
+            hook = os.path.join(remote, "hooks", "pre-receive")
+            with open(hook, "w") as f:
+                f.write(PRE_RECEIVE.format(python=sys.executable, path=path))
+            os.chmod(hook, 0o755)
+            output = self.run_git("push", remote, "HEAD:refs/heads/master",
+                                  stderr=subprocess.STDOUT)
+            self.assertIn("remote: direct: Commit 29", output)
+            self.assertIn("remote: message: Commit 29", output)
@@ -0,0 +1,99 @@
+import unittest2
+from mock import patch
+import subprocess
+import threading
+import tempfile
+import shutil
+import os
+from pykfs.git.tagcache import TagCache, version_key
+
+
+A, B, C, D = ("a" * 40, "b" * 40, "c" * 40, "d" * 40)
+DATA = {
+    # a <- b <- d (merge of b and c), a <- c
+    "fingerprint": "foo",
+    "tags": {"v1.0": B, "v1.10": D, "v1.9": C, "release": A},
+    "commits": [[D, [B, C]], [C, [A]], [B, [A]], [A, []]],
+}
+
+
+class TestTagCache(unittest2.TestCase):
+
+    def setUp(self):
+        self.cache = TagCache("/foo/.git", path="/foo/.git/tags.json")
+        self.cache._load(DATA)
+        self.cache.refresh = lambda: None
+
+    def test_gettags_many(self):
+        expected = [["release", "v1.0", "v1.10", "v1.9"], ["v1.0", "v1.10"], ["v1.10", "v1.9"]]
+        self.assertEqual(expected, self.cache.gettags_many([A, B, C]))
+
+    def test_gettags_unknown_commit(self):
+        self.assertEqual([], self.cache.gettags("e" * 40))
+
+    def test_latest_version_tag(self):
+        self.assertEqual("v1.10", self.cache.latest_version_tag(A))
+
+    def test_resolve_short_sha(self):
+        with patch("pykfs.git.lib.rev_parse", return_value=C) as rev_parse:
+            self.assertEqual(["v1.10", "v1.9"], self.cache.gettags("ccc"))
+            self.assertEqual(1, rev_parse.call_count)
+
+    def test_version_key(self):
+        self.assertTrue(version_key("v1.10.0") > version_key("v1.9.3"))
+
+
+class TestTagCacheRepository(unittest2.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.gitdir = os.path.join(self.directory, ".git")
+        self.run_git("init", "-q")
+        for message in "First", "Second":
+            self.run_git("commit", "-q", "--allow-empty", "-m", message)
+            self.run_git("tag", "-a", "-m", message, "v1.{0}".format(len(message)))
+        self.first = self.run_git("rev-parse", "HEAD~1")
+        tree = self.run_git("rev-parse", "HEAD^{tree}")
+        self.run_git("tag", "v0.1-tree", tree)
+        self.run_git("tag", "-a", "-m", "Tree", "v0.2-tree", tree)
+        self.cache = TagCache(self.gitdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_git(self, *args):
+        return subprocess.check_output(
+            ["git", "-c", "user.name=Foo", "-c", "user.email=foo@bar"] + list(args),
+            cwd=self.directory
+        ).decode("ascii").strip()
+
+    def test_tags_of_trees_skipped(self):
+        self.assertEqual(["v1.5", "v1.6"], self.cache.gettags(self.first))
+
+    def test_refresh_reads_refs_from_disk(self):
+        self.cache.gettags(self.first)
+        with patch("pykfs.git.lib.iter_git") as iter_git:
+            self.assertEqual(["v1.5", "v1.6"], self.cache.gettags(self.first))
+            self.run_git("pack-refs", "--all")
+            self.assertEqual(["v1.5", "v1.6"], self.cache.gettags(self.first))
+        self.assertFalse(iter_git.called)
+        self.run_git("tag", "v2.0", self.first)
+        self.assertEqual(["v1.5", "v1.6", "v2.0"], self.cache.gettags(self.first))
+
+    def test_writers_use_their_own_temporary_file(self):
+        paths = []
+        rename = os.rename
+
+        def record_rename(source, destination):
+            paths.append(source)
+            rename(source, destination)
+
+        self.cache.gettags(self.first)
+        with patch("os.rename", record_rename):
+            self.cache._write({"fingerprint": None})
+            thread = threading.Thread(target=self.cache._write, args=({"fingerprint": None},))
+            thread.start()
+            thread.join()
+        self.assertEqual(2, len(set(paths)))
+        self.assertEqual(["pykfs-tags.json"],
+                         [name for name in os.listdir(self.gitdir) if "pykfs-tags" in name])
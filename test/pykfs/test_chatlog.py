@@ -0,0 +1,46 @@
+from unittest2 import TestCase
+from pykfs.chatlog import ChatLogWriter
+import datetime as dt
+import tempfile
+import shutil
+import os
+
+
+class TestChatLogWriter(TestCase):
+
+    def setUp(self):
+        self.logdir = tempfile.mkdtemp()
+        self.times = []
+        self.writer = ChatLogWriter(self.logdir, "chat-{date}.log",
+                                    day_change_offset=dt.timedelta(hours=4),
+                                    flush_bytes=1000, flush_interval=60,
+                                    now=lambda: self.times.pop(0))
+
+    def tearDown(self):
+        self.writer.close()
+        shutil.rmtree(self.logdir)
+
+    def read(self, date):
+        path = os.path.join(self.logdir, "chat-{0}.log".format(date))
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return f.read()
+
+    def test_buffered_until_flush(self):
+        self.times = [dt.datetime(2015, 3, 7, 12)]
+        self.writer.write("foo: hello\n")
+        self.assertEqual("", self.read("2015-03-07"))
+        self.writer.flush()
+        self.assertEqual("foo: hello\n", self.read("2015-03-07"))
+
+    def test_rotate_at_day_change_offset(self):
+        self.times = [
+            dt.datetime(2015, 3, 8, 3, 59, 59),
+            dt.datetime(2015, 3, 8, 4, 0, 0),
+        ]
+        self.writer.write("foo: late\n")
+        self.writer.write("foo: early\n")
+        self.writer.close()
+        self.assertEqual("foo: late\n", self.read("2015-03-07"))
+        self.assertEqual("foo: early\n", self.read("2015-03-08"))
@@ -0,0 +1,54 @@
+from unittest2 import TestCase, skipIf
+import subprocess
+import sys
+import os
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import time budgets in microseconds, measured as the self time of every module imported
+# beyond a bare interpreter start.  Raise a budget only together with the change that needs it.
+IMPORT_BUDGETS = {
+    "pykfs.git.hook": 150000,
+    "pykfs.git.hookclient": 100000,
+    "pykfs.git.lib": 100000,
+    "pykfs.git.note": 100000,
+    "pykfs.kfslog": 100000,
+    "pykfs.script": 120000,
+    "pykfs.settings": 80000,
+}
+
+# Dependencies that should only be imported once the feature using them runs
+LAZY_MODULES = ["irc", "sh", "yaml", "logging.config", "sqlite3", "multiprocessing"]
+
+
+def get_import_times(code):
+    process = subprocess.Popen([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+    times = {}
+    for line in stderr.decode("utf-8").splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        selftime, cumulative, module = line[len("import time:"):].split("|")
+        times[module.strip()] = int(selftime)
+    return times, stdout.decode("utf-8").split()
+
+
+@skipIf(sys.version_info < (3, 7), "-X importtime requires python 3.7")
+class TestImportTime(TestCase):
+
+    def setUp(self):
+        self.startup, _ = get_import_times("pass")
+
+    def test_import_budgets(self):
+        for module, budget in sorted(IMPORT_BUDGETS.items()):
+            code = "import sys, {0}; print(' '.join(sorted(sys.modules)))".format(module)
+            times, loaded = get_import_times(code)
+            total = sum(t for name, t in times.items() if name not in self.startup)
+            self.assertLessEqual(
+                total, budget,
+                "Importing '{0}' took {1}us, over its budget of {2}us".format(module, total, budget)
+            )
+            eager = [name for name in LAZY_MODULES if name in loaded]
+            self.assertEqual([], eager, "Importing '{0}' imported {1}".format(module, eager))
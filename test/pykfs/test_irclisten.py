@@ -0,0 +1,160 @@
+from unittest2 import TestCase
+from mock import patch
+from pykfs.irclisten import IRCListener
+import irc.client
+import datetime as dt
+import tempfile
+import shutil
+import os
+
+
+class FakeConnection(object):
+
+    def __init__(self, reactor):
+        self.reactor = reactor
+        self.connects = 0
+        self.joined = []
+        self.nickname = None
+
+    def connect(self, host, port, nickname, password=None):
+        self.connects += 1
+        self.nickname = nickname
+        if self.reactor.failures:
+            self.reactor.failures -= 1
+            raise irc.client.ServerConnectionError("refused")
+
+    def join(self, channel):
+        self.joined.append(channel)
+
+    def get_nickname(self):
+        return self.nickname
+
+    def nick(self, nickname):
+        self.nickname = nickname
+
+
+class FakeReactor(object):
+
+    def __init__(self):
+        self.handlers = {}
+        self.connections = []
+        self.delayed = []
+        self.periodic = []
+        self.failures = 0
+
+    def add_global_handler(self, event, handler):
+        self.handlers[event] = handler
+
+    def server(self):
+        connection = FakeConnection(self)
+        self.connections.append(connection)
+        return connection
+
+    def execute_delayed(self, delay, func):
+        self.delayed.append((delay, func))
+
+    def execute_every(self, period, func):
+        self.periodic.append((period, func))
+
+    def run_delayed(self):
+        delayed, self.delayed = self.delayed, []
+        for delay, func in delayed:
+            func()
+        return [delay for delay, func in delayed]
+
+    def dispatch(self, event, connection, **kwargs):
+        self.handlers[event](connection, irc.client.Event(event, **kwargs))
+
+
+class TestIRCListener(TestCase):
+
+    def setUp(self):
+        self.logdir = tempfile.mkdtemp()
+        config = {
+            "logdir": self.logdir,
+            "max_nick": 6,
+            "min_backoff": 1,
+            "max_backoff": 4,
+            "servers": [
+                {"host": "irc.one", "channels": ["#Dev", "#ops"]},
+                {"host": "irc.two", "channels": ["#dev"], "nickname": "listener"},
+            ],
+        }
+        with patch("irc.client.Reactor", FakeReactor):
+            self.listener = IRCListener(config)
+        self.reactor = self.listener.reactor
+        self.one, self.two = self.listener.servers
+
+    def tearDown(self):
+        self.listener.close()
+        shutil.rmtree(self.logdir)
+
+    def read(self, host, channel):
+        date = dt.datetime.now().strftime("%Y-%m-%d")
+        path = os.path.join(self.logdir, "{0}_{1}_{2}.log".format(host, channel, date))
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return f.read()
+
+    def test_joins_channels_on_welcome(self):
+        for server in self.listener.servers:
+            self.listener.connect(server)
+        self.assertEqual("devweb", self.one.connection.nickname)
+        self.assertEqual("listener", self.two.connection.nickname)
+        self.reactor.dispatch("welcome", self.one.connection, source="irc.one", target=None)
+        self.assertEqual(["#dev", "#ops"], self.one.connection.joined)
+        self.assertEqual([], self.two.connection.joined)
+
+    def test_messages_written_to_channel_log(self):
+        for server in self.listener.servers:
+            self.listener.connect(server)
+        self.reactor.dispatch("pubmsg", self.one.connection, source="kevin!k@host",
+                              target="#DEV", arguments=["hello"])
+        self.reactor.dispatch("pubmsg", self.two.connection, source="bob!b@host",
+                              target="#dev", arguments=["other server"])
+        self.reactor.dispatch("pubmsg", self.one.connection, source="kevin!k@host",
+                              target="#unknown", arguments=["ignored"])
+        self.listener.close()
+        self.assertEqual(" kevin: hello\n", self.read("irc.one", "#dev"))
+        self.assertEqual("   bob: other server\n", self.read("irc.two", "#dev"))
+        self.assertEqual(None, self.read("irc.one", "#ops"))
+
+    def test_dirty_sinks_flushed_on_tick(self):
+        self.listener.connect(self.one)
+        sink = self.listener.sinks[("irc.one", "#ops")]
+        self.reactor.dispatch("pubmsg", self.one.connection, source="kevin!k@host",
+                              target="#ops", arguments=["hello"])
+        self.assertEqual(set([sink]), self.listener.dirty)
+        self.assertEqual("", self.read("irc.one", "#ops"))
+        sink.last_flush -= sink.flush_interval
+        self.listener.tick()
+        self.assertEqual(set(), self.listener.dirty)
+        self.assertEqual(" kevin: hello\n", self.read("irc.one", "#ops"))
+
+    def test_reconnect_with_backoff(self):
+        self.reactor.failures = 3
+        self.listener.connect(self.one)
+        delays = [self.reactor.run_delayed() for _ in range(3)]
+        self.assertEqual([[1], [2], [4]], delays)
+        self.assertEqual([], self.reactor.delayed)
+        self.assertEqual(1, len(self.reactor.connections))
+        self.assertEqual(4, self.one.connection.connects)
+        self.reactor.dispatch("welcome", self.one.connection, source="irc.one", target=None)
+        self.assertEqual(None, self.one.backoff)
+
+    def test_reconnect_after_disconnect(self):
+        self.listener.connect(self.one)
+        connection = self.one.connection
+        self.reactor.dispatch("disconnect", connection, source="irc.one", target=None)
+        self.assertEqual([1], self.reactor.run_delayed())
+        self.assertIs(connection, self.one.connection)
+        self.assertEqual(2, connection.connects)
+        self.reactor.dispatch("welcome", connection, source="irc.one", target=None)
+        self.assertEqual(["#dev", "#ops"], connection.joined)
+
+    def test_nickname_in_use(self):
+        self.listener.connect(self.one)
+        self.reactor.dispatch("nicknameinuse", self.one.connection, source="irc.one",
+                              target=None)
+        self.assertEqual("devweb_", self.one.connection.nickname)
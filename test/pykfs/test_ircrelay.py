@@ -0,0 +1,123 @@
+from unittest2 import TestCase
+from mock import patch
+from pykfs.ircrelay import IRCRelay, send_notification
+from pykfs.runtime import UnsafePathError
+from pykfs import runtime
+import tempfile
+import socket
+import shutil
+import json
+import os
+
+
+def notification(sha, user="kevin", branch="master"):
+    return {"channel": "#dev", "repo": "pykfs", "user": user, "branch": branch, "sha": sha,
+            "message": "Commit {0}".format(sha)}
+
+
+class TestIRCRelay(TestCase):
+
+    def setUp(self):
+        self.relay = IRCRelay("irc.example.com", max_lines=4)
+
+    def queue(self, *notifications):
+        for n in notifications:
+            self.relay.pending.setdefault(("#dev", n["repo"], n["branch"]), []).append(n)
+
+    def test_full_lines_within_rate(self):
+        self.queue(notification("abc1234"), notification("def5678", branch="feature"))
+        lines = [line for channel, line in self.relay._take_lines()]
+        self.assertEqual(4, len(lines))
+        self.assertEqual("  Commit abc1234", lines[1])
+        self.assertFalse(self.relay.pending)
+
+    def test_burst_coalesced(self):
+        self.queue(*[notification("sha{0}".format(i), user="user{0}".format(i % 2))
+                     for i in range(10)])
+        lines = self.relay._take_lines()
+        expected = [("#dev", "[pykfs] 10 pushes received from 'user0', 'user1' to branch "
+                             "'master', latest sha 'sha9'")]
+        self.assertEqual(expected, lines)
+
+    def test_push_not_split_over_limit(self):
+        self.queue(notification("abc1234"), notification("def5678", branch="feature"),
+                   notification("0123456", branch="other"))
+        self.relay.pending[("#dev", "pykfs", "master")].append(notification("fff0000"))
+        lines = self.relay._take_lines()
+        self.assertEqual(["[pykfs] 2 pushes received from 'kevin' to branch 'master', latest "
+                          "sha 'fff0000'",
+                          "[pykfs] Push received from 'kevin' to branch 'feature', sha "
+                          "'def5678'",
+                          "  Commit def5678"], [line for channel, line in lines])
+        self.assertEqual([("#dev", "pykfs", "other")], list(self.relay.pending))
+        self.assertEqual(2, len(self.relay._take_lines()))
+        self.assertFalse(self.relay.pending)
+
+    def test_never_more_than_max_lines(self):
+        for max_lines in range(1, 8):
+            self.relay.max_lines = max_lines
+            self.queue(*[notification("sha{0}".format(i), branch="b{0}".format(i % 3))
+                         for i in range(7)])
+            while self.relay.pending:
+                lines = self.relay._take_lines()
+                self.assertTrue(0 < len(lines) <= max_lines)
+
+    def test_bind_refuses_foreign_path(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "relay.sock")
+            with open(path, "w"):
+                pass
+            self.relay.socket_path = path
+            self.assertRaises(UnsafePathError, self.relay._bind)
+            os.chmod(directory, 0o755)
+            self.assertRaises(UnsafePathError, send_notification, {}, socket_path=path)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_notification_round_trip(self):
+        directory = tempfile.mkdtemp()
+        try:
+            self.relay.socket_path = os.path.join(directory, "relay.sock")
+            sock = self.relay._bind()
+            try:
+                send_notification(notification("abc1234"), socket_path=self.relay.socket_path)
+                self.assertEqual(notification("abc1234"),
+                                 json.loads(sock.recv(65536).decode("utf-8")))
+            finally:
+                sock.close()
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestRuntime(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_check_private_dir(self):
+        private = os.path.join(self.directory, "private")
+        runtime.check_private_dir(private, create=True)
+        self.assertEqual(0o700, os.stat(private).st_mode & 0o777)
+        os.chmod(private, 0o770)
+        self.assertRaises(UnsafePathError, runtime.check_private_dir, private)
+        link = os.path.join(self.directory, "link")
+        os.symlink(self.directory, link)
+        self.assertRaises(UnsafePathError, runtime.check_private_dir, link)
+
+    def test_prepare_socket_path_removes_stale_socket(self):
+        path = os.path.join(self.directory, "stale.sock")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(path)
+        sock.close()
+        runtime.prepare_socket_path(path)
+        self.assertFalse(os.path.exists(path))
+
+    def test_runtime_dir(self):
+        with patch.dict(os.environ, {"XDG_RUNTIME_DIR": "/run/user/1000"}):
+            self.assertEqual("/run/user/1000/pykfs/foo.sock", runtime.get_runtime_path("foo.sock"))
+        with patch.dict(os.environ, {"XDG_RUNTIME_DIR": ""}):
+            self.assertTrue(runtime.get_runtime_dir().endswith("pykfs-{0}".format(os.getuid())))
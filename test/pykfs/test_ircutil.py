@@ -0,0 +1,45 @@
+from unittest2 import TestCase
+from pykfs import ircutil
+
+
+class SchedulerReactor(object):
+
+    def __init__(self):
+        self.calls = []
+        self.scheduler = self
+
+    def execute_after(self, delay, func):
+        self.calls.append(("after", delay, func))
+
+    def execute_every(self, period, func):
+        self.calls.append(("every", period, func))
+
+
+class OldReactor(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def execute_delayed(self, delay, func):
+        self.calls.append(("after", delay, func))
+
+    def execute_every(self, period, func):
+        self.calls.append(("every", period, func))
+
+
+class TestIRCUtil(TestCase):
+
+    def test_schedule(self):
+        for reactor in SchedulerReactor(), OldReactor():
+            ircutil.schedule_after(reactor, 3, len)
+            ircutil.schedule_every(reactor, 1.5, min)
+            self.assertEqual([("after", 3, len), ("every", 1.5, min)], reactor.calls)
+
+    def test_next_backoff(self):
+        delays = []
+        backoff = None
+        for _ in range(5):
+            delay, backoff = ircutil.next_backoff(backoff, 1, 6)
+            delays.append(delay)
+        self.assertEqual([1, 2, 4, 6, 6], delays)
+        self.assertEqual((1, 2), ircutil.next_backoff(None, 1, 6))
@@ -0,0 +1,75 @@
+from unittest2 import TestCase
+from pykfs import jsonindex
+import tempfile
+import shutil
+import json
+import os
+
+
+DOCUMENT = {
+    "items": [{"id": i, "meta": {"tags": ["t{0}".format(i)], "name": "n {0}".format(i)}}
+              for i in range(50)],
+    "count": 50,
+    "nested": {"a b": [[1, 2], [3, {"deep": True}]]},
+}
+
+
+class TestJSONIndex(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.directory, "data.json")
+        with open(self.filepath, "w") as f:
+            json.dump(DOCUMENT, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def query(self, path, index=None):
+        tokens = [token for offset, token in jsonindex.query(self.filepath, path, index=index)]
+        return json.loads(b"".join(tokens).decode("utf-8"))
+
+    def assertQueries(self, index=None):
+        self.assertEqual(DOCUMENT, self.query("$", index))
+        self.assertEqual(DOCUMENT["items"][42]["meta"], self.query("$.items[42].meta", index))
+        self.assertEqual("t7", self.query("$.items[7].meta.tags[0]", index))
+        self.assertEqual(DOCUMENT["items"][3:6], self.query("$.items[3:6]", index))
+        self.assertEqual(DOCUMENT["items"][48:], self.query("$.items[48:]", index))
+        self.assertEqual({"deep": True}, self.query('$.nested["a b"][1][1]', index))
+        self.assertEqual(50, self.query("$.count", index))
+        self.assertRaises(KeyError, self.query, "$.missing", index)
+        self.assertRaises(KeyError, self.query, "$.items[50]", index)
+
+    def test_scan_without_index(self):
+        self.assertQueries()
+
+    def test_index(self):
+        for depth in (0, 1, 2, 4):
+            index = jsonindex.JSONIndex(self.filepath)
+            index.build(depth=depth)
+            self.assertQueries(index)
+            index.close()
+
+    def test_negative_index(self):
+        self.assertRaises(jsonindex.JSONIndexError, self.query, "$.items[-1]")
+        index = jsonindex.JSONIndex(self.filepath)
+        index.build(depth=2)
+        self.assertEqual(DOCUMENT["items"][-1], self.query("$.items[-1]", index))
+        index.close()
+
+    def test_index_out_of_date(self):
+        index = jsonindex.JSONIndex(self.filepath)
+        self.assertFalse(index.open())
+        index.build()
+        index.close()
+        self.assertTrue(index.open())
+        index.close()
+        with open(self.filepath, "w") as f:
+            json.dump([], f)
+        self.assertFalse(index.open())
+
+    def test_parse_path(self):
+        self.assertEqual(["items", 3, "a.b", slice(1, None)],
+                         jsonindex.parse_path('$.items[3]["a.b"][1:]'))
+        self.assertRaises(jsonindex.JSONIndexError, jsonindex.parse_path, "items")
+        self.assertRaises(jsonindex.JSONIndexError, jsonindex.parse_path, "$[1:2].a")
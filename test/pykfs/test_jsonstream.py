@@ -0,0 +1,65 @@
+from unittest2 import TestCase
+from pykfs import jsonstream
+import json
+import io
+
+
+class TestJSONStream(TestCase):
+
+    def tokens(self, raw, chunk_size=jsonstream.CHUNK_SIZE):
+        return list(jsonstream.iter_tokens(io.BytesIO(raw), chunk_size=chunk_size))
+
+    def pretty(self, raw, chunk_size=jsonstream.CHUNK_SIZE):
+        output = []
+        jsonstream.pretty_print(jsonstream.iter_tokens(io.BytesIO(raw), chunk_size=chunk_size),
+                                output.append)
+        return b"".join(output).decode("utf-8")
+
+    def test_tokens(self):
+        self.assertEqual(
+            [(0, b"{"), (2, b'"a\\"b"'), (9, b":"), (11, b"-1.5e3"), (17, b","),
+             (18, b'"c"'), (21, b":"), (22, b"["), (23, b"true"), (27, b","), (28, b"null"),
+             (32, b"]"), (34, b"}")],
+            self.tokens(b'{ "a\\"b" : -1.5e3,"c":[true,null] }\n', chunk_size=3)
+        )
+
+    def test_pretty_print_matches_json_dumps(self):
+        obj = {"a": [1, 2, {"b": None, "c": []}], "d": {}, "e": "xéy", "f": [[]]}
+        raw = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        expected = json.dumps(obj, indent=4, ensure_ascii=False) + "\n"
+        for chunk_size in (1, 5, jsonstream.CHUNK_SIZE):
+            self.assertEqual(expected, self.pretty(raw, chunk_size))
+
+    def test_invalid(self):
+        self.assertRaises(jsonstream.JSONStreamError, self.pretty, b'{"a": 1]')
+        self.assertRaises(jsonstream.JSONStreamError, self.pretty, b'[1, 2')
+        self.assertRaises(jsonstream.JSONStreamError, self.pretty, b'["unterminated')
+        self.assertRaises(jsonstream.JSONStreamError, self.pretty, b'[1, @]')
+
+    def test_invalid_byte_raised_early(self):
+        reads = []
+
+        class Stream(io.BytesIO):
+            def read(self, size=-1):
+                data = io.BytesIO.read(self, size)
+                reads.append(len(data))
+                return data
+
+        raw = b'[1, "a", @' + b', "padding"' * 1000000 + b"]"
+        tokens = jsonstream.iter_tokens(Stream(raw), chunk_size=1024)
+        with self.assertRaisesRegex(jsonstream.JSONStreamError, "at byte 9$"):
+            list(tokens)
+        self.assertLess(sum(reads), 4096)
+
+    def test_partial_tokens_across_chunks(self):
+        raw = b'[true, false, null, -12, "long string"]'
+        expected = self.tokens(raw)
+        for chunk_size in range(1, 8):
+            self.assertEqual(expected, self.tokens(raw, chunk_size=chunk_size))
+        self.assertRaises(jsonstream.JSONStreamError, self.tokens, b"[trux]", chunk_size=2)
+        self.assertRaises(jsonstream.JSONStreamError, self.tokens, b"[-x]", chunk_size=2)
+
+    def test_max_token_size(self):
+        raw = b'["' + b"x" * 5000
+        with self.assertRaisesRegex(jsonstream.JSONStreamError, "longer than 1000 bytes"):
+            list(jsonstream.iter_tokens(io.BytesIO(raw), chunk_size=100, max_token_size=1000))
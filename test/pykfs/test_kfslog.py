@@ -0,0 +1,211 @@
+from unittest2 import TestCase
+from pykfs.kfslog import QueuedHandler, JSONFormatter, KFSFormatter, CachingKFSFormatter, \
+    DEFAULT_HANDLERS, CONSOLE_FORMATTER
+from pykfs import kfslog
+import logging.handlers
+import threading
+import tempfile
+import logging
+import shutil
+import json
+import sys
+import os
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class TestQueuedHandler(TestCase):
+
+    def get_logger(self, handler):
+        logger = logging.getLogger("test_kfslog.{0}".format(id(handler)))
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(handler)
+        return logger
+
+    def test_records_written_in_order(self):
+        target = ListHandler()
+        handler = QueuedHandler([target])
+        logger = self.get_logger(handler)
+        for i in range(100):
+            logger.info("message %d", i)
+        handler.close()
+        self.assertEqual(["message {0}".format(i) for i in range(100)], target.messages)
+        self.assertEqual(0, handler.dropped)
+
+    def test_drop_newest(self):
+        target = ListHandler()
+        handler = QueuedHandler([target], maxsize=2, policy="drop_newest")
+        with handler.condition:
+            handler.records.extend([None, None])
+            handler.emit(logging.makeLogRecord({"msg": "dropped"}))
+            handler.records.clear()
+        handler.close()
+        self.assertEqual(1, handler.dropped)
+        self.assertEqual([], target.messages)
+
+    def test_rotating_file_handler_rolls_over(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "test.log")
+            target = logging.handlers.RotatingFileHandler(path, maxBytes=200, backupCount=2)
+            handler = QueuedHandler([target])
+            logger = self.get_logger(handler)
+            for i in range(40):
+                logger.info("message %d", i)
+            handler.close()
+            target.close()
+            self.assertTrue(os.path.exists(path + ".1"))
+            self.assertTrue(os.path.exists(path + ".2"))
+            self.assertLessEqual(os.path.getsize(path), 200)
+            with open(path) as f:
+                self.assertEqual("message 39\n", f.read().splitlines(True)[-1])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_block_with_dead_writer(self):
+        target = ListHandler()
+        handler = QueuedHandler([target], maxsize=1)
+        handler.close()
+        # Reopen the queue as if the writer thread had died with the queue full
+        handler.closed = False
+        handler.records.append(logging.makeLogRecord({"msg": "stuck"}))
+        emitter = threading.Thread(target=handler.emit,
+                                   args=(logging.makeLogRecord({"msg": "written"}),))
+        emitter.start()
+        emitter.join(10)
+        self.assertFalse(emitter.is_alive())
+        self.assertEqual(["written"], target.messages)
+
+    def test_invalid_policy(self):
+        self.assertRaises(ValueError, QueuedHandler, [], policy="foo")
+
+    def test_invalid_maxsize(self):
+        self.assertRaises(ValueError, QueuedHandler, [], maxsize=0)
+
+    def test_records_prepared_when_logged(self):
+        target = logging.StreamHandler(StringIO())
+        target.setFormatter(KFSFormatter("{levelname} {message}"))
+        handler = QueuedHandler([target])
+        logger = self.get_logger(handler)
+        items = ["a"]
+        with handler.condition:
+            # Hold the writer back until after the arguments change
+            logger.info("items %s", items)
+            items.append("b")
+            try:
+                raise ValueError("broken")
+            except ValueError:
+                logger.exception("failed")
+            record = handler.records[-1]
+        handler.close()
+        self.assertEqual(None, record.args)
+        self.assertEqual(None, record.exc_info)
+        lines = target.stream.getvalue().splitlines()
+        self.assertEqual("INFO items ['a']", lines[0])
+        self.assertEqual("ERROR failed", lines[1])
+        self.assertEqual(">>> Traceback (most recent call last):", lines[2])
+        self.assertEqual(">>> ValueError: broken", lines[-1])
+
+
+class TestCachingKFSFormatter(TestCase):
+
+    formats = [
+        (None, None),
+        (CONSOLE_FORMATTER["fmt"], None),
+        ("{asctime} | {name} | {message}", "%d %H:%M:%S.%f %%f"),
+        ("{asctime} {levelname}: {message}", "%H:%M"),
+    ]
+
+    def make_records(self):
+        times = [1425700000.999998, 1425700000.999999, 1425700001.0, 1425700001.000001,
+                 1425700001.5, 1425700000.25, 1425700061.000002, 1425700061.000002]
+        levels = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+        records = []
+        for i, created in enumerate(times):
+            records.append(logging.makeLogRecord({
+                "name": "pykfs.test{0}".format(i % 3), "levelname": levels[i % len(levels)],
+                "msg": "record %d of %s", "args": (i, "records"), "created": created,
+            }))
+        try:
+            raise ValueError("broken")
+        except ValueError:
+            records.append(logging.makeLogRecord({
+                "name": "pykfs.test", "levelname": "ERROR", "msg": "failed %s",
+                "args": ("badly",), "created": 1425700001.75, "exc_info": sys.exc_info(),
+            }))
+        return records
+
+    def test_identical_output(self):
+        records = self.make_records()
+        for fmt, datefmt in self.formats:
+            for color in False, True:
+                plain = KFSFormatter(fmt, datefmt, color=color)
+                caching = CachingKFSFormatter(fmt, datefmt, color=color)
+                for record in records:
+                    self.assertEqual(plain.format(record), caching.format(record))
+
+    def test_identical_output_across_threads(self):
+        records = self.make_records()[:-1] * 500
+        plain = KFSFormatter(CONSOLE_FORMATTER["fmt"], color=True)
+        expected = [plain.format(record) for record in records]
+        caching = CachingKFSFormatter(CONSOLE_FORMATTER["fmt"], color=True)
+        mismatches = []
+
+        def run(offset):
+            for i in range(offset, len(records), 4):
+                if caching.format(records[i]) != expected[i]:
+                    mismatches.append(i)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        # Switch threads often enough for records to interleave inside format
+        if hasattr(sys, "setswitchinterval"):
+            interval = sys.getswitchinterval()
+            sys.setswitchinterval(1e-6)
+        else:
+            interval = sys.getcheckinterval()
+            sys.setcheckinterval(1)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            if hasattr(sys, "setswitchinterval"):
+                sys.setswitchinterval(interval)
+            else:
+                sys.setcheckinterval(interval)
+        self.assertEqual([], mismatches)
+
+
+class TestJSONFormatter(TestCase):
+
+    def test_format(self):
+        record = logging.makeLogRecord({
+            "name": "foo", "levelname": "INFO", "msg": "hello %s", "args": ("world",),
+            "created": 1425700000.5, "repo": "pykfs",
+        })
+        actual = json.loads(JSONFormatter().format(record))
+        expected = {
+            "timestamp": 1425700000.5, "logger": "foo", "level": "INFO",
+            "message": "hello world", "repo": "pykfs",
+        }
+        self.assertEqual(expected, actual)
+
+    def test_set_handler_formatters(self):
+        handlers = kfslog._set_handler_formatters(DEFAULT_HANDLERS, {"console": "json"})
+        self.assertEqual("json", handlers["console"]["formatter"])
+        self.assertEqual("console", DEFAULT_HANDLERS["console"]["formatter"])
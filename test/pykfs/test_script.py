@@ -42,6 +42,14 @@ class SampleScript(script.Script):
         self.results["arg3"] = self.arg3
 
 
+class RequiresScript(SampleScript):
+    """ A sample script with an option that needs another """
+    conflicts = []
+    requires = [
+        ("arg3", "arg2")
+    ]
+
+
 class TestScript(TestCase):
 
     def setUp(self):
@@ -75,5 +83,82 @@ class TestScript(TestCase):
         command = SampleScript(self.results)
         self.assertRaises(ErrorEncountered, command.run, ("-a", "-b"))
 
+    def test_requires(self):
+        self.assertRaises(ErrorEncountered, RequiresScript(self.results).run, ["-c", "hello"])
+        self.assertRaises(
+            ErrorEncountered, RequiresScript(self.results).run, [], settings={"arg3": "hello"}
+        )
+        RequiresScript(self.results).run(["-b", "-c", "hello"])
+        self.assertEqual("hello", self.results["arg3"])
+        RequiresScript(self.results).run(["-c", "hello"], settings={"arg2": True})
+        self.assertEqual(True, self.results["arg2"])
+        RequiresScript(self.results).run([])
+        self.assertEqual("barbar", self.results["arg3"])
+
+
+
+
+    def test_profile(self):
+        command = SampleScript(self.results)
+        command.stderr = lambda value: self.results.setdefault("stderr", value)
+        command.setup_logging = lambda: None
+        command.run(["--profile"])
+        phases = [phase[0] for phase in command.phase_times]
+        self.assertEqual(
+            ["parse_args", "load_settings", "determine_arg_values", "setup_logging", "do_script"],
+            phases
+        )
+        self.assertIn("do_script", self.results["stderr"])
+
+    def test_parse_batch_line(self):
+        self.assertEqual(["-c", "hello world"], script.parse_batch_line("-c 'hello world'\n"))
+        self.assertEqual(["-c", "hello world"], script.parse_batch_line('["-c", "hello world"]'))
+
+    def test_run_batch(self):
+        statuses = BatchScript.run_batch([["-c", "one"], ["-c", "fail"], ["-x"]])
+        self.assertEqual([0, 1, 2], statuses)
+        self.assertEqual(["one", "fail"], BatchScript.runs)
+
+    def test_run_batch_settings_per_entry(self):
+        settings = {"arg2": "setting"}
+        statuses = ConflictBatchScript.run_batch([["-a"], [], ["-b"], []], settings=settings)
+        self.assertEqual([0, 0, 0, 0], statuses)
+        expected = [(True, None), (None, "setting"), (None, True), (None, "setting")]
+        self.assertEqual(expected, ConflictBatchScript.runs)
+        self.assertEqual({"arg2": "setting"}, settings)
+
+
+class BatchScript(script.Script):
+    """ A sample script for batch testing """
+    args = [
+        {"name": "arg3", "option_strings": ['-c', '-arg3'], "action": "store"},
+    ]
+    use_settings_file = False
+    runs = []
 
+    def setup_logging(self):
+        pass
 
+    def do_script(self):
+        self.runs.append(self.arg3)
+        if self.arg3 == "fail":
+            raise ValueError("failed")
+
+
+class ConflictBatchScript(script.Script):
+    """ A sample script for batch testing with conflicting options """
+    args = [
+        {"name": "arg1", "option_strings": ['-a'], "const": True, "action": "store_const"},
+        {"name": "arg2", "option_strings": ['-b'], "const": True, "action": "store_const"},
+    ]
+    conflicts = [
+        ("arg1", "arg2")
+    ]
+    use_settings_file = False
+    runs = []
+
+    def setup_logging(self):
+        pass
+
+    def do_script(self):
+        self.runs.append((self.arg1, self.arg2))
@@ -0,0 +1,91 @@
+from unittest2 import TestCase
+from pykfs import search
+import subprocess
+import tempfile
+import shutil
+import os
+
+
+class TestSearch(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.write("a.txt", b"one\nfoo two\nthree\nfoo foo four")
+        self.write("b/c.txt", b"nothing here\n")
+        self.write("b/d.txt", b"\nfoo\n")
+        self.write("image.bin", b"foo\0bar")
+        self.write("empty.txt", b"")
+        self.write("build/out.txt", b"foo\n")
+        self.write(".gitignore", b"build/\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, path, content):
+        path = os.path.join(self.root, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(content)
+
+    def search(self, pattern, **kwargs):
+        return list(search.search(pattern, root=self.root, **kwargs))
+
+    def test_scan(self):
+        pattern = search.compile_pattern("fo+")
+        self.assertEqual([(2, b"foo two"), (4, b"foo foo four")],
+                         search.scan(b"one\nfoo two\nthree\nfoo foo four", pattern))
+
+    def test_scan_empty_matches(self):
+        data = b"ab\ncd\n"
+        lines = [(1, b"ab"), (2, b"cd")]
+        for pattern in "x*", "^", "$", "a?":
+            self.assertEqual(lines, search.scan(data, search.compile_pattern(pattern)))
+        pattern = search.compile_pattern("x*")
+        self.assertEqual([(1, b"ab"), (2, b"")], search.scan(b"ab\n\n", pattern))
+        self.assertEqual([(1, b"ab"), (2, b"cd")], search.scan(b"ab\ncd", pattern))
+        self.assertEqual([(1, b"")], search.scan(b"\n", pattern))
+
+    def test_search_merge_conflict(self):
+        def git(*args):
+            subprocess.check_call(["git", "-c", "user.name=Foo", "-c", "user.email=foo@bar"] +
+                                  list(args), cwd=self.root, stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE)
+
+        git("init", "-q")
+        git("checkout", "-q", "-b", "main")
+        git("add", "a.txt")
+        git("commit", "-q", "-m", "First")
+        git("checkout", "-q", "-b", "other")
+        self.write("a.txt", b"foo other\n")
+        git("commit", "-q", "-am", "Other")
+        git("checkout", "-q", "main")
+        self.write("a.txt", b"foo main\n")
+        git("commit", "-q", "-am", "Main")
+        self.assertRaises(subprocess.CalledProcessError, git, "merge", "other")
+        self.assertEqual(1, search.list_git_files(self.root).count("a.txt"))
+        matches = [match for match in self.search("foo", processes=1) if match[0] == "a.txt"]
+        self.assertEqual(["foo main", "foo other"],
+                         sorted(line.decode("ascii") for _, _, line in matches))
+
+    def test_search_without_git(self):
+        expected = [
+            ("a.txt", 2, b"foo two"), ("a.txt", 4, b"foo foo four"),
+            ("b/d.txt", 2, b"foo"), ("build/out.txt", 1, b"foo"),
+        ]
+        self.assertEqual(expected, self.search("foo", processes=1, use_git=False))
+        self.assertEqual(expected, self.search("foo", processes=2, use_git=False))
+
+    def test_search_skips_git_ignored(self):
+        subprocess.check_call(["git", "init", "-q", self.root])
+        self.assertEqual(
+            [("a.txt", 2, b"foo two"), ("a.txt", 4, b"foo foo four"), ("b/d.txt", 2, b"foo")],
+            sorted(self.search("foo", processes=1))
+        )
+
+    def test_ignore_case(self):
+        self.assertEqual([("b/c.txt", 1, b"nothing here")],
+                         self.search("NOTHING", processes=1, ignore_case=True))
+
+    def test_format_match(self):
+        self.assertEqual(b"a.txt:2:foo two\n", search.format_match("a.txt", 2, b"foo two"))
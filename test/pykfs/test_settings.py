@@ -0,0 +1,83 @@
+from unittest2 import TestCase
+from mock import patch
+from pykfs import settings
+import tempfile
+import datetime as dt
+import shutil
+import json
+import os
+
+
+RC = """
+scripts:
+  newpydist:
+    author_name: [Kevin, Steffler]
+  view_json:
+    filepath: foo.json
+  release:
+    since: 2015-03-07
+    ports: {1: one}
+"""
+
+
+class TestSettings(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings_file = os.path.join(self.directory, "pykfsrc")
+        self.write(RC)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, value):
+        with open(self.settings_file, "w") as f:
+            f.write(value)
+
+    def get(self, script_name):
+        return settings.get_script_settings(script_name, settings_file=self.settings_file)
+
+    def test_get_script_settings(self):
+        self.assertEqual({"author_name": ["Kevin", "Steffler"]}, self.get("newpydist"))
+        self.assertEqual({}, self.get("grebase"))
+        self.assertTrue(os.path.exists(settings.get_cache_file_path(self.settings_file)))
+
+    def test_cache_used(self):
+        self.get("newpydist")
+        with patch("pykfs.settings.get_settings_dict") as get_settings_dict:
+            self.assertEqual({"filepath": "foo.json"}, self.get("view_json"))
+            self.assertEqual(0, get_settings_dict.call_count)
+
+    def test_cache_invalidated(self):
+        self.assertEqual({"filepath": "foo.json"}, self.get("view_json"))
+        self.write(RC.replace("foo.json", "barbar.json"))
+        self.assertEqual({"filepath": "barbar.json"}, self.get("view_json"))
+
+    def test_missing_settings_file(self):
+        os.remove(self.settings_file)
+        self.assertEqual({}, self.get("view_json"))
+
+    def test_cache_is_json(self):
+        self.get("view_json")
+        cache_file = settings.get_cache_file_path(self.settings_file)
+        self.assertEqual(0o600, os.stat(cache_file).st_mode & 0o777)
+        with open(cache_file) as f:
+            cache = json.load(f)
+        self.assertEqual(None, cache["scripts"]["release"])
+
+    def test_sections_json_cannot_hold(self):
+        expected = {"since": dt.date(2015, 3, 7), "ports": {1: "one"}}
+        self.assertEqual(expected, self.get("release"))
+        self.assertEqual(expected, self.get("release"))
+
+    def test_writable_cache_ignored(self):
+        self.get("view_json")
+        cache_file = settings.get_cache_file_path(self.settings_file)
+        with open(cache_file) as f:
+            cache = json.load(f)
+        cache["scripts"]["view_json"] = json.dumps({"filepath": "evil.json"})
+        with open(cache_file, "w") as f:
+            json.dump(cache, f)
+        os.chmod(cache_file, 0o666)
+        self.assertEqual({"filepath": "foo.json"}, self.get("view_json"))
+        self.assertEqual(0o600, os.stat(cache_file).st_mode & 0o777)
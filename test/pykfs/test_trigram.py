@@ -0,0 +1,113 @@
+from unittest2 import TestCase
+from pykfs import trigram
+import subprocess
+import tempfile
+import shutil
+import time
+import os
+
+
+class TestRequiredLiterals(TestCase):
+
+    def test_literals(self):
+        self.assertEqual([b"foo"], trigram.required_literals(b"foo"))
+        self.assertEqual([b"foo", b"bar"], trigram.required_literals(b"foo.*bar"))
+        self.assertEqual([b"abcd", b"cd"], trigram.required_literals(b"ab(cd)+e?"))
+        self.assertEqual([b"hel", b"lo"], trigram.required_literals(b"hel+o"))
+        self.assertEqual([b"x", b"yz"], trigram.required_literals(b"x(a*yz)+"))
+        self.assertEqual([b"def ", b"_x"], trigram.required_literals(b"def [a-z]+_x"))
+        self.assertEqual([b"x"], trigram.required_literals(b"(a|b)*x"))
+        self.assertEqual([b"abc"], trigram.required_literals(b"(?i)ABC"))
+
+    def test_trigrams(self):
+        self.assertEqual(set([0x616263, 0x626364]), trigram.get_trigrams(b"aBcd"))
+        self.assertEqual(set(), trigram.required_trigrams(b"ab.cd"))
+
+
+class TestTrigramIndex(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.write("a.txt", b"hello world\n")
+        self.write("b.txt", b"goodbye world\n")
+        self.write("c.bin", b"hello\0world")
+        self.index = trigram.TrigramIndex(self.root, use_git=False)
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.root)
+
+    def write(self, path, content, mtime=None):
+        path = os.path.join(self.root, path)
+        with open(path, "wb") as f:
+            f.write(content)
+        if mtime:
+            os.utime(path, (mtime, mtime))
+
+    def candidates(self, pattern):
+        return self.index.candidates(trigram.search.compile_pattern(pattern))
+
+    def test_candidates(self):
+        self.assertEqual(3, self.index.update())
+        self.assertEqual(["a.txt"], self.candidates("hel+o"))
+        self.assertEqual(["a.txt", "b.txt"], self.candidates("WORLD"))
+        self.assertEqual(["a.txt", "b.txt", "c.bin"], self.candidates("w.r"))
+        self.assertEqual([], self.candidates("missing"))
+
+    def test_incremental_update(self):
+        self.index.update()
+        self.assertEqual(0, self.index.update())
+        self.write("b.txt", b"hello again\n", mtime=time.time() + 10)
+        os.remove(os.path.join(self.root, "a.txt"))
+        self.assertEqual(1, self.index.update())
+        self.assertEqual(["b.txt"], self.candidates("hello"))
+
+    def test_search_indexed(self):
+        path = os.path.join(self.root, "index.sqlite")
+        matches = list(trigram.search_indexed("world", root=self.root, index_path=path,
+                                              use_git=False, processes=1))
+        self.assertEqual([("a.txt", 1, b"hello world"), ("b.txt", 1, b"goodbye world")], matches)
+
+
+class TestTrigramIndexRepository(TestCase):
+
+    def setUp(self):
+        self.root = os.path.realpath(tempfile.mkdtemp())
+        subprocess.check_call(["git", "init", "-q", self.root])
+        # The same name, size and modification time but different content in each directory
+        for directory, content in ("", b"alpha\n"), ("sub", b"omega\n"):
+            path = os.path.join(self.root, directory, "foo.py")
+            if directory:
+                os.mkdir(os.path.dirname(path))
+            with open(path, "wb") as f:
+                f.write(content)
+            os.utime(path, (1425700000, 1425700000))
+        subprocess.check_call(["git", "add", "."], cwd=self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def search(self, pattern, directory=""):
+        return list(trigram.search_indexed(pattern, root=os.path.join(self.root, directory),
+                                           processes=1))
+
+    def test_search_from_subdirectories(self):
+        self.assertEqual([("foo.py", 1, b"omega")], self.search("omega", "sub"))
+        self.assertEqual([("foo.py", 1, b"alpha")], self.search("alpha"))
+        self.assertEqual([], self.search("alpha", "sub"))
+        self.assertEqual([("sub/foo.py", 1, b"omega")], self.search("omega"))
+
+    def test_shared_index_not_rebuilt(self):
+        top = trigram.TrigramIndex(self.root)
+        sub = trigram.TrigramIndex(os.path.join(self.root, "sub"))
+        try:
+            self.assertEqual(1, sub.update())
+            self.assertEqual(1, top.update())
+            self.assertEqual(0, sub.update())
+            self.assertEqual(0, top.update())
+            pattern = trigram.search.compile_pattern("omega")
+            self.assertEqual(["sub/foo.py"], top.candidates(pattern))
+            self.assertEqual(["foo.py"], sub.candidates(pattern))
+        finally:
+            top.close()
+            sub.close()